@@ -1,9 +1,14 @@
+import glob
+import gzip
 import json 
 import os
-import glob
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime as dt
+import memento_table
+from timemap_corpus import get_timemap_corpus
+from url_cache import URLResolutionCache
 
 """
 This script calculates statistics about the timemap JSON files collected from the extracted URIs.
@@ -38,6 +43,19 @@ def load_json(file):
         uri_info = json.loads(file_content)
     return uri_info
 
+def load_memento_table(rebuild=False):
+    """
+    Loads the columnar memento table of the 'timemaps' folder (see memento_table.py), building it on first use and 
+    again whenever the timemaps change.
+
+    Argument(s):
+    - rebuild: Boolean, if True the table is rebuilt from the timemaps even if they did not change.
+
+    Output:
+    Returns a MementoTable whose columns (uri_id, datetime, archive_id, rel) are memory-mapped NumPy arrays.
+    """
+    return memento_table.load_memento_table(timemaps_folder='timemaps', table_folder='memento_table', rebuild=rebuild)
+
 def get_memento_counts():
     """
     Collects the number of mementos for every timemap file stored in the 'timemaps' folder. 
@@ -45,22 +63,55 @@ def get_memento_counts():
     Output:
     Returns a list of integers representing the memento counts.
     """
-    # Fetch all files stored in 'timemaps' directory
-    tm_files = sorted(glob.glob(os.path.join('timemaps', 'uri*.json')), key=extract_uri_number)
-    memento_counts = []
-    for i, tm_file in enumerate(tm_files):
-        try:
-            with open(tm_file, "r") as file:
-                uri_info = load_json(file)
-                # Fetch the number of mementos collected for a URI
-                if 'mementos' in uri_info:
-                    memento_counts.append(len(uri_info['mementos']['list']))
-                else:
-                    memento_counts.append(0)
-        # Error handling
-        except Exception as e:
-            print(f"Error processing {tm_file}: {e}")
-    return memento_counts
+    # Timemaps are parsed once and shared by all analysis functions until the 'timemaps' directory changes
+    return list(get_timemap_corpus('timemaps').memento_counts)
+
+_analysis_time = None
+
+def set_analysis_time(now=None):
+    """
+    Sets the reference time that URI ages are calculated against for the rest of the analysis run, so every age in 
+    a run is relative to the same moment. Call it at the start of a new run.
+
+    Argument(s):
+    - now: datetime representing the reference time. Defaults to the current time.
+    """
+    global _analysis_time
+    _analysis_time = dt.now() if now is None else now
+
+def get_analysis_time():
+    """
+    Returns the reference time of the current analysis run, set to the current time on first use.
+    """
+    if _analysis_time is None:
+        set_analysis_time()
+    return _analysis_time
+
+def parse_memento_datetimes(mementos):
+    """
+    Converts memento datetime strings (e.g. '2020-04-09T12:13:57Z') to datetime64 values in one pass.
+
+    Argument(s):
+    - mementos: List of strings representing memento datetimes. None values become NaT.
+
+    Output:
+    Returns a pandas datetime array.
+    """
+    return pd.to_datetime(pd.Series(mementos, dtype=object), format="%Y-%m-%dT%H:%M:%SZ").array
+
+def get_ages_in_days(earliest_mementos):
+    """
+    Calculates the age in whole days of each URI from its earliest memento, relative to get_analysis_time().
+
+    Argument(s):
+    - earliest_mementos: List of strings representing earliest memento datetimes (None for URIs without mementos).
+
+    Output:
+    Returns a pandas nullable integer array of ages, with <NA> for URIs without mementos.
+    """
+    earliest = parse_memento_datetimes(earliest_mementos)
+    ages = (pd.Timestamp(get_analysis_time()) - earliest) // pd.Timedelta(days=1)
+    return pd.array(ages, dtype='Int64')
 
 def get_age(earliest_memento):
     """
@@ -76,7 +127,7 @@ def get_age(earliest_memento):
     # Convert to a datetime object
     date_object = dt.strptime(earliest_memento, date_format)
     # Calculate URI age in days
-    age = (dt.now()-date_object).days
+    age = (get_analysis_time()-date_object).days
     return age
 
 def get_uri_ages():
@@ -87,25 +138,10 @@ def get_uri_ages():
     - Returns a list of integers representing the ages of URIs. If a URI has 0 mementos, it is represented as None. 
     - Returns a list of strings representing the earilest mementos for each URI.
     """
-    # 
-    tm_files = sorted(glob.glob(os.path.join('timemaps', 'uri*.json')), key=extract_uri_number)
-    uri_ages = []
-    earliest_mementos = []
-    for tm_file in tm_files:
-        try:
-            with open(tm_file, "r") as file:
-                uri_info = load_json(file)
-                if 'mementos' not in uri_info:
-                    uri_ages.append(None)
-                    earliest_mementos.append(None)
-                else:
-                    earliest_memento = uri_info['mementos']['first']['datetime']
-                    earliest_mementos.append(earliest_memento)
-                    uri_age = get_age(earliest_memento)
-                    uri_ages.append(uri_age)
-        except:
-            print(tm_file)
-    return uri_ages, earliest_mementos
+    earliest_mementos = list(get_timemap_corpus('timemaps').earliest_mementos)
+    uri_ages = get_ages_in_days(earliest_mementos).astype(object)
+    uri_ages[pd.isna(uri_ages)] = None
+    return list(uri_ages), earliest_mementos
 
 def get_links_list():
     """
@@ -125,24 +161,16 @@ def get_oldest_memento():
     Output:
     Returns string representing oldest URI and string representing date of the URI's first memento.
     """
-    uri_ages, earliest_mementos = get_uri_ages()
+    corpus = get_timemap_corpus('timemaps')
     uris = get_links_list()
-    uri_dates = []
-    for uri, em in zip(uris, earliest_mementos):
-        if em is None:
-            continue
-        date_format = "%Y-%m-%dT%H:%M:%SZ" 
-        # Convert to a datetime object
-        date_object = dt.strptime(em, date_format)
-        # Calculate URI age in days
-        uri_dates.append((uri, date_object))
-
-    sorted_uri_dates = sorted(uri_dates, key=lambda x: x[1])
+    earliest = pd.Series(parse_memento_datetimes(corpus.earliest_mementos))
+    # Position of the earliest first memento, skipping URIs without mementos
+    oldest = earliest.idxmin()
 
     # Format final date
-    final_date = sorted_uri_dates[0][1].strftime("%B %d, %Y")
+    final_date = earliest[oldest].strftime("%B %d, %Y")
 
-    return sorted_uri_dates[0][0], final_date
+    return uris[corpus.uri_numbers[oldest]-1], final_date
 
 def get_distribution_table():
     """
@@ -201,15 +229,14 @@ def get_results():
     Output:
     Returns a dataframe containing all features calculated for timemaps and URIs.
     """
-    memento_counts = get_memento_counts()
-    uri_ages, ems = get_uri_ages()
-    # Fetch list of links to map to memento count and URI age properties
-    links = get_links_list()
-    df = pd.DataFrame(columns=['URI','Number of Mementos','Age in Days'])
-    # for i in range(len(links)):
-    for i in range(len(links)):
-        new_row = {'URI':links[i],'Number of Mementos':memento_counts[i],'Age in Days':uri_ages[i]}
-        df.loc[len(df)] = new_row
+    corpus = get_timemap_corpus('timemaps')
+    # Fetch list of links to map to memento count and URI age properties; URI n is line n of tweet_links.txt
+    links = np.array(get_links_list(), dtype=object)
+    df = pd.DataFrame({
+        'URI': links[np.array(corpus.uri_numbers, dtype=np.int64) - 1],
+        'Number of Mementos': np.array(corpus.memento_counts, dtype=np.int64),
+        'Age in Days': get_ages_in_days(corpus.earliest_mementos)
+    })
     return df
 
 def get_age_results():
@@ -233,6 +260,146 @@ def get_memento_results():
     df = get_results()
     return df[['URI','Number of Mementos']].sort_values(by='Number of Mementos',ascending=False)
 
+def get_archive_results():
+    """
+    Generates a dataframe that summarizes each web archive holding mementos of the URIs, sorted in descending order 
+    by the number of mementos. Computed in one vectorized pass over the memento table.
+
+    Output:
+    Returns a dataframe with the archive host, its number of mementos, its first and last memento, the number of 
+    URIs it holds at least one memento of, and that number as a share of all URIs.
+    """
+    table = load_memento_table()
+    summary = table.archive_summary()
+    df = pd.DataFrame({
+        'Archive': table.archives,
+        'Number of Mementos': summary['memento_count'],
+        'First Memento': summary['first_memento'],
+        'Last Memento': summary['last_memento'],
+        'Number of URIs': summary['uri_count'],
+        'Share of URIs': summary['uri_share']
+    })
+    return df.sort_values(by='Number of Mementos', ascending=False, ignore_index=True)
+
+def get_uri_archive_results():
+    """
+    Generates a dataframe with the number of mementos of each URI in each web archive.
+
+    Output:
+    Returns a dataframe with one row per URI (indexed by URI) and one column per archive host.
+    """
+    table = load_memento_table()
+    links = np.array(get_links_list(), dtype=object)
+    return pd.DataFrame(table.uri_archive_counts(), index=pd.Index(links[table.uri_number - 1], name='URI'),
+                        columns=table.archives)
+
+def get_capture_histogram(unit='Y'):
+    """
+    Generates a dataframe with the number of captures in each year or month, over all URIs.
+
+    Argument(s):
+    - unit: 'Y' for years or 'M' for months.
+
+    Output:
+    Returns a dataframe with the period, the number of mementos captured in it and the number of URIs with at least
+    one memento captured in it, for every period from the first to the last capture.
+    """
+    periods, memento_counts, uri_counts = load_memento_table().capture_histogram(unit)
+    return pd.DataFrame({
+        'Period': periods,
+        'Number of Mementos': memento_counts,
+        'Number of URIs': uri_counts
+    })
+
+def get_uri_capture_histogram(unit='Y'):
+    """
+    Generates a dataframe with the number of captures of each URI in each year or month.
+
+    Argument(s):
+    - unit: 'Y' for years or 'M' for months.
+
+    Output:
+    Returns a dataframe with one row per URI and period with at least one capture.
+    """
+    table = load_memento_table()
+    uri_positions, periods, counts = table.uri_capture_histogram(unit)
+    links = np.array(get_links_list(), dtype=object)
+    return pd.DataFrame({
+        'URI': links[table.uri_number[uri_positions] - 1],
+        'Period': periods,
+        'Number of Mementos': counts
+    })
+
+def get_capture_gaps():
+    """
+    Generates a dataframe with the mean and largest time between consecutive captures of each URI, in days. URIs
+    with fewer than two mementos have no gaps (NaN).
+
+    Output:
+    Returns a dataframe containing the URI, its number of mementos, and its mean and largest capture gap.
+    """
+    table = load_memento_table()
+    mean_gaps, max_gaps = table.capture_gaps()
+    links = np.array(get_links_list(), dtype=object)
+    seconds_per_day = 24 * 60 * 60
+    return pd.DataFrame({
+        'URI': links[table.uri_number - 1],
+        'Number of Mementos': table.memento_counts(),
+        'Mean Gap in Days': mean_gaps / seconds_per_day,
+        'Max Gap in Days': max_gaps / seconds_per_day
+    })
+
+def get_tweet_times():
+    """
+    Finds when each URI in tweet_links.txt was first tweeted, from the tweets in the 'scraped_tweets' folder. A
+    tweet matches a URI through its expanded URL or, if url_cache.sqlite exists, the final URI it resolved to.
+
+    Output:
+    Returns a datetime64[s] array aligned with the lines of tweet_links.txt, with NaT for URIs without a matching
+    tweet.
+    """
+    first_tweeted = {}
+    for filename in glob.glob(os.path.join('scraped_tweets', 'scraped_tweets*.json.gz')):
+        with gzip.open(filename, 'rt') as infile:
+            for line in infile:
+                try:
+                    tweet = json.loads(line)
+                    link = tweet['entities']['urls'][0]['expanded_url']
+                    created_at = tweet['created_at']
+                except (ValueError, KeyError, IndexError):
+                    continue
+                if link not in first_tweeted or created_at < first_tweeted[link]:
+                    first_tweeted[link] = created_at
+
+    if os.path.exists('url_cache.sqlite'):
+        cache = URLResolutionCache('url_cache.sqlite')
+        for link, (final_link, status) in cache.get_many(list(first_tweeted), count_stats=False).items():
+            if status == 200 and (final_link not in first_tweeted or first_tweeted[link] < first_tweeted[final_link]):
+                first_tweeted[final_link] = first_tweeted[link]
+        cache.close()
+
+    created_at = pd.to_datetime(pd.Series([first_tweeted.get(link) for link in get_links_list()], dtype=object), utc=True)
+    return created_at.dt.tz_localize(None).to_numpy(dtype='datetime64[s]')
+
+def get_survival_curve(days=(0, 1, 7, 30, 90, 365), tweet_times=None):
+    """
+    Generates a dataframe with the share of URIs first archived within N days of being tweeted, for each N in days.
+
+    Argument(s):
+    - days: List of integers representing the values of N.
+    - tweet_times: Array of datetimes aligned with the lines of tweet_links.txt (NaT if unknown). Defaults to
+      get_tweet_times().
+
+    Output:
+    Returns a dataframe with N and the share of URIs with a tweet time that were archived within N days.
+    """
+    table = load_memento_table()
+    tweet_times = get_tweet_times() if tweet_times is None else np.asarray(tweet_times, dtype='datetime64[s]')
+    return pd.DataFrame({
+        'Days': list(days),
+        'Share of URIs': table.survival_curve(tweet_times[table.uri_number - 1], days)
+    })
+
 def get_scatterplot():
     """
     Generates a scatterplot to show the correlation between URI ages and their number of mementos.
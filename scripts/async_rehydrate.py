@@ -0,0 +1,171 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tweet_cache import get_tweet_cache
+from tweet_cache import store_rehydration_results
+from util import fetch_tweet_result
+from util import get_http_session
+
+"""
+Asyncio rehydration engine. Takes the same [{'tid', 'notes'}] input as util.paral_rehydrate_tweets(), but instead of a
+fixed number of threads it adjusts the number of in-flight requests with an AIMD (additive increase, multiplicative
+decrease) policy: it grows while responses are fast and successful, and backs off on 429/5xx responses, timeouts or
+slow responses.
+"""
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows by roughly one slot per window of successful requests and is cut by a constant
+    factor whenever a request is throttled.
+
+    Argument(s):
+    - initial_limit: Integer representing the starting number of in-flight requests.
+    - min_limit: Integer representing the lowest allowed limit.
+    - max_limit: Integer representing the highest allowed limit.
+    - decrease_factor: Float by which the limit is multiplied when a request is throttled.
+    - latency_target: Number of seconds above which a response is considered slow. Slow responses stop growth
+      and shrink the limit gently.
+    """
+    def __init__(self, initial_limit=5, min_limit=1, max_limit=50, decrease_factor=0.5, latency_target=2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled_count = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    async def release(self, latency, throttled):
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if( throttled ):
+                self.throttled_count += 1
+                # Only cut once per latency window, so one burst of 429s does not collapse the limit to the minimum
+                if( now - self._last_decrease > max(latency, 0.1) ):
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif( latency > self.latency_target ):
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+def is_throttled(status_code):
+    """
+    Returns True if a syndication response status indicates the request should be retried later: no response,
+    HTTP 429 or a 5xx server error.
+    """
+    return status_code is None or status_code == 429 or status_code >= 500
+
+async def async_rehydrate_tweets(tweet_ids, user_agent='', max_retries=3, backoff=1.0, use_cache=True, **limiter_kwargs):
+    """
+    Rehydrates a list of tweets concurrently with an adaptive number of in-flight requests.
+
+    Argument(s):
+    - tweet_ids: List of dictionaries where each dictionary contains:
+      - 'tid': Tweet ID.
+      - 'notes': Additional information to attach to each tweet's metadata.
+    - user_agent: Optional string representing the user agent to use for the requests.
+    - max_retries: Integer representing how many times a throttled request is retried before giving up.
+    - backoff: Number of seconds to wait before the first retry. Doubles on every further retry.
+    - use_cache: If True, tweets found in the tweet cache are not requested and new results are stored in it.
+    - limiter_kwargs: Optional keyword arguments passed to AIMDLimiter (initial_limit, min_limit, max_limit,
+      decrease_factor, latency_target).
+
+    Output:
+    Returns a tuple (tweets, stats). tweets is a list of rehydrated tweet dictionaries with 'notes' attached, in the
+    same order as tweet_ids. A tweet that could not be rehydrated is an empty dictionary with only 'notes'. stats
+    is a dictionary describing the run (final and peak concurrency, throttled responses, elapsed seconds).
+    """
+    limiter = AIMDLimiter(**limiter_kwargs)
+    len_tweet_ids = len(tweet_ids)
+    tweets = [None] * len_tweet_ids
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    cache = get_tweet_cache() if use_cache else None
+    cached = {} if cache is None else cache.get_many([t['tid'] for t in tweet_ids])
+    fetched = {}
+
+    # Blocking requests run in threads that share the pooled HTTP session. There is a thread and a pooled 
+    # connection for every request the limiter can let through, so the limiter's concurrency is what the server 
+    # sees and request latency does not include waiting for a connection.
+    get_http_session(pool_size=limiter.max_limit)
+    executor = ThreadPoolExecutor(max_workers=limiter.max_limit)
+
+    async def rehydrate(i):
+        t = tweet_ids[i]
+        tweet = {}
+        if( t['tid'] in cached ):
+            tweet = dict(cached[t['tid']])
+            tweet['notes'] = t['notes']
+            tweets[i] = tweet
+            return
+
+        for attempt in range(max_retries + 1):
+            await limiter.acquire()
+            req_start = time.monotonic()
+            status_code = None
+            try:
+                status_code, tweet = await loop.run_in_executor(executor, fetch_tweet_result, t['tid'], user_agent)
+            finally:
+                throttled = is_throttled(status_code)
+                await limiter.release(time.monotonic() - req_start, throttled)
+
+            if( throttled is False ):
+                fetched[t['tid']] = (status_code, dict(tweet))
+                break
+            tweet = {}
+            if( attempt < max_retries ):
+                await asyncio.sleep(backoff * 2**attempt)
+
+        if( i % 10 == 0 ):
+            print(f'\tasync_rehydrate_tweets() {i} of {len_tweet_ids}, concurrency: {int(limiter.limit)}')
+
+        tweet['notes'] = t['notes']
+        tweets[i] = tweet
+
+    try:
+        await asyncio.gather(*[rehydrate(i) for i in range(len_tweet_ids)])
+    finally:
+        executor.shutdown(wait=False)
+        if( cache is not None ):
+            store_rehydration_results(cache, [(tid, status_code, tweet) for tid, (status_code, tweet) in fetched.items()])
+
+    stats = {
+        'final_limit': int(limiter.limit),
+        'max_in_flight': limiter.max_in_flight,
+        'throttled': limiter.throttled_count,
+        'elapsed_seconds': time.monotonic() - start
+    }
+    return tweets, stats
+
+def adaptive_rehydrate_tweets(tweet_ids, **kwargs):
+    """
+    Synchronous wrapper around async_rehydrate_tweets() with the same input and output as
+    util.paral_rehydrate_tweets().
+
+    Argument(s):
+    - tweet_ids: List of dictionaries with 'tid' and 'notes' keys.
+    - kwargs: Optional keyword arguments passed to async_rehydrate_tweets().
+
+    Output:
+    Returns a list of dictionaries with rehydrated tweet metadata and attached notes.
+    """
+    if( len(tweet_ids) == 0 ):
+        return []
+
+    tweets, stats = asyncio.run(async_rehydrate_tweets(tweet_ids, **kwargs))
+    print(f"\tadaptive_rehydrate_tweets(): {len(tweets)} tweets in {stats['elapsed_seconds']:.1f} seconds, "
+          f"peak concurrency: {stats['max_in_flight']}, throttled: {stats['throttled']}")
+    return tweets
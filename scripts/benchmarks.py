@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+"""
+Benchmarks for the data collection and analysis pipeline. Each benchmark runs against local data or a local stub
+server, so no network access is needed. Run from the scripts directory, e.g.:
+
+    python benchmarks.py resolve_urls
+"""
+
+def start_stub_server(handler_class):
+    """
+    Starts a threaded HTTP server on a free local port in a background thread.
+
+    Argument(s):
+    - handler_class: BaseHTTPRequestHandler subclass that answers the requests.
+
+    Output:
+    Returns the server object. Its base URL is f'http://127.0.0.1:{server.server_port}'.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class RedirectChainHandler(BaseHTTPRequestHandler):
+    """
+    Answers /r/<hops>/<id> with a redirect to /r/<hops-1>/<id>, and /r/0/<id> with a 200 page. Each response is
+    delayed by `latency` seconds and final pages carry a large body, like a real article.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.02
+    body = b'x' * 200000
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, send_body):
+        time.sleep(self.latency)
+        _, _, hops, uid = self.path.split('/')
+        if int(hops) > 0:
+            self.send_response(301)
+            self.send_header('Location', f'/r/{int(hops)-1}/{uid}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(self.body)
+
+    def do_GET(self):
+        self.respond(True)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+def benchmark_resolve_urls(n_links=200, hops=3, latency=0.02):
+    """
+    Compares resolving URIs one at a time with requests.get (the previous extract_links_subset approach) against
+    extracting_links.resolve_urls() on a local redirect-chain server.
+
+    Argument(s):
+    - n_links: Integer representing the number of distinct URIs to resolve.
+    - hops: Integer representing the number of redirects before each final page.
+    - latency: Number of seconds the server waits before each response.
+    """
+    from extracting_links import resolve_urls
+
+    RedirectChainHandler.latency = latency
+    server = start_stub_server(RedirectChainHandler)
+    base = f'http://127.0.0.1:{server.server_port}'
+    links = [f'{base}/r/{hops}/{i}' for i in range(n_links)]
+
+    start = time.perf_counter()
+    sequential = {}
+    for link in links:
+        response = requests.get(link, timeout=5)
+        sequential[link] = response.url
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resolved = resolve_urls(links)
+    concurrent_seconds = time.perf_counter() - start
+
+    server.shutdown()
+    assert all(resolved[link][0] == sequential[link] for link in links)
+    print(f'resolve_urls: {n_links} links, {hops} redirects each, {latency*1000:.0f} ms latency')
+    print(f'\tsequential requests.get: {sequential_seconds:.2f} seconds')
+    print(f'\tresolve_urls():          {concurrent_seconds:.2f} seconds ({sequential_seconds/concurrent_seconds:.1f}x)')
+
+def benchmark_link_classifier(n_links=1000000, n_rules=5000, n_hosts=20000, n_substring_sample=10000):
+    """
+    Compares the previous substring-list check in check_link_validity against the suffix trie batch classifier on 
+    synthetic URIs, with a blocklist grown to n_rules domains.
+
+    Argument(s):
+    - n_links: Integer representing the number of synthetic URIs to classify.
+    - n_rules: Integer representing the number of blocked domains.
+    - n_hosts: Integer representing the number of distinct hosts the URIs are drawn from.
+    - n_substring_sample: Integer representing the number of URIs checked with the substring loop, whose cost is 
+      extrapolated to n_links (running it on every URI would take too long).
+    """
+    import random
+    from link_classifier import LinkClassifier
+
+    rng = random.Random(0)
+    blocked = [f'blocked{i}.com' for i in range(n_rules)]
+    classifier = LinkClassifier({'blocked': {'synthetic': blocked}})
+    hosts = [f'www.site{i}.org' for i in range(n_hosts)] + [f'm.{domain}' for domain in blocked[:n_hosts//10]]
+    links = [f'https://{rng.choice(hosts)}/article/{i}?ref=twitter' for i in range(n_links)]
+
+    start = time.perf_counter()
+    for link in links[:n_substring_sample]:
+        any(domain in link for domain in blocked)
+    substring_seconds = (time.perf_counter() - start) * n_links / n_substring_sample
+
+    start = time.perf_counter()
+    mask = classifier.valid_links_mask(links)
+    trie_seconds = time.perf_counter() - start
+
+    print(f'link classification: {n_links} links, {n_rules} blocked domains, {int((~mask).sum())} blocked links')
+    print(f'\tsubstring loop (extrapolated from {n_substring_sample} links): {substring_seconds:.1f} seconds')
+    print(f'\tsuffix trie batch: {trie_seconds:.1f} seconds ({substring_seconds/trie_seconds:.0f}x)')
+
+class CannedTimemapHandler(BaseHTTPRequestHandler):
+    """
+    Stub MemGator server. Answers /timemap/json/<uri> after `latency` seconds with a canned timemap of `mementos`
+    mementos for the URI, or with 404 for URIs containing 'unarchived'.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.1
+    mementos = 50
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        link = self.path.split('/timemap/json/', 1)[-1]
+        if 'unarchived' in link:
+            body = b'Resource not found'
+            self.send_response(404)
+        else:
+            memento_list = [{'datetime': f'2020-01-01T00:00:{i%60:02d}Z', 'uri': f'https://web.archive.org/web/2020/{link}'}
+                            for i in range(self.mementos)]
+            body = json.dumps({
+                'original_uri': link,
+                'mementos': {'list': memento_list, 'first': memento_list[0], 'last': memento_list[-1]}
+            }, indent=2).encode()
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def benchmark_timemaps_http(n_links=100, latency=0.1, max_workers=8):
+    """
+    Fetches timemaps from a stub MemGator server with one request at a time and with max_workers concurrent
+    requests over the pooled session (get_timemaps.collect_timemaps_http()).
+
+    Argument(s):
+    - n_links: Integer representing the number of URIs.
+    - latency: Number of seconds the stub server waits before each response.
+    - max_workers: Integer representing the number of concurrent requests.
+    """
+    from get_timemaps import collect_timemaps_http
+
+    CannedTimemapHandler.latency = latency
+    server = start_stub_server(CannedTimemapHandler)
+    base = f'http://127.0.0.1:{server.server_port}'
+    links = [f'https://example.com/{"unarchived" if i % 10 == 0 else "news"}/{i}' for i in range(n_links)]
+
+    timings = {}
+    for workers in (1, max_workers):
+        start = time.perf_counter()
+        timemaps = list(collect_timemaps_http(links, base, max_workers=workers))
+        timings[workers] = time.perf_counter() - start
+
+    server.shutdown()
+    assert json.loads(timemaps[0]) == {'original_uri': links[0]}
+    assert json.loads(timemaps[1])['original_uri'] == links[1]
+    print(f'timemaps over HTTP: {n_links} URIs, {latency*1000:.0f} ms latency')
+    print(f'\t1 request at a time: {timings[1]:.2f} seconds')
+    print(f'\t{max_workers} concurrent requests: {timings[max_workers]:.2f} seconds')
+
+def write_synthetic_timemap(filename, n_mementos):
+    """
+    Writes a timemap JSON file with n_mementos mementos, formatted like the files MemGator produces.
+    """
+    link = 'https://example.com/popular'
+    with open(filename, 'w') as file:
+        file.write(f'{{\n  "original_uri": "{link}",\n  "mementos": {{\n    "list": [\n')
+        for i in range(n_mementos):
+            datetime = f'20{10 + i // 100000:02d}-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z'
+            separator = ',' if i < n_mementos - 1 else ''
+            file.write(f'      {{\n        "datetime": "{datetime}",\n        "uri": "https://web.archive.org/web/{i}/{link}"\n      }}{separator}\n')
+        file.write('    ],\n')
+        file.write(f'    "first": {{\n      "datetime": "2010-01-01T00:00:00Z",\n      "uri": "https://web.archive.org/web/0/{link}"\n    }}\n')
+        file.write('  }\n}\n')
+
+TIMEMAP_READER_CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {scripts!r})
+from timemap_reader import read_timemap_summary
+start = time.perf_counter()
+if {method!r} == 'json.load':
+    with open({filename!r}) as file:
+        uri_info = json.load(file)
+    summary = (len(uri_info['mementos']['list']), uri_info['mementos']['first']['datetime'])
+elif {method!r} == 'streaming':
+    result = read_timemap_summary({filename!r}, streaming_threshold=0)
+    summary = (result['memento_count'], result['first_memento'])
+else:
+    summary = None
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'summary': summary}}))
+"""
+
+def benchmark_timemap_reader(n_mementos=1000000):
+    """
+    Compares loading a synthetic n_mementos timemap with json.load (the previous analysis.load_json path) against
+    the streaming timemap_reader.read_timemap_summary(). Each method runs in a fresh interpreter so its peak RSS is
+    measured on its own.
+
+    Argument(s):
+    - n_mementos: Integer representing the number of mementos in the synthetic timemap.
+    """
+    scripts = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'uri1.json')
+        write_synthetic_timemap(filename, n_mementos)
+        size_mb = os.path.getsize(filename) / 1024 / 1024
+
+        results = {}
+        for method in ('baseline', 'json.load', 'streaming'):
+            code = TIMEMAP_READER_CHILD.format(scripts=scripts, method=method, filename=filename)
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+            results[method] = json.loads(output)
+
+    assert results['json.load']['summary'] == results['streaming']['summary'] == [n_mementos, '2010-01-01T00:00:00Z']
+    baseline_mb = results['baseline']['max_rss_kb'] / 1024
+    print(f'timemap reader: {n_mementos} mementos, {size_mb:.0f} MB file, interpreter baseline {baseline_mb:.0f} MB RSS')
+    for method in ('json.load', 'streaming'):
+        print(f"\t{method}: {results[method]['seconds']:.2f} seconds, peak RSS {results[method]['max_rss_kb'] / 1024:.0f} MB")
+
+BENCHMARKS = {
+    'link_classifier': benchmark_link_classifier,
+    'resolve_urls': benchmark_resolve_urls,
+    'timemap_reader': benchmark_timemap_reader,
+    'timemaps_http': benchmark_timemaps_http
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline benchmarks against local data and stub servers.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ['all'], help="Benchmark to run")
+    args = parser.parse_args()
+
+    for name in (sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]):
+        BENCHMARKS[name]()
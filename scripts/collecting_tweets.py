@@ -1,9 +1,12 @@
 from playwright.sync_api import sync_playwright
 from scrape_twitter import get_auth_twitter_pg
 from scrape_twitter import get_search_tweets
+from scrape_twitter import get_search_tweets_concurrently
+from tweet_id_set import get_tweet_id_set
+from tweet_shard_index import NO_ID, TweetShardWriter, get_tweet_shard_index, parse_tweet_line, read_members
 from util import write_tweets_to_jsonl_file
+import io
 import os
-import gzip
 import glob
 import json
 import random
@@ -13,6 +16,9 @@ import random
 Scrapes and saves tweets for a given list of keywords.
 """
 
+# Tweets per gzip member of the SERP files, so combine_files() can copy the members without duplicates as they are
+SERP_MEMBER_LINES = 10
+
 def get_topics(n):
     """
     Generates a list of social movement topics.
@@ -43,11 +49,10 @@ def tweet_count(input_file):
     - input_file: String representing scraped tweets file stored in scraped_tweets directory.
 
     Output:
-    Returns an integer representing the current numbers of tweets in the given scraped tweets file. 
+    Returns an integer representing the current numbers of unique tweets in the given scraped tweets file. 
     """
-    with gzip.open(os.path.join("../scraped_tweets",input_file), "r") as f:        
-        line_count = sum(1 for line in f)
-        return line_count
+    # Read from the shard's sidecar index, which is only rebuilt if the shard changed since it was indexed
+    return get_tweet_shard_index(os.path.join("../scraped_tweets", input_file)).unique_tweet_count()
 
 def get_next_file_number(jsonl_tweets_folder):
     """
@@ -87,27 +92,76 @@ def combine_files(jsonl_tweets_folder, combined_filename, new=True):
 
     Output:
     Adds the newest file to the directory of existing tweet files with the proper file name for the current 
-    iteration of main().
+    iteration of main(), along with its index (see tweet_shard_index.py). Tweets already stored in any scraped 
+    tweets file, or seen earlier in the SERP files, are left out. The SERP files are removed once the combined file
+    is safely written.
     """
-    if new:
-        mode_arg = 'wt'
-    else:
-        mode_arg = 'at'
+    shard_path = os.path.join(jsonl_tweets_folder, combined_filename)
+    if new and os.path.exists(shard_path):
+        # The file is replaced, so its tweets must not count as already collected
+        os.remove(shard_path)
+    # IDs of the tweets stored in all scraped tweets files (see tweet_id_set.py)
+    id_set = get_tweet_id_set(jsonl_tweets_folder)
+    new_ids = set()
+    duplicate_count = 0
+    copied_count = 0
+    member_count = 0
     # Fetch all .jsonl.gz tweet files 
     input_files = glob.glob(os.path.join(jsonl_tweets_folder, 'twitter_serp*.json.gz'))
-    # Write new combined file or append to an existing file
-    with gzip.open(os.path.join(jsonl_tweets_folder, combined_filename), mode_arg) as outfile:
+    # Write new combined file or append to an existing file, indexing the tweets as they are written (see 
+    # TweetShardWriter for how an interrupted write is undone)
+    with TweetShardWriter(shard_path, append=not new) as outfile:
         # Iterate through each file
         for file in input_files:
-            # Read and write each tweet into combined file
-            with gzip.open(file, 'rt') as infile:
-                for line in infile:
-                    outfile.write(line)
-            # Remove file once processed
-            os.remove(file)
+            # SERP files are small, so each is read and decompressed at once to check its tweets
+            with open(file, 'rb') as infile:
+                data = infile.read()
+            members = read_members(data)
+            if not all(content.endswith(b'\n') for _, _, content in members):
+                # Lines continue across members, so the file can only be written again as a whole
+                members = [(None, None, b''.join(content for _, _, content in members))]
+            file_members = []
+            for offset, length, content in members:
+                lines = io.BytesIO(content).readlines()
+                parsed_lines = []
+                keep = []
+                for line in lines:
+                    tweet_id, has_urls = parse_tweet_line(line)
+                    is_new = tweet_id == NO_ID or (tweet_id not in new_ids and tweet_id not in id_set)
+                    new_ids.add(tweet_id)
+                    parsed_lines.append((tweet_id, has_urls))
+                    keep.append(is_new)
+                duplicate_count += keep.count(False)
+                if lines != []:
+                    file_members.append((offset, length, lines, parsed_lines, keep))
+            if all(all(keep) and offset is not None for offset, _, _, _, keep in file_members):
+                # Nothing to leave out: copy the compressed file as it is
+                if file_members != []:
+                    outfile.copy_members(file, [parsed for member in file_members for parsed in member[3]])
+                    copied_count += len(file_members)
+                member_count += len(file_members)
+                continue
+            for offset, length, lines, parsed_lines, keep in file_members:
+                member_count += 1
+                if all(keep) and offset is not None:
+                    # Copy the members without duplicates as they are
+                    outfile.write_member(data[offset:offset + length], parsed_lines)
+                    copied_count += 1
+                else:
+                    # Write the new tweets of the member again
+                    for line, parsed, is_new in zip(lines, parsed_lines, keep):
+                        if is_new:
+                            outfile.write(line.decode('utf-8'), parsed)
+    id_set.add_shard(outfile.index)
+    id_set.save()
+    # Remove the SERP files only now that their tweets are stored
+    for file in input_files:
+        os.remove(file)
+    print(f"Copied {copied_count} of {member_count} SERP file members without recompressing, skipped {duplicate_count} duplicate tweets..")
 
 
-def scrape_tweets(jsonl_tweets_folder, keywords, max_tweets, total_tweets_to_scrape):
+def scrape_tweets(jsonl_tweets_folder, keywords, max_tweets, total_tweets_to_scrape, concurrency=1, stream=False,
+                  adaptive_rehydration=False):
     """
     The function will scrape a subset of tweets for each keyword and saves those to a temporary json gzip file. 
 
@@ -118,6 +172,11 @@ def scrape_tweets(jsonl_tweets_folder, keywords, max_tweets, total_tweets_to_scr
     during one iteration of get_search_tweets()
     - total_tweets_to_scrape: Integer representing the total number of tweets to collect after one iteration
     of main()
+    - concurrency: Integer representing the number of searches run at the same time, each in its own page of the 
+    authenticated browser. Defaults to 1 (one search after another).
+    - stream: If True, tweets are rehydrated while each search page is still being scrolled. Defaults to False.
+    - adaptive_rehydration: If True, tweets are rehydrated with the adaptive asyncio engine (see async_rehydrate.py),
+    which adjusts its concurrency to the rate limiting of the syndication API. Defaults to False.
 
     Output:
     Adds one temporary SERP json gzip file to the tweet file directory for each keyword. 
@@ -131,30 +190,41 @@ def scrape_tweets(jsonl_tweets_folder, keywords, max_tweets, total_tweets_to_scr
     # Create a storage folder if one does not exist
     if not os.path.exists(jsonl_tweets_folder):
         os.makedirs(jsonl_tweets_folder)
-    # Iterate through topics and extract tweets
+    # List the searches for each topic and the SERP file each one is stored in
+    searches = []
+    jsonl_data_paths = []
     for i, topic in enumerate(keywords):
         if tweets_per_topic <= max_tweets:
-            tweets = get_search_tweets(browser_dets, topic, max_tweets=tweets_per_topic)
-            # Name and store data in json file
-            jsonl_data_path = os.path.join(jsonl_tweets_folder, 'twitter_serp' + str(i+1) + '_1.json.gz')    
-            write_tweets_to_jsonl_file(jsonl_data_path, tweets['tweets'])
+            searches.append((topic, tweets_per_topic))
+            jsonl_data_paths.append(os.path.join(jsonl_tweets_folder, 'twitter_serp' + str(i+1) + '_1.json.gz'))
         else:
             for j in range(iter_per_topic):
-                tweets = get_search_tweets(browser_dets, topic, max_tweets=max_tweets) 
-                # Name and store data in json file 
-                jsonl_data_path = os.path.join(jsonl_tweets_folder, 'twitter_serp' + str(i+1) + '_' + str(j+1) + '.json.gz')    
-                write_tweets_to_jsonl_file(jsonl_data_path, tweets['tweets'])
+                searches.append((topic, max_tweets))
+                jsonl_data_paths.append(os.path.join(jsonl_tweets_folder, 'twitter_serp' + str(i+1) + '_' + str(j+1) + '.json.gz'))
+    # Extract tweets and store each search in its json file
+    if concurrency > 1:
+        get_search_tweets_concurrently(browser_dets, searches, concurrency=concurrency, stream=stream,
+                                       adaptive_rehydration=adaptive_rehydration,
+                                       on_result=lambda indx, tweets: write_tweets_to_jsonl_file(jsonl_data_paths[indx], tweets['tweets'], SERP_MEMBER_LINES))
+    else:
+        for (topic, topic_max_tweets), jsonl_data_path in zip(searches, jsonl_data_paths):
+            tweets = get_search_tweets(browser_dets, topic, max_tweets=topic_max_tweets, stream=stream,
+                                       adaptive_rehydration=adaptive_rehydration)
+            write_tweets_to_jsonl_file(jsonl_data_path, tweets['tweets'], SERP_MEMBER_LINES)
     
     playwright.stop()
 
 
-def collect_tweets(keywords, total_tweets_to_scrape=500):
+def collect_tweets(keywords, total_tweets_to_scrape=500, concurrency=1, stream=False, adaptive_rehydration=False):
     """
     The function will scrape tweets related to the given keywords.
 
     Argument(s):
     - keywords: List of strings representing keywords to be scraped
     - total_tweets_to_scrape: Integer representing the total number of tweets to collect
+    - concurrency: Integer representing the number of searches run at the same time. Defaults to 1.
+    - stream: If True, tweets are rehydrated while search pages are still being scrolled. Defaults to False.
+    - adaptive_rehydration: If True, tweets are rehydrated with the adaptive asyncio engine. Defaults to False.
 
     Output:
     Adds one json gzip file to the scraped_tweets directory. This file holds all tweets scraped for one 
@@ -163,7 +233,8 @@ def collect_tweets(keywords, total_tweets_to_scrape=500):
     # Initialize a directory to store scraped tweets
     jsonl_tweets_folder = "../scraped_tweets"
     # Collect tweets
-    scrape_tweets(jsonl_tweets_folder, keywords, max_tweets=100, total_tweets_to_scrape=total_tweets_to_scrape)
+    scrape_tweets(jsonl_tweets_folder, keywords, max_tweets=100, total_tweets_to_scrape=total_tweets_to_scrape, concurrency=concurrency, stream=stream,
+                  adaptive_rehydration=adaptive_rehydration)
 
     # Fetch the next file number to prevent overwriting files
     next_file_number = get_next_file_number(jsonl_tweets_folder)
@@ -175,7 +246,8 @@ def collect_tweets(keywords, total_tweets_to_scrape=500):
     current_scraped_count = tweet_count(f'scraped_tweets{next_file_number}.json.gz')
     while current_scraped_count < total_tweets_to_scrape:
         # Scrape more tweets
-        scrape_tweets(jsonl_tweets_folder, keywords, max_tweets=10, total_tweets_to_scrape=50)
+        scrape_tweets(jsonl_tweets_folder, keywords, max_tweets=10, total_tweets_to_scrape=50, concurrency=concurrency, stream=stream,
+                      adaptive_rehydration=adaptive_rehydration)
         combine_files(jsonl_tweets_folder, f'scraped_tweets{next_file_number}.json.gz', new=False)
         # Recount number of scraped tweets
         current_scraped_count = tweet_count(f'scraped_tweets{next_file_number}.json.gz')
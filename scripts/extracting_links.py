@@ -1,11 +1,18 @@
-import gzip
 import json
 import glob
 import os
 import requests
 import numpy as np
 import re
+import threading
 import collecting_tweets
+from link_classifier import get_link_classifier
+from link_store import get_link_store
+from tweet_shard_index import get_tweet_shard_index
+from url_cache import get_url_cache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 """
 This script extracts unique links from tweets stored in the scraped_tweets directory and stores them in a text file. 
@@ -16,7 +23,7 @@ video/audio-only page.
 def check_link_validity(link):
     """
     Checks if a given URI is valid (i.e. does not point to a twitter or video/audio-only page). Returns True if the 
-    link is valid, returns False if the link is not valid.
+    link is valid, returns False if the link is not valid. The blocked domains are listed in link_rules.json.
 
     Argument(s):
     - link: String representing URI.
@@ -24,18 +31,100 @@ def check_link_validity(link):
     Output:
     Boolean value representing link validity.
     """
-    invalid_links = ['twitter.com',  
-                     'youtube.com', 
-                     'twitch.com',
-                     'twitch.tv',
-                     'soundcloud.com',
-                     '/x.com',
-                     'tiktok.com'
-                     ]
-    for invalid_link in invalid_links:
-        if invalid_link in link:
-            return False
-    return True
+    return bool(get_link_classifier().valid_links_mask([link])[0])
+
+# Settings for resolving tweet URLs to their final target URI
+RESOLVE_MAX_WORKERS = 32
+RESOLVE_PER_HOST = 8
+RESOLVE_TIMEOUT = 5
+
+def get_resolver_session(per_host=RESOLVE_PER_HOST, max_hosts=256):
+    """
+    Creates an HTTP session for URI resolution. urllib3 keeps one connection pool per host, so connections to 
+    shorteners and news sites that appear many times are reused.
+
+    Argument(s):
+    - per_host: Integer representing the maximum number of pooled connections per host.
+    - max_hosts: Integer representing the number of per-host pools kept open.
+
+    Output:
+    Returns a requests.Session object.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=per_host)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def resolve_url(link, session=None, timeout=RESOLVE_TIMEOUT):
+    """
+    Follows the redirects of a URI without downloading any response body. Sends a HEAD request first and only 
+    falls back to a streamed GET, closed before its body is read, if the HEAD request does not end in a 200 response 
+    (some servers do not support HEAD).
+
+    Argument(s):
+    - link: String representing URI.
+    - session: Optional requests.Session to send the requests with.
+    - timeout: Number of seconds to wait for each response.
+
+    Output:
+    Returns a tuple (final_link, status_code). final_link is the URI after all redirects, or None if the URI 
+    could not be fetched (in which case status_code is None as well).
+    """
+    session = requests if session is None else session
+    try:
+        response = session.head(link, allow_redirects=True, timeout=timeout)
+        response.close()
+        if response.status_code != 200:
+            response = session.get(link, allow_redirects=True, timeout=timeout, stream=True)
+            response.close()
+        return response.url, response.status_code
+    except Exception:
+        return None, None
+
+def resolve_urls(links, max_workers=RESOLVE_MAX_WORKERS, per_host=RESOLVE_PER_HOST, timeout=RESOLVE_TIMEOUT, cache=None):
+    """
+    Resolves many URIs concurrently with resolve_url(). At most max_workers requests are in flight in total and 
+    at most per_host of them to the same host.
+
+    Argument(s):
+    - links: List of strings representing URIs. Duplicates are resolved once.
+    - max_workers: Integer representing the global concurrency cap.
+    - per_host: Integer representing the per-host concurrency cap (and per-host connection pool size).
+    - timeout: Number of seconds to wait for each response.
+    - cache: Optional URLResolutionCache (see url_cache.py). Cached URIs are not requested again, new results are 
+      stored, and URIs being resolved by another caller at the same time are waited on instead of re-requested.
+
+    Output:
+    Returns a dictionary mapping each URI to its (final_link, status_code) tuple.
+    """
+    unique_links = list(dict.fromkeys(links))
+    resolved = {} if cache is None else cache.get_many(unique_links)
+    unique_links = [link for link in unique_links if link not in resolved]
+    if unique_links == []:
+        return resolved
+
+    session = get_resolver_session(per_host=per_host)
+    host_limits = {}
+    host_limits_lock = threading.Lock()
+
+    def resolve(link):
+        host = urlsplit(link).netloc.lower()
+        with host_limits_lock:
+            limit = host_limits.setdefault(host, threading.Semaphore(per_host))
+        with limit:
+            return resolve_url(link, session=session, timeout=timeout)
+
+    def resolve_cached(link):
+        return resolve(link) if cache is None else cache.resolve(link, resolve)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            resolved.update(zip(unique_links, executor.map(resolve_cached, unique_links)))
+    finally:
+        session.close()
+
+    return resolved
 
 def extract_links_subset(file_number=1):
     """
@@ -47,35 +136,34 @@ def extract_links_subset(file_number=1):
     Output:
     Returns a numpy array of all unique URIs extracted. 
     """
-    tweet_counter = 1
     links = []
+    tweet_links = []
     st_files = glob.glob(os.path.join('../scraped_tweets', 'scraped_tweets*.json.gz'))
     # Sort the files by extracting the file number
     st_files = sorted(st_files, key=lambda x: int(re.search(r'\d+', x).group()))
-    with gzip.open(st_files[file_number-1], 'rb') as infile:
-        for tweet in infile:
-            # print('Reading tweet',tweet_counter,'..')
-            tweet_counter += 1
-            try:
-                tweet = json.loads(tweet.decode())
-                tweet_urls = tweet['entities']['urls']
-                if tweet_urls == []:
-                    continue
-                else:
-                    # Fetch the final URI (returns HTTP 200 response)
-                    response = requests.get(tweet_urls[0]['expanded_url'], timeout=5)
-                    if response.status_code == 200:
-                        final_link = response.url
-                    # Exclude link if it points to a video/audio-only page
-                    if check_link_validity(final_link):
-                        links.append(final_link)
-                    # Exclude link if it does not return 200 response
-                    else:
-                        continue
-            except:
-                continue
-
-    print("Processed", tweet_counter-1, "tweets..")
+    # Only decompress the parts of the shard holding tweets with URLs, as listed in its index
+    shard_index = get_tweet_shard_index(st_files[file_number-1])
+    for _, tweet in shard_index.read_lines(shard_index.url_lines()):
+        try:
+            tweet = json.loads(tweet.decode())
+            tweet_links.append(tweet['entities']['urls'][0]['expanded_url'])
+        except:
+            continue
+
+    # Fetch the final URI of every link concurrently, reusing resolutions from earlier runs
+    url_cache = get_url_cache()
+    # The cache's counters are cumulative, so the ones reported are the differences over this file
+    stats_before = dict(url_cache.stats)
+    resolved = resolve_urls(tweet_links, cache=url_cache)
+    stats = {key: url_cache.stats[key] - stats_before[key] for key in ('hits', 'negative_hits', 'misses')}
+    print(f"URL cache hits: {stats['hits']}, negative hits: {stats['negative_hits']}, misses: {stats['misses']}")
+    # Exclude link if it does not return 200 response
+    final_links = [resolved[link][0] for link in tweet_links if resolved[link][1] == 200]
+    # Exclude link if it points to a twitter or video/audio-only page
+    if final_links != []:
+        links = np.array(final_links, dtype=object)[get_link_classifier().valid_links_mask(final_links)].tolist()
+
+    print("Processed", shard_index.line_count, "tweets..")
     print("Collected", len(np.unique(links)), "links..")
     return np.unique(links)
 
@@ -86,12 +174,7 @@ def link_count():
     Output:
     Integer representing the number of URIs stored in tweet_links.txt
     """
-    if not os.path.exists('../tweet_links.txt'):
-        return 0
-    else:
-        with open('../tweet_links.txt', 'r') as file:
-            line_count = sum(1 for line in file)
-        return line_count
+    return get_link_store().line_count
     
 def read_duplicates():
     """
@@ -100,17 +183,7 @@ def read_duplicates():
     Output:
     Returns a list of duplicate URI strings in tweet_links.txt.
     """
-    with open('../tweet_links.txt', 'r') as file:
-        existing_links = file.read().splitlines()
-        read_links = []
-        duplicate_links = []
-        for link in existing_links:
-            if link in read_links:
-                duplicate_links.append(link)
-            else:
-                read_links.append(link)
-
-        return duplicate_links
+    return get_link_store().duplicates()
     
 def extract_links(total_links_to_scrape=50,file_number=1):
     """
@@ -126,6 +199,7 @@ def extract_links(total_links_to_scrape=50,file_number=1):
     Returns the file number of the last processed file, or None if all links have been collected.
     """
     current_file = file_number
+    link_store = get_link_store()
     while link_count() < total_links_to_scrape:
         # Do not collect URIs from files that do not exist
         if current_file >= collecting_tweets.get_next_file_number('../scraped_tweets'):
@@ -133,23 +207,8 @@ def extract_links(total_links_to_scrape=50,file_number=1):
         # Extract link from tweets
         print(f"Extracting URIs from file {current_file}..")
         extracted_links = extract_links_subset(current_file) 
-        link_file_path = "../tweet_links.txt"
-        # Create link txt file
-        if not os.path.exists(link_file_path):
-            with open(link_file_path, 'w') as file:
-                for link in extracted_links:
-                    file.write(link + '\n')
-        else:
-            # Fetch existing links in txt file
-            try:
-                with open(link_file_path, 'r') as file:
-                    existing_links = file.read().splitlines()
-            except:
-                existing_links = []
-            # Add link to the txt file if not in the file
-            with open(link_file_path, 'a') as file:
-                for link in extracted_links:
-                    if link not in existing_links: file.write(link + '\n')
+        # Add links to the txt file if not already in it
+        link_store.add_many(extracted_links)
         print(f"Finished extracting links from files..")
         print(f'Link count: ', link_count())
         current_file += 1
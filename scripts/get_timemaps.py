@@ -1,5 +1,16 @@
 import subprocess
+import argparse
+import json
+import math
 import os
+import time
+from datetime import datetime as dt
+from datetime import timezone
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from timemap_manifest import TimemapManifest
+from timemap_store import TIMEMAPS_FOLDER, get_timemap_store
 
 """
 This script finds and collects the timemap for each URI in the tweet_links.txt file. The JSON files can be found under 
@@ -42,38 +53,273 @@ def collect_timemap(link):
         print(e)
         return None
     
-def save_timemaps(start_line=None):
+MEMGATOR_PORT = 1208
+MEMGATOR_CONTAINER_NAME = 'memgator-server'
+MEMGATOR_TIMEOUT = 120
+
+def start_memgator_server(port=MEMGATOR_PORT, container_name=MEMGATOR_CONTAINER_NAME, startup_timeout=60):
+    """
+    Starts one long-running MemGator server container and waits until it accepts requests. Returns the base URL of 
+    the server, to be passed to collect_timemap_http() or save_timemaps().
+    """
+    command = ["docker", "container", "run", "-d", "--rm", "--name", container_name, "-p", f"{port}:1208", 
+               "oduwsdl/memgator", "server"]
+    subprocess.check_output(command, text = True, timeout = 120)
+    base_url = f"http://localhost:{port}"
+    # Wait for the server to come up
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        try:
+            requests.get(base_url, timeout = 5)
+            return base_url
+        except requests.exceptions.RequestException:
+            time.sleep(1)
+    raise RuntimeError(f"MemGator server did not start on {base_url}")
+
+def stop_memgator_server(container_name=MEMGATOR_CONTAINER_NAME):
+    """
+    Stops the MemGator server container started by start_memgator_server().
+    """
+    subprocess.run(["docker", "container", "stop", container_name], timeout = 120)
+
+def get_memgator_session(pool_size=8):
+    """
+    Creates an HTTP session whose connection pool holds pool_size keep-alive connections to the MemGator server.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def collect_timemap_http(link, base_url, session=None, timeout=MEMGATOR_TIMEOUT):
+    """
+    Fetches the timemap for a single URI from a MemGator server (or any service with the same 
+    /timemap/json/<uri> API). Returns the JSON content, the same as collect_timemap() does: a URI without mementos 
+    (HTTP 404) gives a JSON string containing only the original URI, and a failed request gives None.
+    """
+    session = requests if session is None else session
+    try:
+        response = session.get(f"{base_url.rstrip('/')}/timemap/json/{link}", timeout = timeout)
+        if response.status_code == 200:
+            return extract_json(response.text, link)
+        if response.status_code == 404:
+            return extract_json('', link)
+        print("ERROR OCCURRED:", link, response.status_code)
+    except requests.exceptions.RequestException as e:
+        print("ERROR OCCURRED:", link)
+        print(e)
+    return None
+
+def collect_timemaps_http(links, base_url, max_workers=8, timeout=MEMGATOR_TIMEOUT):
+    """
+    Fetches the timemaps for many URIs from a MemGator server with up to max_workers concurrent requests over a 
+    pooled HTTP session. Yields the JSON content (or None) of each URI in the same order as links, as soon as it 
+    and every URI before it are done.
+    """
+    session = get_memgator_session(pool_size=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield from executor.map(lambda link: collect_timemap_http(link, base_url, session=session, timeout=timeout), links)
+    finally:
+        session.close()
+
+def summarize_timemap(json_content):
+    """
+    Returns the memento count and the time (seconds since the epoch) of the earliest memento of a timemap, or None
+    for the earliest memento if it has no mementos. Raises ValueError if the content is not a JSON timemap.
+    """
+    uri_info = json.loads(json_content)
+    if not isinstance(uri_info, dict):
+        raise ValueError("timemap is not a JSON object")
+    if 'mementos' not in uri_info:
+        return 0, None
+    earliest_memento = dt.strptime(uri_info['mementos']['first']['datetime'], "%Y-%m-%dT%H:%M:%SZ")
+    return len(uri_info['mementos']['list']), earliest_memento.replace(tzinfo=timezone.utc).timestamp()
+
+def read_stored_summary(store, uri_number, link=None):
+    """
+    Returns summarize_timemap() of a stored timemap and the time it was written, as a (memento_count, first_memento,
+    written_at) tuple, or None if the timemap is missing, empty or not valid, e.g. after an interrupted write by an 
+    earlier version of save_timemaps(). If link is given, None is also returned when the timemap is not the 
+    timemap of link (its original_uri differs), e.g. because the link on the URI's line changed.
+    """
+    try:
+        if link is not None and store.read_summary(uri_number)['original_uri'] != link:
+            return None
+        return summarize_timemap(store.read(uri_number)) + (store.modified_time(uri_number),)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def store_timemap(manifest, store, uri_number, json_content):
     """
-    Collects the timemaps for all URIs stored in tweet_links.txt. Processes output for each URI into a JSON file 
-    and stores it in 'timemaps' directory. User can specify a line number to continue from in additional iterations of the 
-    function to avoid overwriting previous files, otherwise function will start collecting timemaps from line 1 of 
-    tweet_links.txt.
+    Saves a collected timemap in the timemap store (see timemap_store.py) and records the outcome, with the 
+    timemap's memento count and earliest memento, in the manifest. A missing (None) or invalid result is recorded as
+    failed and nothing is written.
     """
+    try:
+        memento_count, first_memento = summarize_timemap(json_content)
+    except (TypeError, ValueError, KeyError):
+        print(f"Failed URI {uri_number}, will retry on the next run")
+        manifest.mark_failed(uri_number)
+        return
+    store.write(uri_number, json_content)
+    manifest.mark_done(uri_number, memento_count=memento_count, first_memento=first_memento)
+
+def save_timemaps(start_line=None, memgator_url=None, max_workers=8, max_retries=3):
+    """
+    Collects the timemaps for all URIs stored in tweet_links.txt. Processes output for each URI into JSON and stores
+    it in the 'timemaps' directory, as uri{n}.json files or in compressed shards depending on the directory's 
+    storage backend (see timemap_store.py). Progress is recorded in a manifest (see timemap_manifest.py), so URIs that 
+    were already collected are skipped and an interrupted collection resumes where it stopped. Failed URIs are 
+    retried on later runs, up to max_retries times. User can optionally specify a line number of tweet_links.txt to 
+    start from. If memgator_url is given, timemaps are fetched from that MemGator server (see start_memgator_server()) 
+    with max_workers concurrent requests instead of running one container per URI.
+    """
+    # Create directory to store timemap data
+    if not os.path.exists(TIMEMAPS_FOLDER):
+        os.makedirs(TIMEMAPS_FOLDER)
     with open('../tweet_links.txt', 'r') as file:
         links = file.read().splitlines()
-        # Start processing at given file, if specified.
-        if start_line is not None:
-            links = links[start_line-1:]
-        for i, link in enumerate(links):
-            if start_line is not None:
-                # Create directory to store timemap data
-                if not os.path.exists("../timemaps"):
-                    os.makedirs("../timemaps")
-                with open(f"../timemaps/uri{i+start_line}.json", "w") as json_file:
-                    print(f"Collecting URI {i+start_line}: {link}..")
-                    # Collect time map data and create a JSON file for a given URI
-                    json_content = collect_timemap(link)
-                    json_file.write(json_content)
+
+    store = get_timemap_store(TIMEMAPS_FOLDER)
+    manifest = TimemapManifest()
+    try:
+        manifest.register(links)
+        todo = manifest.get_todo(max_retries=max_retries, first_uri_number=1 if start_line is None else start_line)
+        # Timemaps collected before the manifest existed count as done, as long as they are the timemap of the 
+        # link now registered for the URI (register() resets URIs whose link changed to pending)
+        pending = []
+        for uri_number, link in todo:
+            summary = read_stored_summary(store, uri_number, link) if manifest.get_status(uri_number) == 'pending' else None
+            if summary is not None:
+                manifest.mark_done(uri_number, memento_count=summary[0], first_memento=summary[1], fetched_at=summary[2])
             else:
-                # Create directory to store timemap data
-                if not os.path.exists("../timemaps"):
-                    os.makedirs("../timemaps")
-                with open(f"../timemaps/uri{i+1}.json", "w") as json_file:
-                    print(f"Collecting URI {i+1}..")
-                    # Collect time map data and create a JSON file for a given URI
-                    json_content = collect_timemap(link)
-                    json_file.write(json_content)
+                pending.append((uri_number, link))
+        print(f"Collecting {len(pending)} timemaps, manifest: {manifest.counts()}")
+
+        pending_links = [link for uri_number, link in pending]
+        if memgator_url is not None:
+            results = collect_timemaps_http(pending_links, memgator_url, max_workers=max_workers)
+        else:
+            results = (collect_timemap(link) for link in pending_links)
+
+        for (uri_number, link), json_content in zip(pending, results):
+            print(f"Collected URI {uri_number}: {link}..")
+            store_timemap(manifest, store, uri_number, json_content)
+        print(f"Finished collecting timemaps, manifest: {manifest.counts()}")
+    finally:
+        manifest.close()
+
+REFRESH_MIN_INTERVAL = 7 * 24 * 60 * 60
+REFRESH_MAX_INTERVAL = 365 * 24 * 60 * 60
+REFRESH_AGE_SCALE = 30 * 24 * 60 * 60
+REFRESH_BUDGET = 500
+
+def refresh_interval(uri_age, memento_count):
+    """
+    Returns the number of seconds after which a timemap is considered stale. Young URIs gain mementos quickly, so 
+    the interval starts at REFRESH_MIN_INTERVAL and grows with the square root of the URI's age (the time since its 
+    earliest memento). URIs with many mementos change little, relative to what is already known, with each new 
+    memento, so the interval also grows with the logarithm of the memento count. It is capped at REFRESH_MAX_INTERVAL.
+
+    Argument(s):
+    - uri_age: Number of seconds between the earliest memento and the last fetch, 0 for URIs without mementos.
+    - memento_count: Integer representing the memento count at the last fetch.
+    """
+    interval = REFRESH_MIN_INTERVAL * math.sqrt(1 + uri_age / REFRESH_AGE_SCALE) * (1 + math.log10(1 + memento_count))
+    return min(interval, REFRESH_MAX_INTERVAL)
+
+def get_refresh_candidates(manifest, budget=REFRESH_BUDGET, now=None):
+    """
+    Picks the collected timemaps to re-fetch. A timemap is stale once the time since its last fetch exceeds its 
+    refresh_interval(); stale timemaps are ordered by expected change, i.e. by how many intervals have passed, and 
+    the first `budget` of them are returned. URIs recorded without a timemap summary are summarized from the stored 
+    timemap.
+
+    Output:
+    Returns a list of (uri_number, link) tuples, most overdue first.
+    """
+    now = time.time() if now is None else now
+    store = get_timemap_store(TIMEMAPS_FOLDER)
+    candidates = []
+    for uri_number, link, last_fetch, memento_count, first_memento in manifest.get_done():
+        if memento_count is None:
+            summary = read_stored_summary(store, uri_number, link)
+            if summary is None:
+                # Missing or broken timemap, or the timemap of another link: refresh it first
+                candidates.append((math.inf, uri_number, link))
+                continue
+            memento_count, first_memento, last_fetch = summary
+            manifest.mark_done(uri_number, memento_count=memento_count, first_memento=first_memento, fetched_at=last_fetch)
+
+        uri_age = 0 if first_memento is None else max(last_fetch - first_memento, 0)
+        overdue = (now - last_fetch) / refresh_interval(uri_age, memento_count)
+        if overdue >= 1:
+            candidates.append((overdue, uri_number, link))
+
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+    return [(uri_number, link) for overdue, uri_number, link in candidates[:budget]]
+
+def refresh_timemaps(budget=REFRESH_BUDGET, memgator_url=None, max_workers=8):
+    """
+    Re-fetches up to `budget` stale timemaps (see get_refresh_candidates()), most overdue first, and replaces them in
+    the timemap store. A failed re-fetch keeps the previous timemap, and the URI stays at the front of the queue for the next run.
+    Returns the number of timemaps refreshed.
+    """
+    store = get_timemap_store(TIMEMAPS_FOLDER)
+    manifest = TimemapManifest()
+    try:
+        refresh = get_refresh_candidates(manifest, budget=budget)
+        print(f"Refreshing {len(refresh)} stale timemaps")
+
+        links = [link for uri_number, link in refresh]
+        if memgator_url is not None:
+            results = collect_timemaps_http(links, memgator_url, max_workers=max_workers)
+        else:
+            results = (collect_timemap(link) for link in links)
+
+        refreshed = 0
+        for (uri_number, link), json_content in zip(refresh, results):
+            try:
+                memento_count, first_memento = summarize_timemap(json_content)
+            except (TypeError, ValueError, KeyError):
+                print(f"Failed to refresh URI {uri_number}, keeping the previous timemap")
+                continue
+            store.write(uri_number, json_content)
+            manifest.mark_done(uri_number, memento_count=memento_count, first_memento=first_memento)
+            refreshed += 1
+        print(f"Refreshed {refreshed} timemaps")
+        return refreshed
+    finally:
+        manifest.close()
 
 if __name__ == "__main__":
-    # save_timemaps()
-    pass
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Collect or refresh the timemaps of the URIs in tweet_links.txt.")
+    parser.add_argument(
+        "--refresh", 
+        action="store_true", 
+        help="Re-fetch stale timemaps instead of collecting missing ones"
+    )
+    parser.add_argument(
+        "--budget", 
+        type=int, 
+        default=REFRESH_BUDGET, 
+        help=f"Maximum number of timemaps to re-fetch with --refresh (default: {REFRESH_BUDGET})"
+    )
+    parser.add_argument(
+        "--memgator_server", 
+        action="store_true", 
+        help="Collect timemaps from one long-running MemGator server container instead of one container per URI"
+    )
+    args = parser.parse_args()
+
+    memgator_url = start_memgator_server() if args.memgator_server else None
+    try:
+        if args.refresh:
+            refresh_timemaps(budget=args.budget, memgator_url=memgator_url)
+        else:
+            save_timemaps(memgator_url=memgator_url)
+    finally:
+        if memgator_url is not None:
+            stop_memgator_server()
\ No newline at end of file
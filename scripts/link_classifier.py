@@ -0,0 +1,110 @@
+import json
+import re
+import threading
+import numpy as np
+
+"""
+Host-based link classification. Domains are loaded from a rules file into a suffix trie of host labels, so each link
+is matched by walking its host from the top-level domain down, in time that does not depend on the number of rules.
+A rule matches the domain and all of its subdomains, and the most specific (longest) matching rule wins, so an
+allowed subdomain can override a blocked domain.
+"""
+
+LINK_RULES_PATH = '../link_rules.json'
+
+class LinkClassifier:
+    """
+    Suffix trie of blocked and allowed domains.
+
+    Argument(s):
+    - rules: Dictionary with 'blocked' and 'allowed' keys, each mapping a category name (e.g. 'video', 'audio', 
+      'social') to a list of domains.
+    """
+    def __init__(self, rules):
+        self.trie = {}
+        self.categories = {}
+        for verdict in ('blocked', 'allowed'):
+            for category, domains in rules.get(verdict, {}).items():
+                self.categories[category] = verdict
+                for domain in domains:
+                    self.add_domain(domain, category)
+
+    def add_domain(self, domain, category):
+        """
+        Adds a domain (and implicitly its subdomains) to the trie under the given category.
+        """
+        node = self.trie
+        for label in reversed(domain.strip().lower().strip('.').split('.')):
+            node = node.setdefault(label, {})
+        node[''] = category
+
+    def classify_host(self, host):
+        """
+        Returns the category of the most specific rule matching a host name, or '' if no rule matches.
+        """
+        category = ''
+        node = self.trie
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            category = node.get('', category)
+        return category
+
+    def classify_links(self, links):
+        """
+        Classifies many links at once. Each distinct host is looked up in the trie only once.
+
+        Argument(s):
+        - links: List or array of URI strings.
+
+        Output:
+        Returns a numpy array with the category of each link ('' if no rule matches).
+        """
+        host_categories = {}
+        categories = np.empty(len(links), dtype=object)
+        for i, link in enumerate(links):
+            host = get_host(link)
+            category = host_categories.get(host)
+            if category is None:
+                category = host_categories[host] = self.classify_host(host)
+            categories[i] = category
+        return categories
+
+    def valid_links_mask(self, links):
+        """
+        Returns a boolean numpy array that is False for links whose best matching rule is blocked.
+        """
+        blocked = [category for category, verdict in self.categories.items() if verdict == 'blocked']
+        return ~np.isin(self.classify_links(links), np.array(blocked, dtype=object))
+
+# Matches the host of 'scheme://[user@]host[:port]...' URIs
+HOST_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://(?:[^/?#@]*@)?(\[[^\]/?#]*\]|[^/?#:]*)')
+
+def get_host(link):
+    """
+    Returns the lowercase host name of a URI without port or credentials ('' if it has none).
+    """
+    match = HOST_PATTERN.match(link)
+    return '' if match is None else match.group(1).lower().rstrip('.')
+
+def load_link_classifier(path=LINK_RULES_PATH):
+    """
+    Builds a LinkClassifier from a JSON rules file (see link_rules.json).
+    """
+    with open(path, 'r') as file:
+        return LinkClassifier(json.load(file))
+
+_default_classifier = None
+_default_classifier_lock = threading.Lock()
+
+def get_link_classifier():
+    """
+    Returns the process-wide LinkClassifier loaded from LINK_RULES_PATH, loading it on first use.
+    """
+    global _default_classifier
+
+    with _default_classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = load_link_classifier()
+        return _default_classifier
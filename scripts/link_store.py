@@ -0,0 +1,132 @@
+import os
+import threading
+
+"""
+Indexed store of the extracted links. tweet_links.txt stays the on-disk record (one link per line, appended in
+order), while the store keeps an in-memory index of it so membership checks, ID lookups and counts do not re-read
+or scan the file.
+"""
+
+LINK_FILE_PATH = '../tweet_links.txt'
+
+class LinkStore:
+    """
+    Append-only link store backed by a text file with one link per line.
+
+    Each link's ID is the line number (starting at 1) of its first occurrence, which is also the number of its
+    timemap file (timemaps/uri{ID}.json).
+
+    Argument(s):
+    - path: String representing the link file. Defaults to LINK_FILE_PATH. It is created on the first append.
+    """
+    def __init__(self, path=LINK_FILE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._load()
+
+    def _file_signature(self):
+        if not os.path.exists(self.path):
+            return None
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _load(self):
+        self._ids = {}
+        self._links = []
+        self._duplicates = []
+        self.line_count = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                for link in file.read().splitlines():
+                    self._index(link)
+        self._signature = self._file_signature()
+
+    def _index(self, link):
+        self.line_count += 1
+        if link in self._ids:
+            self._duplicates.append(link)
+        else:
+            self._ids[link] = self.line_count
+            self._links.append(link)
+
+    def refresh(self):
+        """
+        Reloads the index if the link file was changed by something other than this store.
+        """
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._load()
+
+    def __contains__(self, link):
+        return link in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_id(self, link):
+        """
+        Returns the ID (line number of the first occurrence) of a link, or None if it is not stored.
+        """
+        return self._ids.get(link)
+
+    def links(self):
+        """
+        Returns the list of unique links in the order they were added.
+        """
+        return list(self._links)
+
+    def duplicates(self):
+        """
+        Returns the list of repeated lines in the link file (each repeat after the first occurrence).
+        """
+        return list(self._duplicates)
+
+    def add_many(self, links):
+        """
+        Appends the links that are not stored yet, in order, to the link file.
+
+        Argument(s):
+        - links: Iterable of link strings.
+
+        Output:
+        Returns the number of links added.
+        """
+        with self._lock:
+            new_links = []
+            seen = set()
+            for link in links:
+                if link not in self._ids and link not in seen:
+                    seen.add(link)
+                    new_links.append(link)
+
+            if new_links == []:
+                return 0
+
+            with open(self.path, 'a') as file:
+                file.write(''.join(link + '\n' for link in new_links))
+            for link in new_links:
+                self._index(link)
+            self._signature = self._file_signature()
+            return len(new_links)
+
+    def add(self, link):
+        """
+        Appends a link if it is not stored yet. Returns the link's ID.
+        """
+        self.add_many([link])
+        return self._ids[link]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_link_store(path=LINK_FILE_PATH):
+    """
+    Returns the process-wide LinkStore for a link file, reloading it if the file was changed externally.
+    """
+    with _stores_lock:
+        store = _stores.get(os.path.abspath(path))
+        if store is None:
+            store = LinkStore(path)
+            _stores[os.path.abspath(path)] = store
+    store.refresh()
+    return store
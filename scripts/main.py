@@ -1,6 +1,8 @@
 from collecting_tweets import get_topics, collect_tweets
 from extracting_links import extract_links, link_count
 from get_timemaps import save_timemaps
+from get_timemaps import start_memgator_server
+from get_timemaps import stop_memgator_server
 import math
 import shutil
 import argparse
@@ -18,13 +20,32 @@ def main():
         default=50, 
         help="Total number of links to scrape (default: 50)"
     )
+    parser.add_argument(
+        "--concurrency", 
+        type=int, 
+        default=1, 
+        help="Number of topic searches to run at the same time in separate browser pages (default: 1)"
+    )
+    parser.add_argument(
+        "--adaptive_rehydration", 
+        action="store_true", 
+        help="Rehydrate tweets with the adaptive engine, which adjusts its concurrency to rate limiting"
+    )
+    parser.add_argument(
+        "--memgator_server", 
+        action="store_true", 
+        help="Collect timemaps from one long-running MemGator server container instead of one container per URI"
+    )
     # Fetch the number of links to scrape
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
     total_links_to_scrape = args.total_links_to_scrape
 
     # Scrape 200 tweets to start on 5 random social movements
     keywords = get_topics(5)
-    collect_tweets(keywords, total_tweets_to_scrape=200)
+    collect_tweets(keywords, total_tweets_to_scrape=200, concurrency=args.concurrency,
+                   adaptive_rehydration=args.adaptive_rehydration)
     # Extract links in those tweets
     result = extract_links(total_links_to_scrape=total_links_to_scrape)
     # If not enough links were collected, scrape more tweets and extract more links.
@@ -36,7 +57,8 @@ def main():
         print(f'Collecting {tweets_to_scrape} more tweets..')
         # Get new topics to avoid rate-limiting
         keywords = get_topics(5)
-        collect_tweets(keywords, total_tweets_to_scrape=tweets_to_scrape)
+        collect_tweets(keywords, total_tweets_to_scrape=tweets_to_scrape, concurrency=args.concurrency,
+                       adaptive_rehydration=args.adaptive_rehydration)
         result = extract_links(total_links_to_scrape=total_links_to_scrape, file_number=result)
 
     # After tweet collection, delete cache and browser storage
@@ -44,7 +66,14 @@ def main():
     shutil.rmtree("playwright-browser-storage")
 
     # Fetch the time map for each URI
-    save_timemaps()
+    if args.memgator_server:
+        memgator_url = start_memgator_server()
+        try:
+            save_timemaps(memgator_url=memgator_url)
+        finally:
+            stop_memgator_server()
+    else:
+        save_timemaps()
 
     return
 
@@ -0,0 +1,380 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from link_classifier import get_host
+from timemap_corpus import get_store_signature
+from timemap_store import TIMEMAPS_FOLDER, get_timemap_store
+
+"""
+Columnar table of every memento in the timemaps directory. Each column is a flat binary file that is memory-mapped
+with NumPy when the table is loaded, so counts, first/last captures and per-archive statistics are computed with
+vectorized operations instead of re-reading the timemap JSON files.
+
+Memento columns (one row per memento, grouped by URI in URI number order, in timemap order within a URI):
+- uri_id: int64 URI number (the n of timemaps/uri{n}.json and the line of the URI in tweet_links.txt).
+- datetime: int64 capture time in seconds since the epoch (UTC).
+- archive_id: int32 index of the memento's archive host in the table's 'archives' list.
+- rel: uint8 flags, REL_FIRST and/or REL_LAST for the mementos the timemap lists as first and last.
+
+URI columns (one row per timemap, including timemaps without mementos):
+- uri_number: int64 URI number.
+- offset: int64 index of the URI's first memento row; has one extra entry at the end, so the mementos of URI i are
+  rows offset[i]:offset[i+1].
+"""
+
+MEMENTO_TABLE_FOLDER = '../memento_table'
+
+ARCHIVE_BLOCK_CELLS = 1 << 24
+
+REL_FIRST = 1
+REL_LAST = 2
+
+MEMENTO_COLUMNS = {'uri_id': 'int64', 'datetime': 'int64', 'archive_id': 'int32', 'rel': 'uint8'}
+URI_COLUMNS = {'uri_number': 'int64', 'offset': 'int64'}
+
+def parse_datetimes(datetimes):
+    """
+    Converts memento datetime strings such as '2020-04-09T12:13:57Z' to int64 seconds since the epoch in one pass.
+    """
+    return np.array([datetime.rstrip('Z') for datetime in datetimes], dtype='datetime64[s]').astype(np.int64)
+
+def build_memento_table(timemaps_folder=TIMEMAPS_FOLDER, table_folder=MEMENTO_TABLE_FOLDER):
+    """
+    Builds the memento table from all timemaps of a directory, whatever its storage backend (see timemap_store.py). Columns are appended one timemap at a time, so
+    memory use does not grow with the corpus. The table is written to a temporary directory that replaces
+    table_folder only once it is complete. Timemaps that cannot be parsed are reported and left out.
+
+    Output:
+    Returns the loaded MementoTable.
+    """
+    tmp_folder = table_folder.rstrip('/') + '.tmp'
+    if os.path.exists(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+
+    store = get_timemap_store(timemaps_folder)
+    source_signature = get_source_signature(timemaps_folder)
+    archive_ids = {}
+    columns = {name: open(os.path.join(tmp_folder, f'{name}.{dtype}'), 'wb') for name, dtype in MEMENTO_COLUMNS.items()}
+    uri_numbers = []
+    offsets = [0]
+    try:
+        for uri_number in store.uri_numbers():
+            mementos = []
+            try:
+                summary = store.read_summary(uri_number, on_memento=mementos.append)
+                datetimes = parse_datetimes([memento['datetime'] for memento in mementos])
+                archives = np.array([archive_ids.setdefault(get_host(memento['uri']), len(archive_ids))
+                                     for memento in mementos], dtype=np.int32)
+                rel = np.zeros(len(mementos), dtype=np.uint8)
+                if len(mementos) != 0:
+                    # Timemaps without a 'first' or 'last' entry flag their earliest or latest memento instead
+                    first = parse_datetimes([summary['first_memento']])[0] if summary['first_memento'] is not None else datetimes.min()
+                    last = parse_datetimes([summary['last_memento']])[0] if summary['last_memento'] is not None else datetimes.max()
+                    rel[datetimes == first] |= REL_FIRST
+                    rel[datetimes == last] |= REL_LAST
+            except Exception as e:
+                print(f"Error processing {store.name(uri_number)}: {e}")
+                continue
+
+
+            columns['uri_id'].write(np.full(len(mementos), uri_number, dtype=np.int64).tobytes())
+            columns['datetime'].write(datetimes.tobytes())
+            columns['archive_id'].write(archives.tobytes())
+            columns['rel'].write(rel.tobytes())
+            uri_numbers.append(uri_number)
+            offsets.append(offsets[-1] + len(mementos))
+    finally:
+        for column in columns.values():
+            column.close()
+
+    np.array(uri_numbers, dtype=np.int64).tofile(os.path.join(tmp_folder, 'uri_number.int64'))
+    np.array(offsets, dtype=np.int64).tofile(os.path.join(tmp_folder, 'offset.int64'))
+    meta = {
+        'n_uris': len(uri_numbers),
+        'n_mementos': offsets[-1],
+        'archives': list(archive_ids),
+        'memento_columns': MEMENTO_COLUMNS,
+        'uri_columns': URI_COLUMNS,
+        'source_signature': source_signature
+    }
+    with open(os.path.join(tmp_folder, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+
+    # Swap the complete table in
+    old_folder = table_folder.rstrip('/') + '.old'
+    if os.path.exists(table_folder):
+        os.replace(table_folder, old_folder)
+    os.replace(tmp_folder, table_folder)
+    if os.path.exists(old_folder):
+        shutil.rmtree(old_folder)
+    return MementoTable(table_folder)
+
+def get_source_signature(timemaps_folder=TIMEMAPS_FOLDER):
+    """
+    Returns a short hash of the timemap store's signature (see timemap_corpus.get_store_signature()), recorded in 
+    the table to tell when it is out of date.
+    """
+    signature = get_store_signature(get_timemap_store(timemaps_folder))
+    return hashlib.sha1(repr(signature).encode()).hexdigest()
+
+def _load_column(path, dtype, length):
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+class MementoTable:
+    """
+    Memory-mapped memento table written by build_memento_table().
+
+    Argument(s):
+    - table_folder: String representing the table directory. Defaults to MEMENTO_TABLE_FOLDER.
+
+    Attributes: the memento columns (uri_id, datetime, archive_id, rel) and URI columns (uri_number, offset) as
+    read-only NumPy arrays, and archives, the list of archive hosts indexed by archive_id.
+    """
+    def __init__(self, table_folder=MEMENTO_TABLE_FOLDER):
+        self.table_folder = table_folder
+        with open(os.path.join(table_folder, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        self.archives = self.meta['archives']
+        for name, dtype in self.meta['memento_columns'].items():
+            setattr(self, name, _load_column(os.path.join(table_folder, f'{name}.{dtype}'), dtype, self.meta['n_mementos']))
+        self.uri_number = _load_column(os.path.join(table_folder, 'uri_number.int64'), 'int64', self.meta['n_uris'])
+        self.offset = np.fromfile(os.path.join(table_folder, 'offset.int64'), dtype=np.int64)
+
+    def __len__(self):
+        return self.meta['n_mementos']
+
+    def memento_counts(self):
+        """
+        Returns an int64 array with the number of mementos of each URI, in uri_number order.
+        """
+        return np.diff(self.offset)
+
+    def _reduce_datetimes(self, ufunc):
+        counts = self.memento_counts()
+        result = np.full(len(counts), np.iinfo(np.int64).min, dtype=np.int64)
+        has_mementos = counts > 0
+        if has_mementos.any():
+            result[has_mementos] = ufunc.reduceat(self.datetime, self.offset[:-1][has_mementos])
+        return result.view('datetime64[s]')
+
+    def first_datetimes(self):
+        """
+        Returns a datetime64[s] array with the earliest memento of each URI (NaT for URIs without mementos).
+        """
+        return self._reduce_datetimes(np.minimum)
+
+    def last_datetimes(self):
+        """
+        Returns a datetime64[s] array with the latest memento of each URI (NaT for URIs without mementos).
+        """
+        return self._reduce_datetimes(np.maximum)
+
+    def ages_in_days(self, now):
+        """
+        Returns a float array with the number of whole days between each URI's earliest memento and now (NaN for
+        URIs without mementos), the same as analysis.get_age().
+
+        Argument(s):
+        - now: numpy.datetime64 or datetime representing the reference time of the analysis.
+        """
+        first = self.first_datetimes()
+        has_mementos = ~np.isnat(first)
+        ages = np.full(len(first), np.nan)
+        ages[has_mementos] = (np.datetime64(now, 's') - first[has_mementos]) // np.timedelta64(1, 'D')
+        return ages
+
+    def uri_index(self):
+        """
+        Returns an int64 array with the position (in uri_number order) of each memento's URI.
+        """
+        return np.repeat(np.arange(len(self.uri_number), dtype=np.int64), self.memento_counts())
+
+    def archive_summary(self):
+        """
+        Aggregates the mementos of each archive in one vectorized pass over the archive_id and datetime columns.
+
+        Output:
+        Returns a dictionary of arrays indexed by archive_id: 'memento_count', 'first_memento' and 'last_memento'
+        (datetime64[s]), 'uri_count' (number of URIs with at least one memento in the archive) and 'uri_share' 
+        (uri_count divided by the number of URIs, including URIs without mementos).
+        """
+        n_archives = len(self.archives)
+        first = np.full(n_archives, np.iinfo(np.int64).max, dtype=np.int64)
+        last = np.full(n_archives, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first, self.archive_id, self.datetime)
+        np.maximum.at(last, self.archive_id, self.datetime)
+
+        # A URI counts towards every archive it has mementos in; URIs are processed in blocks so the dense
+        # URI x archive count matrix stays small
+        uri_counts = np.zeros(n_archives, dtype=np.int64)
+        counts = self.memento_counts()
+        block = max(1, ARCHIVE_BLOCK_CELLS // max(n_archives, 1))
+        for start in range(0, len(self.uri_number), block):
+            end = min(start + block, len(self.uri_number))
+            rows = np.repeat(np.arange(end - start, dtype=np.int64), counts[start:end])
+            keys = rows * n_archives + self.archive_id[self.offset[start]:self.offset[end]]
+            matrix = np.bincount(keys, minlength=(end - start) * n_archives).reshape(end - start, n_archives)
+            uri_counts += (matrix > 0).sum(axis=0)
+        return {
+            'memento_count': np.bincount(self.archive_id, minlength=n_archives),
+            'first_memento': first.view('datetime64[s]'),
+            'last_memento': last.view('datetime64[s]'),
+            'uri_count': uri_counts,
+            'uri_share': uri_counts / max(len(self.uri_number), 1)
+        }
+
+    def uri_archive_counts(self):
+        """
+        Counts the mementos of each URI in each archive.
+
+        Output:
+        Returns an int64 array of shape (number of URIs, number of archives), rows in uri_number order and columns
+        indexed by archive_id.
+        """
+        n_archives = len(self.archives)
+        counts = np.bincount(self.uri_index() * n_archives + self.archive_id, minlength=len(self.uri_number) * n_archives)
+        return counts.reshape(len(self.uri_number), n_archives)
+
+    def sorted_datetimes(self):
+        """
+        Returns the datetime column sorted by time within each URI (URIs stay in uri_number order). Timemaps are 
+        normally chronological already, in which case the column is returned without sorting.
+        """
+        uri_index = self.uri_index()
+        same_uri = uri_index[1:] == uri_index[:-1]
+        if (np.diff(self.datetime)[same_uri] >= 0).all():
+            return np.asarray(self.datetime)
+        return np.asarray(self.datetime)[np.lexsort((self.datetime, uri_index))]
+
+    def capture_periods(self, unit='Y'):
+        """
+        Returns an int64 array with the calendar period of each memento, counted from 1970: years for unit='Y', 
+        months for unit='M'.
+        """
+        return _to_periods(self.datetime, unit)
+
+    def capture_histogram(self, unit='Y'):
+        """
+        Counts the captures in each calendar period, over the whole corpus.
+
+        Argument(s):
+        - unit: 'Y' for years or 'M' for months.
+
+        Output:
+        Returns a (periods, memento_counts, uri_counts) tuple of arrays covering every period from the first to the
+        last capture: periods as datetime64[unit], the number of mementos captured in each period, and the number of
+        URIs with at least one memento captured in it.
+        """
+        # (URI, period) keys are non-decreasing once the datetimes are sorted within each URI, so each pair is 
+        # counted once by keeping the first key of each run
+        periods = _to_periods(self.sorted_datetimes(), unit)
+        if len(periods) == 0:
+            return np.empty(0, dtype=f'datetime64[{unit}]'), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        first_period = periods.min()
+        n_periods = int(periods.max() - first_period) + 1
+        sorted_periods = periods - first_period
+        memento_counts = np.bincount(sorted_periods, minlength=n_periods)
+        keys = self.uri_index() * n_periods + sorted_periods
+        new_pair = np.ones(len(keys), dtype=bool)
+        new_pair[1:] = keys[1:] != keys[:-1]
+        uri_counts = np.bincount(sorted_periods[new_pair], minlength=n_periods)
+
+        all_periods = (np.arange(n_periods) + first_period).astype(f'datetime64[{unit}]')
+        return all_periods, memento_counts, uri_counts
+
+    def uri_capture_histogram(self, unit='Y'):
+        """
+        Counts the captures of each URI in each calendar period, in long format (periods without captures are left
+        out).
+
+        Output:
+        Returns a (uri_positions, periods, counts) tuple of arrays: the URI's position in uri_number order, the 
+        period as datetime64[unit] and the number of mementos of that URI captured in it.
+        """
+        periods = _to_periods(self.sorted_datetimes(), unit)
+        if len(periods) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=f'datetime64[{unit}]'), np.empty(0, dtype=np.int64)
+        first_period = periods.min()
+        n_periods = int(periods.max() - first_period) + 1
+        keys = self.uri_index() * n_periods + (periods - first_period)
+        # Keys are sorted, so each run of equal keys is one (URI, period) pair
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        counts = np.diff(np.append(starts, len(keys)))
+        run_keys = keys[starts]
+        return run_keys // n_periods, (run_keys % n_periods + first_period).astype(f'datetime64[{unit}]'), counts
+
+    def capture_gaps(self):
+        """
+        Measures the time between consecutive captures of each URI.
+
+        Output:
+        Returns a (mean_gaps, max_gaps) tuple of float arrays in uri_number order, in seconds, with NaN for URIs with
+        fewer than two mementos.
+        """
+        counts = self.memento_counts()
+        datetimes = self.sorted_datetimes()
+        mean_gaps = np.full(len(counts), np.nan)
+        max_gaps = np.full(len(counts), np.nan)
+        has_gaps = counts > 1
+        if not has_gaps.any():
+            return mean_gaps, max_gaps
+
+        starts = self.offset[:-1][has_gaps]
+        ends = self.offset[1:][has_gaps]
+        mean_gaps[has_gaps] = (datetimes[ends - 1] - datetimes[starts]) / (counts[has_gaps] - 1)
+        # Differences across URI boundaries are set below any real gap, so the maximum from each URI's first row up
+        # to the next URI with gaps is the URI's largest gap
+        gaps = np.diff(datetimes)
+        boundaries = self.offset[1:-1]
+        gaps[boundaries[(boundaries > 0) & (boundaries < len(datetimes))] - 1] = np.iinfo(np.int64).min
+        max_gaps[has_gaps] = np.maximum.reduceat(gaps, starts)
+        return mean_gaps, max_gaps
+
+    def survival_curve(self, tweet_times, days):
+        """
+        Calculates the share of URIs first archived within N days of being tweeted, for several N.
+
+        Argument(s):
+        - tweet_times: datetime64 array in uri_number order with the time each URI was tweeted (NaT if unknown).
+          URIs without a tweet time are left out.
+        - days: Array of integers representing the values of N. A URI archived before it was tweeted counts as 
+          archived within every N.
+
+        Output:
+        Returns a float array with the share for each N, out of the URIs with a tweet time (including the ones 
+        never archived).
+        """
+        tweet_times = np.asarray(tweet_times, dtype='datetime64[s]')
+        first = self.first_datetimes()
+        known = ~np.isnat(tweet_times)
+        archived = known & ~np.isnat(first)
+        delays = np.sort((first[archived] - tweet_times[archived]).astype(np.int64))
+        limits = np.asarray(days, dtype=np.int64) * 24 * 60 * 60
+        return np.searchsorted(delays, limits, side='right') / max(int(known.sum()), 1)
+
+def _to_periods(datetimes, unit):
+    # Seconds since the epoch to calendar years ('Y') or months ('M') since 1970. Converting every datetime with
+    # NumPy's calendar arithmetic is slow, so the conversion is done once per day and looked up by day.
+    days = np.asarray(datetimes) // (24 * 60 * 60)
+    if len(days) == 0:
+        return days
+    first_day = days.min()
+    day_periods = np.arange(first_day, days.max() + 1).astype('datetime64[D]').astype(f'datetime64[{unit}]')
+    return day_periods.astype(np.int64)[days - first_day]
+
+def load_memento_table(timemaps_folder=TIMEMAPS_FOLDER, table_folder=MEMENTO_TABLE_FOLDER, rebuild=False):
+    """
+    Loads the memento table, building it first if it does not exist, if the timemaps changed since it was built, or
+    if rebuild is True.
+    """
+    meta_path = os.path.join(table_folder, 'meta.json')
+    if not rebuild and os.path.exists(meta_path):
+        table = MementoTable(table_folder)
+        if table.meta.get('source_signature') == get_source_signature(timemaps_folder):
+            return table
+    return build_memento_table(timemaps_folder, table_folder)
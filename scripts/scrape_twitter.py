@@ -6,15 +6,19 @@ import time
 from getpass import getpass
 
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from NwalaTextUtils.textutils import genericErrorInfo
 from NwalaTextUtils.textutils import getLinks
 
 from playwright.sync_api import sync_playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from urllib.parse import quote_plus
 
+from async_rehydrate import adaptive_rehydrate_tweets
 from util import paral_rehydrate_tweets
 from util import readTextFromFile
+from util import RehydrationStream
 from util import rehydrate_tweet
 from util import write_tweets_to_jsonl_file
 from util import writeTextToFile
@@ -170,14 +174,278 @@ def color_tweet(page, tweet_link):
     ''')
 
 
-def get_tweet_ids_user_timeline_page(screen_name, page, max_tweets):
+# Script injected into the page for the 'observer' harvest mode. A MutationObserver records each tweet article 
+# once, as soon as its timestamp link is rendered, and queues its link, datetime and retweet flag. Python then 
+# drains the queue in small batches instead of re-reading the whole DOM.
+TWEET_HARVESTER_JS = '''
+() => {
+    if( window.__tweetHarvester !== undefined ) {
+        return false;
+    }
+
+    const harvester = {seen: new Set(), queue: []};
+
+    const harvestArticle = (article) => {
+        const time = article.querySelector('time');
+        if( time === null || time.parentElement === null ) {
+            return;
+        }
+
+        const link = (time.parentElement.getAttribute('href') || '').trim();
+        if( link === '' || harvester.seen.has(link) ) {
+            return;
+        }
+
+        const socialContext = article.querySelector('span[data-testid="socialContext"]');
+        const isRetweet = socialContext !== null && socialContext.textContent.trim().toLowerCase().endsWith(' retweeted');
+
+        harvester.seen.add(link);
+        harvester.queue.push({link: link, datetime: time.getAttribute('datetime') || '', is_retweet: isRetweet});
+    };
+
+    const harvestNode = (node) => {
+        if( node.nodeType !== Node.ELEMENT_NODE ) {
+            return;
+        }
+        // Article content renders after the article itself, so also check the enclosing article of added nodes
+        const article = node.closest('article');
+        if( article !== null ) {
+            harvestArticle(article);
+        }
+        node.querySelectorAll('article').forEach(harvestArticle);
+    };
+
+    // Track completed network requests, and timeline responses in particular, for adaptive scroll pacing
+    harvester.lastNetwork = performance.now();
+    harvester.lastTimeline = 0;
+    if( typeof PerformanceObserver !== 'undefined' ) {
+        harvester.netObserver = new PerformanceObserver((list) => {
+            const now = performance.now();
+            harvester.lastNetwork = now;
+            for( const e of list.getEntries() ) {
+                if( /Timeline|UserTweets/.test(e.name) ) {
+                    harvester.lastTimeline = now;
+                }
+            }
+        });
+        harvester.netObserver.observe({type: 'resource'});
+    }
+
+    harvester.drain = (batchSize) => JSON.stringify(harvester.queue.splice(0, batchSize));
+    harvester.observer = new MutationObserver((mutations) => {
+        for( const m of mutations ) {
+            m.addedNodes.forEach(harvestNode);
+        }
+    });
+
+    document.querySelectorAll('article').forEach(harvestArticle);
+    harvester.observer.observe(document.body, {childList: true, subtree: true});
+    window.__tweetHarvester = harvester;
+    return true;
+}
+'''
+
+# Predicate polled after each scroll in the 'adaptive' pacing mode. Resolves as soon as new tweet articles appear, 
+# or once a timeline response arrived without rendering new tweets, or once the network has been idle.
+WAIT_FOR_TWEETS_JS = '''
+({seen, start, minMs, idleMs, settleMs}) => {
+    const h = window.__tweetHarvester;
+    if( h === undefined ) {
+        return false;
+    }
+    if( h.seen.size > seen ) {
+        return 'articles';
+    }
+
+    const now = performance.now();
+    if( now - start < minMs ) {
+        return false;
+    }
+    if( h.lastTimeline > start && now - h.lastTimeline > settleMs ) {
+        return 'timeline';
+    }
+    if( now - Math.max(h.lastNetwork, start) > idleMs ) {
+        return 'network_idle';
+    }
+    return false;
+}
+'''
+
+def install_tweet_harvester(page):
+    """
+    Injects the MutationObserver-based tweet harvester into the page. Safe to call more than once per document.
+
+    Argument(s):
+        page: The Playwright page object representing the current browser page.
+    """
+    page.evaluate(TWEET_HARVESTER_JS)
+
+def harvest_tweets_observer(page, batch_size=50):
     """
-    Extracts tweet IDs from a user's timeline page.
+    Pulls the tweets recorded by the injected harvester since the last call, in batches of batch_size.
+
+    Argument(s):
+        page: The Playwright page object representing the current browser page.
+        batch_size (int): The maximum number of tweets transferred per call into the page.
+
+    Output:
+        list: A list of dictionaries with the 'link', 'datetime' and 'is_retweet' of each newly seen tweet.
+    """
+    # The harvester is lost if the page navigated, so reinstall it (this also queues the tweets already rendered)
+    install_tweet_harvester(page)
+
+    harvested = []
+    while( True ):
+        batch = json.loads(page.evaluate(f'() => window.__tweetHarvester.drain({batch_size})'))
+        harvested += batch
+        if( len(batch) < batch_size ):
+            return harvested
+
+def start_scroll(page):
+    """
+    Records the harvester state and scrolls down. The returned state is passed to wait_for_tweets() so the wait can 
+    happen later, e.g. after other pages have been scrolled.
+
+    Argument(s):
+        page: The Playwright page object representing the current browser page.
+
+    Output:
+        dict: The number of tweets seen and the page time at the scroll.
+    """
+    install_tweet_harvester(page)
+    seen, start = page.evaluate('() => [window.__tweetHarvester.seen.size, performance.now()]')
+    scroll_down(page)
+    return {'seen': seen, 'start': start}
+
+def wait_for_tweets(page, scroll_state, max_wait=5.0, min_wait=0.3, idle_wait=1.0, settle_wait=0.5):
+    """
+    Waits until the page signals that it has finished loading the tweets requested by a scroll, instead of sleeping 
+    for a fixed time.
+
+    Argument(s):
+        page: The Playwright page object representing the current browser page.
+        scroll_state (dict): The state returned by start_scroll().
+        max_wait (float): Ceiling in seconds on the wait.
+        min_wait (float): Seconds to wait before the network idle or timeline signals are trusted.
+        idle_wait (float): Seconds without a completed network request after which the network is considered idle.
+        settle_wait (float): Seconds to let a timeline response render before concluding it added no tweets.
+
+    Output:
+        str: The signal that ended the wait: 'articles' (new tweets rendered), 'timeline' (a timeline response 
+             arrived but added no tweets), 'network_idle' or 'timeout'.
+    """
+    args = dict(scroll_state, minMs=min_wait*1000, idleMs=idle_wait*1000, settleMs=settle_wait*1000)
+    try:
+        # Poll on an interval rather than on animation frames, which are paused for pages that are not in front
+        return page.wait_for_function(WAIT_FOR_TWEETS_JS, arg=args, polling=100, timeout=max_wait*1000).json_value()
+    except PlaywrightTimeoutError:
+        return 'timeout'
+
+def scroll_and_wait(page, max_wait=5.0, **kwargs):
+    """
+    Scrolls down and waits for the next batch of tweets. See start_scroll() and wait_for_tweets().
+
+    Output:
+        str: The signal that ended the wait.
+    """
+    return wait_for_tweets(page, start_scroll(page), max_wait=max_wait, **kwargs)
+
+def harvest_tweets_soup(page):
+    """
+    Parses the full page HTML and reads every tweet article currently in the DOM.
+
+    Argument(s):
+        page: The Playwright page object representing the current browser page.
+
+    Output:
+        list: A list of dictionaries with the 'link', 'datetime' and 'is_retweet' of each tweet on the page.
+    """
+    # Get the page content and parse it with BeautifulSoup.
+    page_html = page.content()
+    soup = BeautifulSoup(page_html, 'html.parser')
+    articles = soup.find_all('article')  
+
+    harvested = []
+    # Loop through all the 'article' elements found on the page.
+    for t in articles:
+        # Check if the tweet is a retweet.
+        is_retweet = t.find('span', {'data-testid': 'socialContext'})
+        is_retweet = False if is_retweet is None else is_retweet.text.strip().lower().endswith(' retweeted')
+        
+        tweet_datetime = ''
+        tweet_link = t.find('time')
+        # Extract the tweet link and timestamp.
+        if( tweet_link is None ):
+            tweet_link = ''  
+        else:
+            tweet_datetime = tweet_link.get('datetime', '')
+            tweet_link = tweet_link.parent.get('href', '')
+
+        harvested.append({'link': tweet_link, 'datetime': tweet_datetime, 'is_retweet': is_retweet})
+
+    return harvested
+
+def get_tweet_uri_dets(tweet_link, tweet_det, screen_name):
+    """
+    Builds the tweet details dictionary for a harvested tweet link.
+
+    Argument(s):
+        tweet_link (str): The tweet path, e.g. '/screen_name/status/123'.
+        tweet_det (dict): The 'datetime' and 'is_retweet' values harvested for the tweet.
+        screen_name (str): The Twitter handle of the timeline owner ('' for searches).
+
+    Output:
+        dict: The tweet ID, status screen name, datetime and the notes to attach after rehydration.
+    """
+    stat_screen_name, tid = tweet_link.split('/status/')
+    twt_uri_dets = {
+        'tid': tid,
+        'status_screen_name': stat_screen_name[1:], # Remove leading '/'.
+        'datetime': tweet_det['datetime']
+    }
+    twt_uri_dets['notes'] = {'timeline_screen_name': screen_name, 'is_retweet': tweet_det['is_retweet']}
+    return twt_uri_dets
+
+def get_tweet_ids_user_timeline_page(screen_name, page, max_tweets, harvest_mode='observer', **kwargs):
+    """
+    Extracts tweet IDs from a user's timeline page. Runs iter_tweet_ids_user_timeline_page() to completion.
+
+    Argument(s):
+        See iter_tweet_ids_user_timeline_page().
+
+    Output:
+        list: A list of dictionaries containing tweet details (see iter_tweet_ids_user_timeline_page()).
+    """
+    steps = iter_tweet_ids_user_timeline_page(screen_name, page, max_tweets, harvest_mode=harvest_mode, **kwargs)
+    while( True ):
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+def iter_tweet_ids_user_timeline_page(screen_name, page, max_tweets, harvest_mode='observer', **kwargs):
+    """
+    Generator that extracts tweet IDs from a user's timeline page. It yields right after each scroll, before 
+    waiting for the page to load, so a caller can scroll several pages and let them load at the same time. 
+    The wait happens when the generator is resumed. The tweet list is the generator's return value.
 
     Argument(s):
         screen_name (str): The Twitter handle of the user (without '@').
         page: The Playwright page object representing the current browser page.
         max_tweets (int): The maximum number of tweets to retrieve.
+        harvest_mode (str): 'observer' collects only newly added tweets inside the browser with an injected 
+            MutationObserver. 'soup' re-parses the whole page with BeautifulSoup after every scroll. 
+            Defaults to 'observer'.
+        **kwargs:
+            pacing (str): 'adaptive' waits after each scroll until new tweets appear, a timeline response arrives 
+                or the network goes idle (see scroll_and_wait()). 'fixed' sleeps for 2 seconds. Defaults to 'adaptive'.
+            max_wait (float): Ceiling in seconds on each adaptive wait. Defaults to 5.
+            max_empty_rounds (int): Stop after more than this many consecutive scrolls without new tweets. Defaults to 5.
+            max_empty_seconds (float): Stop once this many seconds passed without new tweets. Defaults to None (no limit).
+            stats (dict): If provided, filled with the pacing report: 'rounds', 'wait_seconds', 'harvest_seconds' 
+                and the count of each wait signal.
+            on_tweet_id (function): Optional callback called with each tweet's details (same dictionary as in the 
+                returned list) as soon as the tweet is first seen.
 
     Output:
         list: A list of dictionaries containing tweet details including:
@@ -192,31 +460,25 @@ def get_tweet_ids_user_timeline_page(screen_name, page, max_tweets):
     tweet_links = set()  # A set to avoid duplicate tweet links.
     tweet_dets = {}  # Dictionary to store tweet metadata.
     break_flag = False  # Flag to exit the loop when max tweets are reached.
+    harvest_tweets = harvest_tweets_soup if harvest_mode == 'soup' else harvest_tweets_observer
+
+    # Extract pacing options from kwargs.
+    pacing = kwargs.get('pacing', 'adaptive')
+    max_wait = kwargs.get('max_wait', 5.0)
+    max_empty_rounds = kwargs.get('max_empty_rounds', 5)
+    max_empty_seconds = kwargs.get('max_empty_seconds', None)
+    on_tweet_id = kwargs.get('on_tweet_id', None)
+    stats = kwargs.get('stats', {})
+    stats.update({'rounds': 0, 'wait_seconds': 0.0, 'harvest_seconds': 0.0})
+    last_new_tweet_time = time.monotonic()
 
     while( True ):
-        # Get the page content and parse it with BeautifulSoup.
-        page_html = page.content()
-        soup = BeautifulSoup(page_html, 'html.parser')
-        articles = soup.find_all('article')  
-
-        # Loop through all the 'article' elements found on the page.
-        for i in range(len(articles)):
-            
-            t = articles[i]
-            # Check if the tweet is a retweet.
-            is_retweet = t.find('span', {'data-testid': 'socialContext'})
-            is_retweet = False if is_retweet is None else is_retweet.text.strip().lower().endswith(' retweeted')
+        harvest_start = time.monotonic()
+        # Loop through the tweets harvested since the last scroll ('observer') or on the whole page ('soup').
+        for t in harvest_tweets(page):
             
-            tweet_datetime = ''
-            tweet_link = t.find('time')
-            # Extract the tweet link and timestamp.
-            if( tweet_link is None ):
-                tweet_link = ''  
-            else:
-                tweet_datetime = tweet_link.get('datetime', '')
-                tweet_link = tweet_link.parent.get('href', '')
-
-            tweet_link = tweet_link.strip()
+            tweet_link = t['link'].strip()
+            is_retweet = t['is_retweet']
             if( tweet_link == '' ):
                 print('\ttweet_link is blank, skipping')
                 continue
@@ -230,8 +492,10 @@ def get_tweet_ids_user_timeline_page(screen_name, page, max_tweets):
             # Optionally, highlight the tweet on the page.
             # color_tweet(page, tweet_link)
 
-            # Store tweet details.
-            tweet_dets[tweet_link] = {'datetime': tweet_datetime, 'is_retweet': is_retweet}
+            # Store tweet details, and hand newly seen tweets to the caller right away if requested.
+            tweet_dets[tweet_link] = {'datetime': t['datetime'], 'is_retweet': is_retweet}
+            if( on_tweet_id is not None and tweet_link not in tweet_links ):
+                on_tweet_id( get_tweet_uri_dets(tweet_link, tweet_dets[tweet_link], screen_name) )
             tweet_links.add( tweet_link )
 
             print( '\textracted {} tweets'.format(len(tweet_links)) )
@@ -241,34 +505,45 @@ def get_tweet_ids_user_timeline_page(screen_name, page, max_tweets):
                 print(f'breaking reached ({len(tweet_links)}) maximum: {max_tweets}')
                 break
         
+        stats['harvest_seconds'] += time.monotonic() - harvest_start
+        stats['rounds'] += 1
         # Exit the loop if the break flag is set.
         if( break_flag is True ):
             break
 
         # If no new tweets are found, increment the counter.
         empty_result_count = empty_result_count + 1 if prev_len == len(tweet_links) else 0
-        if( empty_result_count > 5 ):
+        if( empty_result_count == 0 ):
+            last_new_tweet_time = time.monotonic()
+        if( empty_result_count > max_empty_rounds ):
             print(f'No new tweets found, so breaking')
             break
+        if( max_empty_seconds is not None and time.monotonic() - last_new_tweet_time > max_empty_seconds ):
+            print(f'No new tweets found in {max_empty_seconds} seconds, so breaking')
+            break
 
         prev_len = len(tweet_links)
-        print('\tthrottling/scrolling, then sleeping for 2 second\n')
 
-        # Scroll down to load more tweets and wait for the page to update.
-        scroll_down(page)
-        time.sleep(2)
+        # Scroll down to load more tweets, let the caller run other pages, then wait for the page to update.
+        wait_start = time.monotonic()
+        if( pacing == 'fixed' ):
+            print('\tthrottling/scrolling, then sleeping for 2 second\n')
+            scroll_down(page)
+            yield
+            time.sleep(max(0, 2 - (time.monotonic() - wait_start)))
+        else:
+            scroll_state = start_scroll(page)
+            yield
+            signal = wait_for_tweets(page, scroll_state, max_wait=max_wait)
+            stats[signal] = stats.get(signal, 0) + 1
+            print(f'\tscrolled, waited {time.monotonic() - wait_start:.2f} seconds ({signal})\n')
+        stats['wait_seconds'] += time.monotonic() - wait_start
+
+    print(f"\tpacing: {stats['rounds']} rounds, {stats['wait_seconds']:.1f} seconds waiting, {stats['harvest_seconds']:.1f} seconds harvesting")
 
     # Process and structure the extracted tweet links.
     for tlink in tweet_links:
-
-        stat_screen_name, tid = tlink.split('/status/')
-        twt_uri_dets = {
-            'tid': tid,
-            'status_screen_name': stat_screen_name[1:], # Remove leading '/'.
-            'datetime': tweet_dets[tlink]['datetime']
-        }
-        twt_uri_dets['notes'] = {'timeline_screen_name': screen_name, 'is_retweet': tweet_dets[tlink]['is_retweet']}
-        tweets.append(twt_uri_dets)
+        tweets.append( get_tweet_uri_dets(tlink, tweet_dets[tlink], screen_name) )
         
     # Sort tweets by tweet ID before returning.
     tweets = sorted(tweets, key=lambda x:x['tid'])
@@ -306,10 +581,40 @@ def get_timeline_tweets(browser_dets, screen_name, max_tweets=20):
 
     return payload
 
-def get_search_tweets(browser_dets, query, max_tweets=20):
+def get_search_uri(query):
+    """
+    Returns the URL of the live search results page for a query.
+    """
+    return 'https://twitter.com/search?q=' + quote_plus(query.strip()) + '&f=live&src=typd'
+
+def rehydrate_tweet_ids(tweet_ids, stream=None, adaptive_rehydration=False):
+    """
+    Rehydrates harvested tweets: collects the results of a RehydrationStream if one was used while harvesting, 
+    otherwise rehydrates them all now with the adaptive asyncio engine or the fixed-size thread pool.
+    """
+    if( stream is not None ):
+        return stream.finish(tweet_ids)
+    if( adaptive_rehydration is True ):
+        return adaptive_rehydrate_tweets(tweet_ids)
+    return paral_rehydrate_tweets(tweet_ids)
+
+def get_search_tweets(browser_dets, query, max_tweets=20, adaptive_rehydration=False, stream=False):
+    """
+    Retrieves tweets from the live search results for a query.
+
+    Argument(s):
+        browser_dets (dict): Contains the browser context and page details.
+        query (str): The search query.
+        max_tweets (int): The maximum number of tweets to retrieve. Default is 20.
+        adaptive_rehydration (bool): If True, rehydrates with the adaptive asyncio engine after harvesting.
+        stream (bool): If True, rehydrates tweets in worker threads while the page is still being scrolled 
+            (see util.RehydrationStream), instead of after harvesting.
 
+    Output:
+        dict: A dictionary containing the URL of the search, the list of tweets and the pacing report.
+    """
     query = query.strip()
-    uri = 'https://twitter.com/search?q=' + quote_plus(query) + '&f=live&src=typd'
+    uri = get_search_uri(query)
     payload = {'self': uri, 'tweets': []}
     if( max_tweets < 0  or len(browser_dets) == 0 or query == '' ):
         return payload
@@ -317,11 +622,112 @@ def get_search_tweets(browser_dets, query, max_tweets=20):
     print('\nget_search_tweets():')
     browser_dets['page'].goto(uri)
     
-    tweet_ids = get_tweet_ids_user_timeline_page( '', browser_dets['page'], max_tweets )
-    payload['tweets'] = paral_rehydrate_tweets(tweet_ids)
+    payload['pacing'] = {}
+    rehydration_stream = RehydrationStream() if stream is True else None
+    tweet_ids = get_tweet_ids_user_timeline_page( '', browser_dets['page'], max_tweets, stats=payload['pacing'],
+        on_tweet_id=None if rehydration_stream is None else rehydration_stream.submit )
+    payload['tweets'] = rehydrate_tweet_ids(tweet_ids, stream=rehydration_stream, adaptive_rehydration=adaptive_rehydration)
 
     return payload
 
+def get_search_tweets_concurrently(browser_dets, searches, concurrency=3, on_result=None, adaptive_rehydration=False, stream=False):
+    """
+    Runs several searches at the same time, each in its own page (tab) of the authenticated browser context. 
+    The pages are scrolled in turn, so while one page is waited on the others keep loading. The tweets of a 
+    finished search are rehydrated in a background thread while the other pages keep scrolling. If a search fails,
+    the extra pages are still closed and the rehydration streams of unfinished searches are stopped.
+
+    Argument(s):
+        browser_dets (dict): Contains the browser context and page details (see get_auth_twitter_pg()).
+        searches (list): A list of (query, max_tweets) tuples.
+        concurrency (int): The maximum number of searches (pages) running at once, at least 1. Defaults to 3.
+        on_result (function): Optional callback called as on_result(index, payload) as soon as the search at 
+            position index in searches finishes. payload is the same as returned by get_search_tweets().
+        adaptive_rehydration (bool): If True, rehydrates with the adaptive asyncio engine.
+        stream (bool): If True, each search rehydrates its tweets while its page is still being scrolled.
+
+    Output:
+        list: The payload of each search, in the same order as searches.
+    """
+    results = [None] * len(searches)
+    if( len(browser_dets) == 0 or len(searches) == 0 ):
+        return results
+
+    concurrency = max(1, concurrency)
+    print(f'\nget_search_tweets_concurrently(): {len(searches)} searches, concurrency: {concurrency}')
+    # Reuse the authenticated page and open more pages in the same context as needed
+    pages = [browser_dets['page']]
+    pending = list(enumerate(searches))
+    active = {} # page index -> (search index, payload, steps, rehydration stream)
+    # Finished searches are rehydrated in background threads, so the other pages keep scrolling meanwhile
+    rehydrator = ThreadPoolExecutor(max_workers=min(concurrency, len(searches)))
+    rehydrations = {} # search index -> (payload, future, rehydration stream)
+
+    def start_next(pg_indx):
+        while( len(pending) != 0 ):
+            indx, (query, max_tweets) = pending.pop(0)
+            payload = {'self': get_search_uri(query), 'tweets': [], 'pacing': {}}
+            if( max_tweets < 0 or query.strip() == '' ):
+                results[indx] = payload
+                if( on_result is not None ):
+                    on_result(indx, payload)
+                continue
+            print(f'\tpage {pg_indx}: searching "{query.strip()}"')
+            pages[pg_indx].goto(payload['self'])
+            rehydration_stream = RehydrationStream() if stream is True else None
+            steps = iter_tweet_ids_user_timeline_page( '', pages[pg_indx], max_tweets, stats=payload['pacing'],
+                on_tweet_id=None if rehydration_stream is None else rehydration_stream.submit )
+            active[pg_indx] = (indx, payload, steps, rehydration_stream)
+            return
+
+    def collect_rehydrations(wait=False):
+        # Results are handed to on_result from this thread, as soon as their rehydration is done
+        for indx in list(rehydrations.keys()):
+            payload, future, rehydration_stream = rehydrations[indx]
+            if( wait is False and future.done() is False ):
+                continue
+            del rehydrations[indx]
+            payload['tweets'] = future.result()
+            results[indx] = payload
+            if( on_result is not None ):
+                on_result(indx, payload)
+
+    try:
+        for _ in range(min(concurrency, len(searches)) - 1):
+            pages.append(browser_dets['context'].new_page())
+
+        for pg_indx in range(len(pages)):
+            start_next(pg_indx)
+
+        while( len(active) != 0 ):
+            # Advance every active search by one scroll, in turn
+            for pg_indx in list(active.keys()):
+                indx, payload, steps, rehydration_stream = active[pg_indx]
+                try:
+                    next(steps)
+                except StopIteration as done:
+                    del active[pg_indx]
+                    rehydrations[indx] = (payload, rehydrator.submit(rehydrate_tweet_ids, done.value, 
+                        stream=rehydration_stream, adaptive_rehydration=adaptive_rehydration), rehydration_stream)
+                    start_next(pg_indx)
+            collect_rehydrations()
+
+        collect_rehydrations(wait=True)
+    finally:
+        # Stop the rehydration streams no one will finish: those of searches still scrolling, and of finished 
+        # searches whose rehydration had not started
+        unfinished = [rehydration_stream for indx, payload, steps, rehydration_stream in active.values()]
+        unfinished += [rehydration_stream for payload, future, rehydration_stream in rehydrations.values() if future.cancel()]
+        for rehydration_stream in unfinished:
+            if( rehydration_stream is not None ):
+                rehydration_stream.close()
+        rehydrator.shutdown(wait=False, cancel_futures=True)
+        # Close the extra pages, keeping the original one open
+        for page in pages[1:]:
+            page.close()
+
+    return results
+
 def try_to_login(page, username, password):
     """
     Attempts to log in to Twitter using the provided credentials.
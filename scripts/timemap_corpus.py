@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import Counter
+from multiprocessing import Pool
+from link_classifier import get_host
+from timemap_store import TIMEMAPS_FOLDER, get_timemap_store, open_timemap_store
+
+"""
+Parsed view of the timemaps directory shared by the analysis functions. Each timemap is parsed once per process; the
+corpus is parsed again only when the directory or one of its timemaps changes. Large directories are parsed by
+a pool of worker processes that each send back a compact summary per timemap instead of the parsed JSON.
+"""
+
+INGEST_PROCESSES = os.cpu_count() or 1
+INGEST_MIN_TIMEMAPS_PER_PROCESS = 200
+INGEST_CHUNKSIZE = 64
+
+_worker_store = None
+
+def _init_worker(timemaps_folder):
+    global _worker_store
+    _worker_store = open_timemap_store(timemaps_folder)
+
+def summarize_stored_timemap(uri_number, store=None):
+    """
+    Parses one stored timemap into a compact summary. Runs in the ingestion worker processes, which open the store
+    once each.
+
+    Argument(s):
+    - uri_number: Integer representing the URI number.
+    - store: TimemapStore to read from. Defaults to the worker process's store.
+
+    Output:
+    Returns a (uri_number, summary, error) tuple. summary is a dictionary with the URI's 'memento_count', 
+    'first_memento', 'last_memento' and 'archive_counts' (archive host -> memento count), or None if the timemap 
+    could not be parsed, in which case error is the error message.
+    """
+    store = _worker_store if store is None else store
+    archive_counts = Counter()
+    try:
+        summary = store.read_summary(uri_number, on_memento=lambda memento: archive_counts.update((get_host(memento['uri']),)))
+    except Exception as e:
+        return uri_number, None, str(e)
+    summary['archive_counts'] = dict(archive_counts)
+    return uri_number, summary, None
+
+def ingest_timemaps(store, uri_numbers, processes=None):
+    """
+    Summarizes stored timemaps with summarize_stored_timemap(), in a process pool when there are enough timemaps to
+    be worth it (INGEST_MIN_TIMEMAPS_PER_PROCESS per process).
+
+    Argument(s):
+    - store: TimemapStore holding the timemaps.
+    - uri_numbers: List of URI numbers, sorted.
+    - processes: Integer representing the number of worker processes. Defaults to INGEST_PROCESSES; 1 parses in 
+      this process.
+
+    Output:
+    Yields the (uri_number, summary, error) tuple of each timemap in the order of uri_numbers, whatever the number
+    of processes.
+    """
+    processes = INGEST_PROCESSES if processes is None else processes
+    processes = max(1, min(processes, len(uri_numbers) // INGEST_MIN_TIMEMAPS_PER_PROCESS))
+    if processes == 1:
+        for uri_number in uri_numbers:
+            yield summarize_stored_timemap(uri_number, store)
+        return
+    with Pool(processes, initializer=_init_worker, initargs=(store.timemaps_folder,)) as workers:
+        yield from workers.imap(summarize_stored_timemap, uri_numbers, chunksize=INGEST_CHUNKSIZE)
+
+class TimemapCorpus:
+    """
+    Per-URI summaries of all timemaps in a directory, whatever its storage backend, in URI number order. Timemaps that cannot be parsed are
+    reported and left out, so all lists have the same length.
+
+    Argument(s):
+    - timemaps_folder: String representing the timemaps directory. Defaults to TIMEMAPS_FOLDER.
+    - processes: Integer representing the number of ingestion processes (see ingest_timemaps()).
+
+    Attributes:
+    - names: List of strings representing the location of each timemap (see TimemapStore.name()).
+    - uri_numbers: List of integers representing the URI numbers.
+    - memento_counts: List of integers representing the memento counts.
+    - earliest_mementos: List of strings representing the earliest memento datetimes (None for URIs without
+      mementos).
+    - latest_mementos: List of strings representing the latest memento datetimes (None for URIs without mementos).
+    - archive_counts: List of dictionaries mapping each archive host to the URI's number of mementos in it.
+    """
+    def __init__(self, timemaps_folder=TIMEMAPS_FOLDER, processes=None):
+        self.timemaps_folder = timemaps_folder
+        store = get_timemap_store(timemaps_folder)
+        self.signature = get_store_signature(store)
+        self.names = []
+        self.uri_numbers = []
+        self.memento_counts = []
+        self.earliest_mementos = []
+        self.latest_mementos = []
+        self.archive_counts = []
+        for uri_number, summary, error in ingest_timemaps(store, store.uri_numbers(), processes=processes):
+            if summary is None:
+                print(f"Error processing {store.name(uri_number)}: {error}")
+                continue
+            self.names.append(store.name(uri_number))
+            self.uri_numbers.append(uri_number)
+            self.memento_counts.append(summary['memento_count'])
+            self.earliest_mementos.append(summary['first_memento'])
+            self.latest_mementos.append(summary['last_memento'])
+            self.archive_counts.append(summary['archive_counts'])
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_stale(self):
+        """
+        Returns True if the timemaps directory changed since the corpus was parsed.
+        """
+        return get_store_signature(get_timemap_store(self.timemaps_folder)) != self.signature
+
+def get_store_signature(store):
+    """
+    Returns a value that changes whenever the backend of a timemaps directory changes or a timemap is added, 
+    removed, replaced or resized.
+    """
+    return (store.backend, store.signature())
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+def get_timemap_corpus(timemaps_folder=TIMEMAPS_FOLDER, processes=None):
+    """
+    Returns the process-wide TimemapCorpus of a directory, parsing the timemaps again only if the directory changed.
+    """
+    with _corpora_lock:
+        corpus = _corpora.get(os.path.abspath(timemaps_folder))
+        if corpus is None or corpus.is_stale():
+            corpus = TimemapCorpus(timemaps_folder, processes=processes)
+            _corpora[os.path.abspath(timemaps_folder)] = corpus
+        return corpus
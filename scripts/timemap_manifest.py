@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import time
+
+"""
+Manifest of the timemap collection. Records the status of every URI in tweet_links.txt (pending, done or failed),
+its retry count and the time of its last attempt, so an interrupted collection resumes where it stopped. For 
+collected URIs it also keeps the memento count and earliest memento of the timemap, which the refresh scheduler in 
+get_timemaps.py uses to decide when a timemap is stale.
+"""
+
+TIMEMAP_MANIFEST_PATH = '../timemaps/manifest.sqlite'
+
+class TimemapManifest:
+    """
+    SQLite-backed timemap collection manifest. Every status change is committed immediately, so the manifest is
+    accurate after a crash.
+
+    Argument(s):
+    - path: String representing the SQLite database file. Defaults to TIMEMAP_MANIFEST_PATH.
+    """
+    def __init__(self, path=TIMEMAP_MANIFEST_PATH):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent != '' and not os.path.exists(parent):
+            os.makedirs(parent)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS uris (
+                uri_number INTEGER PRIMARY KEY,
+                link TEXT NOT NULL,
+                status TEXT NOT NULL,
+                retries INTEGER NOT NULL DEFAULT 0,
+                last_attempt REAL,
+                memento_count INTEGER,
+                first_memento REAL
+            )''')
+        # Manifests created before the timemap summary columns existed
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(uris)')]
+        for column, column_type in (('memento_count', 'INTEGER'), ('first_memento', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE uris ADD COLUMN {column} {column_type}')
+        self._conn.commit()
+
+    def register(self, links, first_uri_number=1):
+        """
+        Adds URIs to the manifest as pending. URIs already in the manifest keep their status, unless the link
+        stored under their number changed, in which case they are reset to pending.
+
+        Argument(s):
+        - links: List of URI strings.
+        - first_uri_number: Integer representing the number of the first URI (its line in tweet_links.txt).
+        """
+        rows = [(first_uri_number + i, link) for i, link in enumerate(links)]
+        self._conn.executemany('''
+            INSERT INTO uris (uri_number, link, status) VALUES (?, ?, 'pending')
+            ON CONFLICT(uri_number) DO UPDATE SET link = excluded.link, status = 'pending', retries = 0, last_attempt = NULL,
+                memento_count = NULL, first_memento = NULL
+            WHERE uris.link != excluded.link''', rows)
+        self._conn.commit()
+
+    def get_status(self, uri_number):
+        """
+        Returns the status of a URI ('pending', 'done' or 'failed'), or None if it is not in the manifest.
+        """
+        row = self._conn.execute('SELECT status FROM uris WHERE uri_number = ?', (uri_number,)).fetchone()
+        return None if row is None else row[0]
+
+    def get_todo(self, max_retries=3, first_uri_number=1):
+        """
+        Lists the URIs that still need to be collected: pending ones, and failed ones with fewer than max_retries
+        retries.
+
+        Output:
+        Returns a list of (uri_number, link) tuples in URI number order.
+        """
+        return self._conn.execute('''
+            SELECT uri_number, link FROM uris
+            WHERE uri_number >= ? AND (status = 'pending' OR (status = 'failed' AND retries < ?))
+            ORDER BY uri_number''', (first_uri_number, max_retries)).fetchall()
+
+    def mark_done(self, uri_number, memento_count=None, first_memento=None, fetched_at=None):
+        """
+        Records a collected timemap.
+
+        Argument(s):
+        - uri_number: Integer representing the URI number.
+        - memento_count: Integer representing the number of mementos in the timemap.
+        - first_memento: Number representing the time (seconds since the epoch) of the earliest memento, or None.
+        - fetched_at: Number representing the time the timemap was fetched. Defaults to now.
+        """
+        self._conn.execute('''
+            UPDATE uris SET status = 'done', retries = 0, last_attempt = ?, memento_count = ?, first_memento = ?
+            WHERE uri_number = ?''',
+            (time.time() if fetched_at is None else fetched_at, memento_count, first_memento, uri_number))
+        self._conn.commit()
+
+    def get_done(self):
+        """
+        Lists the collected URIs.
+
+        Output:
+        Returns a list of (uri_number, link, last_attempt, memento_count, first_memento) tuples in URI number order.
+        memento_count and first_memento are None for URIs recorded without a timemap summary.
+        """
+        return self._conn.execute('''
+            SELECT uri_number, link, last_attempt, memento_count, first_memento FROM uris
+            WHERE status = 'done' ORDER BY uri_number''').fetchall()
+
+    def mark_failed(self, uri_number):
+        self._conn.execute("UPDATE uris SET status = 'failed', retries = retries + 1, last_attempt = ? WHERE uri_number = ?",
+                           (time.time(), uri_number))
+        self._conn.commit()
+
+    def counts(self):
+        """
+        Returns a dictionary with the number of URIs in each status.
+        """
+        return dict(self._conn.execute('SELECT status, COUNT(*) FROM uris GROUP BY status').fetchall())
+
+    def close(self):
+        self._conn.close()
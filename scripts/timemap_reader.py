@@ -0,0 +1,185 @@
+import json
+import os
+import re
+
+"""
+Streaming reader for timemap JSON files. Popular URIs have timemaps with hundreds of thousands of mementos, but the
+analysis mostly needs the memento count and the earliest memento. The reader walks the file in fixed-size chunks and
+decodes one memento at a time, so memory use does not grow with the size of the timemap.
+"""
+
+STREAMING_THRESHOLD = 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_ARRAY_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+class _ChunkedJSONStream:
+    """
+    Cursor over a JSON text file that is read in chunks. Only the unread part of the current chunk is kept.
+    """
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = chunk == ''
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, or '' at the end of the file.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos+1]
+            self._read_more()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the current chunk, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decodes the next JSON value, reading more of the file until the whole value is in the buffer.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_more()
+
+    def members(self):
+        """
+        Iterates over the keys of the object that starts at the cursor. The caller must consume each key's value
+        (with value() or a nested walk) before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def items(self):
+        """
+        Iterates over the elements of the array that starts at the cursor, decoding one element at a time.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        match_separator = _ARRAY_SEPARATOR.match
+        scan_once = _decoder.scan_once
+        while True:
+            # Fast path: decode elements directly from the buffer while they are complete
+            self.peek()
+            buffer, pos = self.buffer, self.pos
+            while True:
+                try:
+                    value, end = scan_once(buffer, pos)
+                except (StopIteration, json.JSONDecodeError):
+                    break
+                separator = match_separator(buffer, end)
+                # The separator is only certain once the next element has started in the buffer
+                if separator is None or separator.end() == len(buffer):
+                    break
+                pos = separator.end()
+                self.pos = pos
+                yield value
+                if separator.group(1) == ']':
+                    return
+
+            # The element or its separator runs past the buffer
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+def _summarize(uri_info, on_memento=None):
+    summary = {'original_uri': uri_info.get('original_uri'), 'memento_count': 0, 'first_memento': None,
+               'last_memento': None}
+    if 'mementos' in uri_info:
+        memento_list = uri_info['mementos'].get('list', [])
+        summary['memento_count'] = len(memento_list)
+        # 'first' and 'last' are optional, as in _stream_summary()
+        summary['first_memento'] = uri_info['mementos'].get('first', {}).get('datetime')
+        summary['last_memento'] = uri_info['mementos'].get('last', {}).get('datetime')
+        if on_memento is not None:
+            for memento in memento_list:
+                on_memento(memento)
+    return summary
+
+def _stream_summary(file, on_memento=None, chunk_size=CHUNK_SIZE):
+    stream = _ChunkedJSONStream(file, chunk_size=chunk_size)
+    summary = {'original_uri': None, 'memento_count': 0, 'first_memento': None, 'last_memento': None}
+    for key in stream.members():
+        if key != 'mementos':
+            value = stream.value()
+            if key == 'original_uri':
+                summary['original_uri'] = value
+            continue
+
+        for mementos_key in stream.members():
+            if mementos_key == 'list':
+                for memento in stream.items():
+                    summary['memento_count'] += 1
+                    if on_memento is not None:
+                        on_memento(memento)
+            elif mementos_key in ('first', 'last'):
+                summary[f'{mementos_key}_memento'] = stream.value()['datetime']
+            else:
+                stream.value()
+    return summary
+
+def read_timemap_summary(filename, on_memento=None, streaming_threshold=STREAMING_THRESHOLD, chunk_size=CHUNK_SIZE):
+    """
+    Reads the summary fields of one timemap JSON file. Files larger than streaming_threshold bytes are streamed,
+    smaller ones are loaded with json.load.
+
+    Argument(s):
+    - filename: String representing filename.
+    - on_memento: Optional function called with each memento dictionary ({'datetime': ..., 'uri': ...}) in the
+      order of the timemap.
+    - streaming_threshold: Integer representing the file size (bytes) from which the file is streamed.
+    - chunk_size: Integer representing the number of characters read at a time when streaming.
+
+    Output:
+    Returns a dictionary with keys 'original_uri', 'memento_count', 'first_memento' and 'last_memento' (datetime
+    strings such as '2020-04-09T12:13:57Z', or None if the URI has no mementos).
+    """
+    with open(filename, 'r') as file:
+        return read_timemap_summary_from(file, os.path.getsize(filename), on_memento, streaming_threshold, chunk_size)
+
+def read_timemap_summary_from(file, size, on_memento=None, streaming_threshold=STREAMING_THRESHOLD, chunk_size=CHUNK_SIZE):
+    """
+    Same as read_timemap_summary(), for a timemap that is already open as a text file object (e.g. a record of a 
+    compressed timemap shard). size is the uncompressed size of the timemap in bytes.
+    """
+    if size < streaming_threshold:
+        return _summarize(json.load(file), on_memento)
+    return _stream_summary(file, on_memento, chunk_size=chunk_size)
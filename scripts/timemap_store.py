@@ -0,0 +1,442 @@
+import argparse
+import glob
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from timemap_reader import read_timemap_summary_from
+
+"""
+Storage backends for the collected timemaps. The default backend keeps one pretty-printed uri{n}.json file per URI
+in the timemaps directory. The sharded backend packs timemaps into compressed JSONL shards (one gzip member per
+timemap) with a small binary offset index per shard, so a timemap can be read by URI number without scanning the
+shard, and the directory holds a few large files instead of one file per URI.
+
+The backend of a timemaps directory is recorded in its store.json file; directories without one use the default
+backend. get_timemap_store() picks the right backend, so save_timemaps(), the memento table and the analysis read
+and write timemaps the same way with either. Convert an existing directory with:
+
+    python timemap_store.py migrate
+"""
+
+TIMEMAPS_FOLDER = '../timemaps'
+STORE_CONFIG = 'store.json'
+SHARD_MAX_BYTES = 64 * 1024 * 1024
+
+def timemap_uri_number(filename):
+    """
+    Returns the URI number of a timemap file name such as 'timemaps/uri12.json'.
+    """
+    return int(os.path.basename(filename).split('uri')[1].split('.')[0])
+
+def list_timemap_files(timemaps_folder=TIMEMAPS_FOLDER):
+    """
+    Returns the timemap files of a directory sorted by URI number.
+    """
+    return sorted(glob.glob(os.path.join(timemaps_folder, 'uri*.json')), key=timemap_uri_number)
+
+class TimemapStore(ABC):
+    """
+    Base class of the timemap storage backends. Timemaps are addressed by URI number and stored as JSON text.
+    Backends implement the abstract methods; read() and read_summary() are built on open().
+    """
+    backend = None
+
+    @abstractmethod
+    def uri_numbers(self):
+        """
+        Returns the sorted list of URI numbers with a stored timemap.
+        """
+        pass
+
+    @abstractmethod
+    def __contains__(self, uri_number):
+        pass
+
+    @abstractmethod
+    def name(self, uri_number):
+        """
+        Returns a readable location of a timemap, for messages.
+        """
+        pass
+
+    @abstractmethod
+    def open(self, uri_number):
+        """
+        Opens a stored timemap for reading. Returns a (text file object, uncompressed size in bytes) tuple.
+        """
+        pass
+
+    @abstractmethod
+    def modified_time(self, uri_number):
+        """
+        Returns the time (seconds since the epoch) a timemap was last written.
+        """
+        pass
+
+    @abstractmethod
+    def write(self, uri_number, json_content):
+        """
+        Stores the timemap of a URI, replacing any previous one. An interruption never leaves a partial timemap.
+        """
+        pass
+
+    @abstractmethod
+    def signature(self):
+        """
+        Returns a value that changes whenever a timemap is added, replaced or removed.
+        """
+        pass
+
+    def read(self, uri_number):
+        """
+        Returns the JSON text of a stored timemap. Raises KeyError if the URI has no stored timemap.
+        """
+        file, size = self.open(uri_number)
+        with file:
+            return file.read()
+
+    def read_summary(self, uri_number, on_memento=None):
+        """
+        Returns timemap_reader.read_timemap_summary_from() of a stored timemap. Raises KeyError if the URI has no
+        stored timemap and ValueError if it is not valid JSON.
+        """
+        file, size = self.open(uri_number)
+        with file:
+            return read_timemap_summary_from(file, size, on_memento)
+
+class DirectoryTimemapStore(TimemapStore):
+    """
+    Default backend: one uri{n}.json file per URI.
+
+    Argument(s):
+    - timemaps_folder: String representing the timemaps directory.
+    """
+    backend = 'directory'
+
+    def __init__(self, timemaps_folder=TIMEMAPS_FOLDER):
+        self.timemaps_folder = timemaps_folder
+
+    def _path(self, uri_number):
+        return os.path.join(self.timemaps_folder, f"uri{uri_number}.json")
+
+    def uri_numbers(self):
+        return [timemap_uri_number(tm_file) for tm_file in list_timemap_files(self.timemaps_folder)]
+
+    def __contains__(self, uri_number):
+        return os.path.exists(self._path(uri_number))
+
+    def name(self, uri_number):
+        return self._path(uri_number)
+
+    def open(self, uri_number):
+        try:
+            return open(self._path(uri_number), 'r'), os.path.getsize(self._path(uri_number))
+        except FileNotFoundError:
+            raise KeyError(uri_number)
+
+    def modified_time(self, uri_number):
+        return os.path.getmtime(self._path(uri_number))
+
+    def write(self, uri_number, json_content):
+        # Write and flush a temporary file, then rename it over the timemap
+        json_filename = self._path(uri_number)
+        tmp_filename = json_filename + ".tmp"
+        with open(tmp_filename, "w") as json_file:
+            json_file.write(json_content)
+            json_file.flush()
+            os.fsync(json_file.fileno())
+        os.replace(tmp_filename, json_filename)
+
+    def signature(self):
+        if not os.path.isdir(self.timemaps_folder):
+            return None
+        with os.scandir(self.timemaps_folder) as entries:
+            files = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries
+                           if entry.name.startswith('uri') and entry.name.endswith('.json'))
+        return (os.stat(self.timemaps_folder).st_mtime_ns, tuple(files))
+
+INDEX_COLUMNS = ('uri_number', 'offset', 'length', 'size', 'written_at')
+
+class ShardedTimemapStore(TimemapStore):
+    """
+    Sharded backend: timemaps are appended to shard{k}.jsonl.gz files as compact JSON lines, each compressed as its
+    own gzip member, so the shards are also valid JSONL gzip files. For every record, shard{k}.idx gets one row of
+    INDEX_COLUMNS int64 values: URI number, byte offset and length of the gzip member, uncompressed size and write
+    time. A new shard is started once the current one reaches shard_max_bytes. Replacing a timemap appends a new
+    record, and the last record of a URI wins.
+
+    Records are fsynced before their index rows, so after a crash a shard can only contain an unindexed tail, which
+    is ignored; index rows that point past the end of their shard are ignored too.
+
+    Argument(s):
+    - timemaps_folder: String representing the timemaps directory.
+    - shard_max_bytes: Integer representing the size at which a new shard is started.
+    """
+    backend = 'sharded'
+
+    def __init__(self, timemaps_folder=TIMEMAPS_FOLDER, shard_max_bytes=SHARD_MAX_BYTES):
+        self.timemaps_folder = timemaps_folder
+        self.shard_max_bytes = shard_max_bytes
+        self._lock = threading.Lock()
+        self._load()
+
+    def _shard_path(self, shard, extension):
+        return os.path.join(self.timemaps_folder, f"shard{shard}.{extension}")
+
+    def _shard_numbers(self):
+        index_files = glob.glob(os.path.join(self.timemaps_folder, 'shard*.idx'))
+        return sorted(int(os.path.basename(index_file)[len('shard'):-len('.idx')]) for index_file in index_files)
+
+    def _load(self):
+        rows = []
+        for shard in self._shard_numbers():
+            index = np.fromfile(self._shard_path(shard, 'idx'), dtype=np.int64)
+            # Drop a torn last row and rows whose record did not reach the shard
+            index = index[:len(index) - len(index) % len(INDEX_COLUMNS)].reshape(-1, len(INDEX_COLUMNS))
+            shard_filename = self._shard_path(shard, 'jsonl.gz')
+            shard_size = os.path.getsize(shard_filename) if os.path.exists(shard_filename) else 0
+            index = index[index[:, 1] + index[:, 2] <= shard_size]
+            rows.append(np.column_stack([index, np.full(len(index), shard, dtype=np.int64)]))
+        self._index = np.empty((0, len(INDEX_COLUMNS) + 1), dtype=np.int64)
+        self._merge_rows(rows)
+        shards = self._shard_numbers()
+        self._current_shard = shards[-1] if shards != [] else 0
+        self._signature = self.signature()
+
+    def _merge_rows(self, rows):
+        # Keep the last record of each URI: stable sort by URI number, then take the last row of each run
+        rows = np.concatenate([self._index] + rows)
+        rows = rows[np.argsort(rows[:, 0], kind='stable')]
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = rows[1:, 0] != rows[:-1, 0]
+        self._index = rows[last]
+
+    def refresh(self):
+        """
+        Reloads the index if another process wrote to the store.
+        """
+        with self._lock:
+            if self.signature() != self._signature:
+                self._load()
+
+    def _find(self, uri_number):
+        position = np.searchsorted(self._index[:, 0], uri_number)
+        if position == len(self._index) or self._index[position, 0] != uri_number:
+            raise KeyError(uri_number)
+        return self._index[position]
+
+    def uri_numbers(self):
+        return self._index[:, 0].tolist()
+
+    def __contains__(self, uri_number):
+        try:
+            self._find(uri_number)
+            return True
+        except KeyError:
+            return False
+
+    def name(self, uri_number):
+        row = self._find(uri_number)
+        return f"{self._shard_path(row[5], 'jsonl.gz')}#uri{uri_number}"
+
+    def open(self, uri_number):
+        uri_number, offset, length, size, written_at, shard = self._find(uri_number)
+        with open(self._shard_path(shard, 'jsonl.gz'), 'rb') as shard_file:
+            shard_file.seek(offset)
+            member = shard_file.read(length)
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(member)), encoding='utf-8'), int(size)
+
+    def modified_time(self, uri_number):
+        return float(self._find(uri_number)[4])
+
+    def write(self, uri_number, json_content):
+        self.write_many([(uri_number, json_content)])
+
+    def write_many(self, timemaps):
+        """
+        Stores several timemaps, with one fsync per shard and index file instead of one per timemap.
+
+        Argument(s):
+        - timemaps: Iterable of (uri_number, json_content) tuples.
+        """
+        with self._lock:
+            rows = []
+            shard_rows = []
+            shard_file = None
+            try:
+                for uri_number, json_content in timemaps:
+                    # One compact JSON line per timemap, compressed as its own gzip member
+                    line = (json.dumps(json.loads(json_content), separators=(',', ':')) + '\n').encode('utf-8')
+                    member = gzip.compress(line, mtime=0)
+
+                    if shard_file is None or shard_file.tell() >= self.shard_max_bytes:
+                        if shard_file is not None:
+                            self._commit_shard(shard_file, shard_rows)
+                            rows += shard_rows
+                            shard_rows = []
+                            shard_file = None
+                        shard_filename = self._shard_path(self._current_shard, 'jsonl.gz')
+                        if os.path.exists(shard_filename) and os.path.getsize(shard_filename) >= self.shard_max_bytes:
+                            self._current_shard += 1
+                        self._repair_shard(self._current_shard)
+                        shard_file = open(self._shard_path(self._current_shard, 'jsonl.gz'), 'ab')
+
+                    offset = shard_file.tell()
+                    shard_file.write(member)
+                    shard_rows.append([uri_number, offset, len(member), len(line), int(time.time()), self._current_shard])
+            finally:
+                if shard_file is not None:
+                    self._commit_shard(shard_file, shard_rows)
+                    rows += shard_rows
+                if rows != []:
+                    self._merge_rows([np.array(rows, dtype=np.int64)])
+                self._signature = self.signature()
+
+    def _repair_shard(self, shard):
+        # Cut a torn index row and an unindexed shard tail left by a crash before appending to them
+        index_filename = self._shard_path(shard, 'idx')
+        shard_filename = self._shard_path(shard, 'jsonl.gz')
+        row_bytes = len(INDEX_COLUMNS) * 8
+        if os.path.exists(index_filename) and os.path.getsize(index_filename) % row_bytes != 0:
+            os.truncate(index_filename, os.path.getsize(index_filename) // row_bytes * row_bytes)
+        if not os.path.exists(shard_filename):
+            return
+        index = np.fromfile(index_filename, dtype=np.int64).reshape(-1, len(INDEX_COLUMNS)) if os.path.exists(index_filename) else np.empty((0, len(INDEX_COLUMNS)), dtype=np.int64)
+        complete = index[:, 1] + index[:, 2] <= os.path.getsize(shard_filename)
+        if not complete.all():
+            # Rows of records that were cut off would point into the records appended next
+            index = index[complete]
+            with open(index_filename + '.tmp', 'wb') as index_file:
+                index_file.write(index.tobytes())
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            os.replace(index_filename + '.tmp', index_filename)
+        indexed_end = int((index[:, 1] + index[:, 2]).max()) if len(index) != 0 else 0
+        if os.path.getsize(shard_filename) > indexed_end:
+            os.truncate(shard_filename, indexed_end)
+
+    def _commit_shard(self, shard_file, shard_rows):
+        # Records reach the disk before the index rows that point to them
+        shard_file.flush()
+        os.fsync(shard_file.fileno())
+        shard_file.close()
+        with open(self._shard_path(self._current_shard, 'idx'), 'ab') as index_file:
+            index_file.write(np.array(shard_rows, dtype=np.int64).reshape(-1, len(INDEX_COLUMNS) + 1)[:, :len(INDEX_COLUMNS)].tobytes())
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+    def signature(self):
+        files = []
+        for shard in self._shard_numbers():
+            stat = os.stat(self._shard_path(shard, 'idx'))
+            files.append((shard, stat.st_size, stat.st_mtime_ns))
+        return tuple(files)
+
+def read_store_config(timemaps_folder=TIMEMAPS_FOLDER):
+    """
+    Returns the store.json settings of a timemaps directory, or the default backend's settings if it has none.
+    """
+    config_path = os.path.join(timemaps_folder, STORE_CONFIG)
+    if not os.path.exists(config_path):
+        return {'backend': DirectoryTimemapStore.backend}
+    with open(config_path, 'r') as file:
+        return json.load(file)
+
+def write_store_config(timemaps_folder, config):
+    config_path = os.path.join(timemaps_folder, STORE_CONFIG)
+    with open(config_path + '.tmp', 'w') as file:
+        json.dump(config, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(config_path + '.tmp', config_path)
+
+def open_timemap_store(timemaps_folder=TIMEMAPS_FOLDER):
+    """
+    Opens a timemaps directory with the backend recorded in its store.json.
+    """
+    config = read_store_config(timemaps_folder)
+    if config['backend'] == ShardedTimemapStore.backend:
+        return ShardedTimemapStore(timemaps_folder, shard_max_bytes=config.get('shard_max_bytes', SHARD_MAX_BYTES))
+    if config['backend'] == DirectoryTimemapStore.backend:
+        return DirectoryTimemapStore(timemaps_folder)
+    raise ValueError(f"Unknown timemap store backend: {config['backend']}")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_timemap_store(timemaps_folder=TIMEMAPS_FOLDER):
+    """
+    Returns the process-wide TimemapStore of a timemaps directory, reopening it if its backend changed and reloading
+    the shard index if another process wrote to it.
+    """
+    with _stores_lock:
+        store = _stores.get(os.path.abspath(timemaps_folder))
+        if store is None or store.backend != read_store_config(timemaps_folder)['backend']:
+            store = open_timemap_store(timemaps_folder)
+            _stores[os.path.abspath(timemaps_folder)] = store
+    if isinstance(store, ShardedTimemapStore):
+        store.refresh()
+    return store
+
+def migrate_timemaps(timemaps_folder=TIMEMAPS_FOLDER, remove=False, shard_max_bytes=SHARD_MAX_BYTES):
+    """
+    Converts a directory of uri{n}.json files to the sharded backend. Every timemap is read back from its shard and
+    compared with the original before store.json switches the directory to the sharded backend. Files that are not
+    valid JSON (e.g. left empty by an interrupted collection) are skipped and reported, so save_timemaps() collects
+    them again.
+
+    Argument(s):
+    - timemaps_folder: String representing the timemaps directory.
+    - remove: Boolean, if True the uri{n}.json files are deleted once the migration is complete.
+    - shard_max_bytes: Integer representing the size at which a new shard is started.
+
+    Output:
+    Returns the number of timemaps migrated.
+    """
+    if read_store_config(timemaps_folder)['backend'] == ShardedTimemapStore.backend:
+        print(f"{timemaps_folder} already uses the sharded backend")
+        return 0
+
+    source = DirectoryTimemapStore(timemaps_folder)
+    target = ShardedTimemapStore(timemaps_folder, shard_max_bytes=shard_max_bytes)
+    migrated = []
+
+    def valid_timemaps():
+        for uri_number in source.uri_numbers():
+            json_content = source.read(uri_number)
+            try:
+                json.loads(json_content)
+            except ValueError:
+                print(f"Skipping {source.name(uri_number)}: not valid JSON")
+                continue
+            migrated.append(uri_number)
+            yield uri_number, json_content
+
+    target.write_many(valid_timemaps())
+
+    # Verify every record before switching backends
+    for uri_number in migrated:
+        if json.loads(target.read(uri_number)) != json.loads(source.read(uri_number)):
+            raise RuntimeError(f"Timemap {uri_number} differs after migration; {timemaps_folder} was left unchanged")
+    write_store_config(timemaps_folder, {'backend': ShardedTimemapStore.backend, 'shard_max_bytes': shard_max_bytes})
+    print(f"Migrated {len(migrated)} timemaps to {len(target._shard_numbers())} shards")
+
+    if remove:
+        for uri_number in migrated:
+            os.remove(source.name(uri_number))
+    return len(migrated)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the storage backend of the timemaps directory.")
+    parser.add_argument("command", choices=['migrate'], help="migrate: convert uri{n}.json files to compressed shards")
+    parser.add_argument("--timemaps_folder", default=TIMEMAPS_FOLDER, help=f"Timemaps directory (default: {TIMEMAPS_FOLDER})")
+    parser.add_argument("--remove", action="store_true", help="Delete the uri{n}.json files after a successful migration")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_timemaps(args.timemaps_folder, remove=args.remove)
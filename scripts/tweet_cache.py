@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""
+On-disk cache of rehydrated tweets keyed by tweet ID. Lets repeated search rounds and later runs of main.py skip the
+syndication request for tweets that were already rehydrated. Tweets that could not be rehydrated because they were
+deleted or protected are kept in a negative cache with a shorter TTL.
+"""
+
+TWEET_CACHE_PATH = '../tweet_cache.sqlite'
+TWEET_CACHE_TTL = 30 * 24 * 60 * 60
+TWEET_CACHE_NEGATIVE_TTL = 24 * 60 * 60
+
+class TweetCache:
+    """
+    SQLite-backed cache of rehydrated tweets. Safe to share between threads.
+
+    Argument(s):
+    - path: String representing the SQLite database file. Defaults to TWEET_CACHE_PATH.
+    - ttl: Number of seconds a rehydrated tweet stays valid.
+    - negative_ttl: Number of seconds a deleted/protected tweet stays valid.
+    """
+    def __init__(self, path=TWEET_CACHE_PATH, ttl=TWEET_CACHE_TTL, negative_ttl=TWEET_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'stored': 0}
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(path)
+        if parent != '' and not os.path.exists(parent):
+            os.makedirs(parent)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS tweets (
+                tid TEXT PRIMARY KEY,
+                tweet TEXT,
+                negative INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )''')
+        self._conn.commit()
+
+    def get_many(self, tids):
+        """
+        Looks up several tweet IDs at once.
+
+        Argument(s):
+        - tids: List of tweet ID strings.
+
+        Output:
+        Returns a dictionary mapping each tweet ID found in the cache and not expired to its tweet dictionary.
+        Deleted/protected tweets map to an empty dictionary.
+        """
+        found = {}
+        now = time.time()
+        unique_tids = list(dict.fromkeys(tids))
+        with self._lock:
+            # Query in chunks to stay under SQLite's bound parameter limit
+            for i in range(0, len(unique_tids), 500):
+                chunk = unique_tids[i:i+500]
+                rows = self._conn.execute(
+                    f"SELECT tid, tweet, negative, fetched_at FROM tweets WHERE tid IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for tid, tweet, negative, fetched_at in rows:
+                    ttl = self.negative_ttl if negative else self.ttl
+                    if now - fetched_at > ttl:
+                        self.stats['expired'] += 1
+                        continue
+                    found[tid] = {} if negative else json.loads(tweet)
+
+            for tid in unique_tids:
+                if tid not in found:
+                    self.stats['misses'] += 1
+                elif found[tid] == {}:
+                    self.stats['negative_hits'] += 1
+                else:
+                    self.stats['hits'] += 1
+        return found
+
+    def get(self, tid):
+        """
+        Looks up one tweet ID. Returns the cached tweet dictionary (empty if the tweet is deleted/protected), or
+        None if the tweet ID is not cached or has expired.
+        """
+        return self.get_many([tid]).get(tid)
+
+    def put_many(self, entries):
+        """
+        Stores rehydration results.
+
+        Argument(s):
+        - entries: List of (tid, tweet, negative) tuples. tweet is the rehydrated tweet dictionary without 'notes'
+          and negative is True for tweets that are deleted or protected.
+        """
+        now = time.time()
+        rows = [(tid, None if negative else json.dumps(tweet, ensure_ascii=False), int(negative), now)
+                for tid, tweet, negative in entries]
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO tweets VALUES (?, ?, ?, ?)', rows)
+            self._conn.commit()
+            self.stats['stored'] += len(rows)
+
+    def put(self, tid, tweet, negative=False):
+        """
+        Stores the rehydration result for one tweet ID.
+        """
+        self.put_many([(tid, tweet, negative)])
+
+    def purge_expired(self):
+        """
+        Deletes expired entries from the database. Returns the number of rows removed.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                'DELETE FROM tweets WHERE (negative = 0 AND fetched_at < ?) OR (negative = 1 AND fetched_at < ?)',
+                (now - self.ttl, now - self.negative_ttl)
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def is_negative_result(status_code, tweet):
+    """
+    Decides if a syndication response means the tweet is gone (deleted, protected or suspended) rather than a
+    transient failure: a 404, or a tombstone in place of the tweet. Only these results and successful ones are 
+    cached. An empty tweet with a 200 status is a response that could not be parsed (e.g. an HTML error page or a
+    truncated body), which is transient.
+
+    Argument(s):
+    - status_code: Integer HTTP status of the response, or None if no response was received.
+    - tweet: Dictionary parsed from the response.
+
+    Output:
+    Returns True if the result should be negatively cached.
+    """
+    if status_code == 404:
+        return True
+    if status_code == 200:
+        return tweet.get('__typename') == 'TweetTombstone'
+    return False
+
+def store_rehydration_results(cache, results):
+    """
+    Adds the cacheable rehydration results to a TweetCache: successful tweets and tweets that are gone. Transient
+    failures (timeouts, 429, 5xx, unparseable responses) are skipped so they are retried on the next run.
+
+    Argument(s):
+    - cache: TweetCache object.
+    - results: List of (tid, status_code, tweet) tuples, where tweet does not contain 'notes'.
+    """
+    entries = []
+    for tid, status_code, tweet in results:
+        if is_negative_result(status_code, tweet):
+            entries.append((tid, {}, True))
+        elif status_code == 200 and len(tweet) != 0:
+            entries.append((tid, tweet, False))
+
+    if len(entries) != 0:
+        cache.put_many(entries)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_tweet_cache():
+    """
+    Returns the process-wide TweetCache stored at TWEET_CACHE_PATH, opening it on first use.
+    """
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TweetCache()
+        return _default_cache
@@ -0,0 +1,128 @@
+import glob
+import os
+import numpy as np
+from tweet_shard_index import NO_ID, get_tweet_shard_index
+
+"""
+Persistent set of the IDs of all tweets stored in the scraped_tweets shards, used to drop tweets that were already
+collected (by another search round, topic or retry) when SERP files are combined into a shard. The IDs are kept as
+a sorted int64 array in scraped_tweets/tweet_ids.npz, along with the size of each shard they were read from. If a
+shard changed without the set being updated, the set is rebuilt from the shard indexes (see tweet_shard_index.py).
+"""
+
+TWEET_ID_SET_FILENAME = 'tweet_ids.npz'
+
+def list_shards(jsonl_tweets_folder):
+    """
+    Returns the paths of the scraped_tweets shards of a folder.
+    """
+    return sorted(glob.glob(os.path.join(jsonl_tweets_folder, 'scraped_tweets*.json.gz')))
+
+def _sorted_unique(ids):
+    # np.unique is much slower than a sort on large int64 arrays with this NumPy
+    ids = np.sort(ids)
+    keep = np.ones(len(ids), dtype=bool)
+    keep[1:] = ids[1:] != ids[:-1]
+    return ids[keep & (ids != NO_ID)]
+
+class TweetIDSet:
+    """
+    Sorted int64 array of tweet IDs with the sizes of the shards it covers.
+
+    Argument(s):
+    - jsonl_tweets_folder: Directory of the scraped_tweets shards.
+
+    Attributes:
+    - ids: Sorted int64 array of unique tweet IDs.
+    - shard_sizes: Dictionary mapping each shard's file name to its size in bytes when its IDs were added.
+    """
+    def __init__(self, jsonl_tweets_folder):
+        self.jsonl_tweets_folder = jsonl_tweets_folder
+        self.path = os.path.join(jsonl_tweets_folder, TWEET_ID_SET_FILENAME)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.shard_sizes = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, tweet_id):
+        return bool(self.contains_many([tweet_id])[0])
+
+    def contains_many(self, tweet_ids):
+        """
+        Returns a boolean array, True for each ID of tweet_ids that is in the set.
+        """
+        tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, tweet_ids)
+        found = np.zeros(len(tweet_ids), dtype=bool)
+        in_range = positions < len(self.ids)
+        found[in_range] = self.ids[positions[in_range]] == tweet_ids[in_range]
+        return found
+
+    def add(self, tweet_ids):
+        """
+        Adds tweet IDs to the set. NO_ID values are ignored.
+        """
+        tweet_ids = _sorted_unique(np.asarray(tweet_ids, dtype=np.int64))
+        tweet_ids = tweet_ids[~self.contains_many(tweet_ids)]
+        # Both arrays are sorted, so the stable sort (timsort) only has to merge two runs
+        self.ids = np.sort(np.concatenate([self.ids, tweet_ids]), kind='stable')
+
+    def add_shard(self, shard_index):
+        """
+        Adds the tweets of a shard, given its TweetShardIndex, and records the shard's size.
+        """
+        self.add(shard_index.ids)
+        self.shard_sizes[os.path.basename(shard_index.shard_path)] = shard_index.shard_size
+
+    def is_current(self):
+        """
+        Returns True if the set covers every shard of the folder as it is now.
+        """
+        shard_sizes = {os.path.basename(path): os.path.getsize(path) for path in list_shards(self.jsonl_tweets_folder)}
+        return shard_sizes == self.shard_sizes
+
+    def rebuild(self):
+        """
+        Reads the IDs of every shard from the shard indexes.
+        """
+        self.__init__(self.jsonl_tweets_folder)
+        shard_indexes = [get_tweet_shard_index(path) for path in list_shards(self.jsonl_tweets_folder)]
+        self.ids = _sorted_unique(np.concatenate([self.ids] + [shard_index.ids for shard_index in shard_indexes]))
+        self.shard_sizes = {os.path.basename(shard_index.shard_path): shard_index.shard_size for shard_index in shard_indexes}
+
+    def save(self):
+        """
+        Writes the set to the folder, replacing the previous one atomically.
+        """
+        names = sorted(self.shard_sizes)
+        with open(self.path + '.tmp', 'wb') as file:
+            np.savez(file, ids=self.ids, shard_names=np.array(names, dtype=str),
+                     shard_sizes=np.array([self.shard_sizes[name] for name in names], dtype=np.int64))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    @classmethod
+    def load(cls, jsonl_tweets_folder):
+        """
+        Reads the set saved in a folder as it is, or returns an empty set if there is none or it cannot be read.
+        """
+        id_set = cls(jsonl_tweets_folder)
+        try:
+            with np.load(id_set.path) as columns:
+                id_set.ids = columns['ids']
+                id_set.shard_sizes = dict(zip(columns['shard_names'].tolist(), columns['shard_sizes'].tolist()))
+        except (OSError, ValueError, KeyError):
+            return cls(jsonl_tweets_folder)
+        return id_set
+
+def get_tweet_id_set(jsonl_tweets_folder):
+    """
+    Returns the ID set of a folder, rebuilding and saving it first if it does not cover the shards as they are now.
+    """
+    id_set = TweetIDSet.load(jsonl_tweets_folder)
+    if not id_set.is_current():
+        id_set.rebuild()
+        id_set.save()
+    return id_set
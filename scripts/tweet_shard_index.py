@@ -0,0 +1,491 @@
+import gzip
+import json
+import os
+import shutil
+import zlib
+import numpy as np
+
+"""
+Sidecar index of the scraped_tweets{n}.json.gz shards. For every shard, scraped_tweets{n}.idx.npz records the tweet
+ID and whether the tweet has URLs for each line, and seek checkpoints: offsets of gzip members that start on a line
+boundary, with the number of the first line in each. Tweet counts are read from the index, and readers decompress
+only from the checkpoint before the lines they need.
+
+Shards written with TweetShardWriter start a new gzip member every CHECKPOINT_LINES lines and are indexed as they
+are written. Other shards are indexed on first read. Appending gzip members to a shard (e.g. gzip.open(..., 'at'))
+keeps the indexed part valid, so only the appended members are read when the index is updated. A shard that ends
+with a truncated member (a writer interrupted while appending) cannot be indexed until it is repaired, which
+TweetShardWriter does before appending to it.
+"""
+
+CHECKPOINT_LINES = 1000
+READ_SIZE = 1024 * 1024
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+NO_ID = -1
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+def get_index_path(shard_path):
+    """
+    Returns the path of a shard's sidecar index (scraped_tweets{n}.json.gz -> scraped_tweets{n}.idx.npz).
+    """
+    base = shard_path[:-len('.json.gz')] if shard_path.endswith('.json.gz') else shard_path
+    return base + '.idx.npz'
+
+def parse_tweet_line(line):
+    """
+    Returns the (tweet ID, has URLs) pair of one shard line, or (NO_ID, False) if the line is not a tweet.
+    """
+    try:
+        tweet = json.loads(line)
+        return int(tweet['id_str']), tweet['entities']['urls'] != []
+    except (ValueError, KeyError, TypeError):
+        return NO_ID, False
+
+def _read_tail(file, size):
+    # The last bytes of a gzip file are the CRC and length of its last member
+    file.seek(max(size - 8, 0))
+    return file.read(8)
+
+def _iter_members(file, offset):
+    """
+    Decompresses the gzip members of a file from offset, which must be the start of a member or of the zero padding
+    before one. Raises EOFError if the last member is truncated.
+
+    Output:
+    Yields (member_offset, data) pairs: member_offset is the offset of the member that starts at this point of the
+    data, or None inside a member.
+    """
+    file.seek(offset)
+    decompressor = None
+    pending = b''
+    while True:
+        if decompressor is None:
+            # Zero padding between members is skipped, as gzip.open does
+            while len(pending.lstrip(b'\x00')) < 2:
+                more = file.read(READ_SIZE)
+                if more == b'':
+                    break
+                pending += more
+            offset += len(pending) - len(pending.lstrip(b'\x00'))
+            pending = pending.lstrip(b'\x00')
+            # Trailing bytes that are not a gzip member are ignored
+            if not pending.startswith(_GZIP_MAGIC):
+                return
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            yield offset, b''
+        chunk = pending or file.read(READ_SIZE)
+        pending = b''
+        if chunk == b'':
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        data = decompressor.decompress(chunk)
+        if data:
+            yield None, data
+        offset += len(chunk)
+        if decompressor.eof:
+            pending = decompressor.unused_data
+            offset -= len(pending)
+            decompressor = None
+
+def read_members(data):
+    """
+    Splits the content of a small gzip file, read whole, into its members. Zero padding between members is skipped.
+    Raises EOFError if the last member is truncated and zlib.error if the file has bytes that are not gzip members.
+
+    Output:
+    Returns a list of (offset, length, content) tuples: the position and compressed size of each member in data,
+    and its decompressed bytes.
+    """
+    members = []
+    offset = len(data) - len(data.lstrip(b'\x00'))
+    while offset < len(data):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        content = decompressor.decompress(data[offset:])
+        if not decompressor.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        rest = decompressor.unused_data
+        members.append((offset, len(data) - offset - len(rest), content))
+        offset = len(data) - len(rest.lstrip(b'\x00'))
+    return members
+
+def _iter_lines(file, offset):
+    """
+    Yields (member_offset, line) pairs for the lines stored from offset, where member_offset is set when a gzip
+    member starts with the line.
+    """
+    rest = b''
+    boundary = None
+    for member_offset, data in _iter_members(file, offset):
+        if member_offset is not None:
+            # A member only makes a checkpoint if it starts a new line
+            boundary = member_offset if rest == b'' else None
+            continue
+        lines = (rest + data).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield boundary, line + b'\n'
+            boundary = None
+    if rest != b'':
+        yield boundary, rest
+
+class TweetShardIndex:
+    """
+    Index of one scraped_tweets shard.
+
+    Attributes:
+    - shard_path: String representing the shard file.
+    - ids: int64 array with the tweet ID of each line (NO_ID for lines that are not tweets).
+    - has_urls: Boolean array, True for lines whose tweet has at least one URL.
+    - checkpoint_offsets: int64 array with the offsets of the gzip members that start on a line boundary.
+    - checkpoint_lines: int64 array with the (0-based) line number each checkpoint starts with.
+    - shard_size: Integer representing the size in bytes of the shard when it was indexed.
+    - shard_tail: bytes, the last 8 bytes of the shard when it was indexed.
+    """
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.ids = np.empty(0, dtype=np.int64)
+        self.has_urls = np.empty(0, dtype=bool)
+        self.checkpoint_offsets = np.empty(0, dtype=np.int64)
+        self.checkpoint_lines = np.empty(0, dtype=np.int64)
+        self.shard_size = 0
+        self.shard_tail = b''
+
+    @property
+    def line_count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def unique_tweet_count(self):
+        """
+        Returns the number of distinct tweets in the shard (lines that are not tweets are not counted).
+        """
+        ids = np.sort(self.ids[self.ids != NO_ID])
+        return int((ids[1:] != ids[:-1]).sum()) + 1 if len(ids) > 0 else 0
+
+    def url_lines(self):
+        """
+        Returns the line numbers of the tweets that have URLs.
+        """
+        return np.flatnonzero(self.has_urls)
+
+    def is_current(self):
+        """
+        Returns True if the shard has not changed since it was indexed.
+        """
+        if not os.path.exists(self.shard_path) or os.path.getsize(self.shard_path) != self.shard_size:
+            return False
+        with open(self.shard_path, 'rb') as file:
+            return _read_tail(file, self.shard_size) == self.shard_tail
+
+    def _is_prefix(self, file, size):
+        # The shard grew by appended members and the indexed part is unchanged
+        return 0 < self.shard_size < size and _read_tail(file, self.shard_size) == self.shard_tail
+
+    def update(self):
+        """
+        Brings the index up to date with the shard: members appended since it was indexed are read and indexed, any
+        other change indexes the whole shard again.
+
+        Output:
+        Returns True if the index changed.
+        """
+        if self.is_current():
+            return False
+        size = os.path.getsize(self.shard_path)
+        with open(self.shard_path, 'rb') as file:
+            if not self._is_prefix(file, size):
+                self.__init__(self.shard_path)
+            ids = []
+            has_urls = []
+            checkpoint_offsets = []
+            checkpoint_lines = []
+            line_number = len(self.ids)
+            for member_offset, line in _iter_lines(file, self.shard_size):
+                if member_offset is not None:
+                    checkpoint_offsets.append(member_offset)
+                    checkpoint_lines.append(line_number)
+                tweet_id, tweet_has_urls = parse_tweet_line(line)
+                ids.append(tweet_id)
+                has_urls.append(tweet_has_urls)
+                line_number += 1
+            self.extend(ids, has_urls, checkpoint_offsets, checkpoint_lines)
+            self.shard_size = size
+            self.shard_tail = _read_tail(file, size)
+        return True
+
+    def extend(self, ids, has_urls, checkpoint_offsets=(), checkpoint_lines=()):
+        """
+        Appends index rows for new lines and checkpoints.
+        """
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.has_urls = np.concatenate([self.has_urls, np.asarray(has_urls, dtype=bool)])
+        self.checkpoint_offsets = np.concatenate([self.checkpoint_offsets, np.asarray(checkpoint_offsets, dtype=np.int64)])
+        self.checkpoint_lines = np.concatenate([self.checkpoint_lines, np.asarray(checkpoint_lines, dtype=np.int64)])
+
+    def save(self):
+        """
+        Writes the index next to the shard, replacing the previous one atomically.
+        """
+        path = get_index_path(self.shard_path)
+        with open(path + '.tmp', 'wb') as file:
+            np.savez(file, ids=self.ids, has_urls=self.has_urls, checkpoint_offsets=self.checkpoint_offsets,
+                     checkpoint_lines=self.checkpoint_lines, shard_size=np.int64(self.shard_size),
+                     shard_tail=np.frombuffer(self.shard_tail, dtype=np.uint8))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, shard_path):
+        """
+        Reads a shard's index file as it is, or returns an empty index if there is none or it cannot be read.
+        """
+        index = cls(shard_path)
+        try:
+            with np.load(get_index_path(shard_path)) as columns:
+                index.ids = columns['ids']
+                index.has_urls = columns['has_urls']
+                index.checkpoint_offsets = columns['checkpoint_offsets']
+                index.checkpoint_lines = columns['checkpoint_lines']
+                index.shard_size = int(columns['shard_size'])
+                index.shard_tail = columns['shard_tail'].tobytes()
+        except (OSError, ValueError, KeyError):
+            return cls(shard_path)
+        if not len(index.ids) == len(index.has_urls) or not len(index.checkpoint_offsets) == len(index.checkpoint_lines):
+            return cls(shard_path)
+        return index
+
+    def read_lines(self, line_numbers=None):
+        """
+        Reads lines of the shard, decompressing from the checkpoint before each requested line instead of from the
+        start of the shard.
+
+        Argument(s):
+        - line_numbers: Sorted list of (0-based) line numbers. Defaults to every line.
+
+        Output:
+        Yields (line_number, line) pairs, line being the raw bytes of the line.
+        """
+        line_numbers = np.arange(self.line_count) if line_numbers is None else np.asarray(line_numbers, dtype=np.int64)
+        if len(line_numbers) == 0:
+            return
+        # Checkpoint to start from for each requested line
+        checkpoints = np.searchsorted(self.checkpoint_lines, line_numbers, side='right') - 1
+        if checkpoints.min() < 0:
+            raise ValueError(f"{self.shard_path} has no checkpoint at its first line")
+        with open(self.shard_path, 'rb') as file:
+            i = 0
+            while i < len(line_numbers):
+                checkpoint = checkpoints[i]
+                line_number = self.checkpoint_lines[checkpoint]
+                for _, line in _iter_lines(file, int(self.checkpoint_offsets[checkpoint])):
+                    if line_number == line_numbers[i]:
+                        yield line_number, line
+                        i += 1
+                        # Seek again when the next requested line is past another checkpoint
+                        if i == len(line_numbers) or checkpoints[i] != checkpoint:
+                            break
+                    line_number += 1
+                else:
+                    raise ValueError(f"{self.shard_path} has fewer lines than its index")
+
+def get_tweet_shard_index(shard_path):
+    """
+    Returns the verified index of a shard, updating and saving it first if the shard changed since it was indexed.
+    """
+    index = TweetShardIndex.load(shard_path)
+    if index.update():
+        index.save()
+    return index
+
+def _copy_file_range(source, file, count):
+    return os.copy_file_range(source.fileno(), file.fileno(), count)
+
+def _sendfile(source, file, count):
+    return os.sendfile(file.fileno(), source.fileno(), None, count)
+
+def copy_file(source_path, file):
+    """
+    Appends the bytes of a file to an open binary file without reading them into Python, using copy_file_range or
+    sendfile where the OS supports them and large buffered copies otherwise.
+    """
+    file.flush()
+    with open(source_path, 'rb') as source:
+        remaining = os.fstat(source.fileno()).st_size
+        copies = [copy for name, copy in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile)) if hasattr(os, name)]
+        for copy in copies:
+            try:
+                while remaining > 0:
+                    copied = copy(source, file, min(remaining, 1 << 30))
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                break
+            except OSError:
+                # Not supported between these files (e.g. across file systems on older kernels)
+                continue
+        if remaining > 0:
+            source.seek(-remaining, os.SEEK_END)
+            shutil.copyfileobj(source, file, COPY_BUFFER_SIZE)
+    # The copies above move the file offset behind the file object's back
+    file.seek(0, os.SEEK_END)
+
+class TweetShardWriter:
+    """
+    Writes tweet lines to a shard and keeps the shard's index up to date. Use it as a context manager.
+
+    A new shard is written to a temporary file that replaces the shard only once it is complete and fsynced. When
+    appending, lines are written in place after the existing content, which is not read or copied; if the writer
+    fails, the shard is truncated back to its previous size. Either way the index is saved only after the shard is
+    fsynced, so the shard and its index stay as they were if the writer fails. A writer that was interrupted
+    before it could clean up leaves members after the indexed part of the shard; the next appending writer keeps
+    them if they are complete and cuts them off otherwise.
+
+    Argument(s):
+    - shard_path: String representing the shard file.
+    - append: If True, lines are added after the existing content of the shard.
+    - checkpoint_lines: Integer representing the number of written lines per gzip member. Defaults to 
+      CHECKPOINT_LINES.
+    """
+    def __init__(self, shard_path, append=False, checkpoint_lines=CHECKPOINT_LINES):
+        self.shard_path = shard_path
+        self.checkpoint_lines = checkpoint_lines
+        if append and os.path.exists(shard_path):
+            self.index = _repair_shard(shard_path)
+            self._path = shard_path
+            self._file = open(shard_path, 'r+b')
+            self._file.seek(0, os.SEEK_END)
+            self._append_offset = self._file.tell()
+        else:
+            self.index = TweetShardIndex(shard_path)
+            self._path = shard_path + '.tmp'
+            self._file = open(self._path, 'wb')
+            self._append_offset = None
+        self._member = None
+        self._member_lines = 0
+        self._rows = ([], [], [], [])
+
+    @property
+    def line_count(self):
+        return self.index.line_count + len(self._rows[0])
+
+    def _add_checkpoint(self):
+        self._rows[2].append(self._file.tell())
+        self._rows[3].append(self.line_count)
+
+    def write(self, line, parsed=None):
+        """
+        Writes one tweet line, compressing it. parsed is the line's (tweet ID, has URLs) pair if it was already 
+        parsed with parse_tweet_line().
+        """
+        if not line.endswith('\n'):
+            line += '\n'
+        if self._member is None:
+            self._add_checkpoint()
+            self._member = gzip.GzipFile(fileobj=self._file, mode='wb')
+        data = line.encode('utf-8')
+        self._member.write(data)
+        tweet_id, tweet_has_urls = parse_tweet_line(data) if parsed is None else parsed
+        self._rows[0].append(tweet_id)
+        self._rows[1].append(tweet_has_urls)
+        self._member_lines += 1
+        if self._member_lines == self.checkpoint_lines:
+            self._end_member()
+
+    def copy_members(self, source_path, parsed_lines):
+        """
+        Appends the gzip members of another file byte for byte, without decompressing and compressing them again. 
+        The file must be a complete gzip file whose content is whole lines (every line ends with a newline).
+
+        Argument(s):
+        - source_path: String representing the gzip file.
+        - parsed_lines: List of the (tweet ID, has URLs) pairs of the file's lines, from parse_tweet_line().
+        """
+        self._end_member()
+        self._add_checkpoint()
+        copy_file(source_path, self._file)
+        self._add_rows(parsed_lines)
+
+    def write_member(self, member, parsed_lines):
+        """
+        Appends one complete gzip member, given as its compressed bytes (see read_members()), without decompressing
+        and compressing it again. The member's content must be whole lines.
+
+        Argument(s):
+        - member: bytes of the gzip member.
+        - parsed_lines: List of the (tweet ID, has URLs) pairs of the member's lines, from parse_tweet_line().
+        """
+        self._end_member()
+        self._add_checkpoint()
+        self._file.write(member)
+        self._add_rows(parsed_lines)
+
+    def _add_rows(self, parsed_lines):
+        for tweet_id, tweet_has_urls in parsed_lines:
+            self._rows[0].append(tweet_id)
+            self._rows[1].append(tweet_has_urls)
+
+    def _end_member(self):
+        if self._member is not None:
+            # Closing the GzipFile writes the member trailer but leaves the shard open
+            self._member.close()
+            self._member = None
+            self._member_lines = 0
+
+    def close(self):
+        self._end_member()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        size = self._file.tell()
+        self._file.close()
+        if self._append_offset is None:
+            os.replace(self._path, self.shard_path)
+        self.index.extend(*self._rows)
+        self.index.shard_size = size
+        with open(self.shard_path, 'rb') as file:
+            self.index.shard_tail = _read_tail(file, size)
+        self.index.save()
+
+    def abort(self):
+        """
+        Discards everything written, leaving the shard as it was.
+        """
+        self._member = None
+        if self._append_offset is None:
+            self._file.close()
+            os.remove(self._path)
+            return
+        self._file.truncate(self._append_offset)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def _repair_shard(shard_path):
+    """
+    Returns the up to date index of a shard that is about to be appended to. If the shard ends with members that
+    were appended after it was indexed and the last one is truncated, they are cut off first.
+    """
+    index = TweetShardIndex.load(shard_path)
+    indexed_size = index.shard_size
+    with open(shard_path, 'rb') as file:
+        appended = index._is_prefix(file, os.path.getsize(shard_path))
+    try:
+        if index.update():
+            index.save()
+    except (EOFError, zlib.error):
+        if not appended:
+            raise
+        os.truncate(shard_path, indexed_size)
+        index = get_tweet_shard_index(shard_path)
+    return index
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+"""
+On-disk cache of URI resolutions (original URI -> final URI after redirects, HTTP status, time of resolution). The
+same short links and news URIs appear across many scraped_tweets shards, so each one only needs to be resolved once.
+Failures and timeouts are kept in a negative cache with a shorter TTL. Concurrent lookups of the same URI share a
+single network request.
+"""
+
+URL_CACHE_PATH = '../url_cache.sqlite'
+URL_CACHE_TTL = 30 * 24 * 60 * 60
+URL_CACHE_NEGATIVE_TTL = 24 * 60 * 60
+
+class URLResolutionCache:
+    """
+    SQLite-backed cache of URI resolutions with request coalescing. Safe to share between threads.
+
+    Argument(s):
+    - path: String representing the SQLite database file. Defaults to URL_CACHE_PATH.
+    - ttl: Number of seconds a successful (HTTP 200) resolution stays valid.
+    - negative_ttl: Number of seconds a failed resolution (error, timeout or non-200 status) stays valid.
+    """
+    def __init__(self, path=URL_CACHE_PATH, ttl=URL_CACHE_TTL, negative_ttl=URL_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'coalesced': 0, 'stored': 0}
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+        parent = os.path.dirname(path)
+        if parent != '' and not os.path.exists(parent):
+            os.makedirs(parent)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS resolutions (
+                url TEXT PRIMARY KEY,
+                final_url TEXT,
+                status INTEGER,
+                negative INTEGER NOT NULL,
+                resolved_at REAL NOT NULL
+            )''')
+        self._conn.commit()
+
+    def get_many(self, links, count_stats=True):
+        """
+        Looks up several URIs at once.
+
+        Argument(s):
+        - links: List of URI strings.
+        - count_stats: If False, the lookup is not counted in the hit/miss statistics.
+
+        Output:
+        Returns a dictionary mapping each URI found in the cache and not expired to its (final_link, status_code)
+        tuple, as returned by extracting_links.resolve_url().
+        """
+        found = {}
+        now = time.time()
+        unique_links = list(dict.fromkeys(links))
+        with self._lock:
+            # Query in chunks to stay under SQLite's bound parameter limit
+            for i in range(0, len(unique_links), 500):
+                chunk = unique_links[i:i+500]
+                rows = self._conn.execute(
+                    f"SELECT url, final_url, status, negative, resolved_at FROM resolutions WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for url, final_url, status, negative, resolved_at in rows:
+                    ttl = self.negative_ttl if negative else self.ttl
+                    if now - resolved_at <= ttl:
+                        found[url] = (final_url, status)
+                        if count_stats:
+                            self.stats['negative_hits' if negative else 'hits'] += 1
+
+            if count_stats:
+                self.stats['misses'] += len(unique_links) - len(found)
+        return found
+
+    def put(self, link, final_link, status_code):
+        """
+        Stores the resolution of a URI. Anything other than an HTTP 200 response is stored as negative.
+        """
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?)',
+                               (link, final_link, status_code, int(status_code != 200), time.time()))
+            self._conn.commit()
+            self.stats['stored'] += 1
+
+    def resolve(self, link, resolve_func):
+        """
+        Returns the cached resolution of a URI, or resolves and caches it. If another thread is already resolving
+        the same URI, waits for its result instead of sending a second request.
+
+        Argument(s):
+        - link: String representing URI.
+        - resolve_func: Function called as resolve_func(link) on a cache miss. Returns (final_link, status_code).
+
+        Output:
+        Returns a (final_link, status_code) tuple.
+        """
+        # Another caller may have stored the URI since it was first looked up
+        cached = self.get_many([link], count_stats=False)
+        if link in cached:
+            return cached[link]
+
+        with self._in_flight_lock:
+            future = self._in_flight.get(link)
+            owner = future is None
+            if owner:
+                # An owner stores its result before it leaves _in_flight, so a resolution that finished since the
+                # lookup above is in the cache by now
+                cached = self.get_many([link], count_stats=False)
+                if link in cached:
+                    return cached[link]
+                future = Future()
+                self._in_flight[link] = future
+            else:
+                self.stats['coalesced'] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = resolve_func(link)
+            self.put(link, result[0], result[1])
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[link]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_url_cache():
+    """
+    Returns the process-wide URLResolutionCache stored at URL_CACHE_PATH, opening it on first use.
+    """
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = URLResolutionCache()
+        return _default_cache
@@ -1,30 +1,125 @@
 import gzip
 import json
+import queue
 import requests
-from NwalaTextUtils.textutils import parallelTask
+import threading
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
 from NwalaTextUtils.textutils import genericErrorInfo
+from tweet_cache import get_tweet_cache
+from tweet_cache import store_rehydration_results
 
-def rehydrate_tweet(twt_id, user_agent='', token='418g769m7fi'):
+# Shared HTTP session settings. Connections are kept alive and reused across calls and threads.
+SESSION_POOL_SIZE = 10
+SESSION_TIMEOUT = 10
+
+# Endpoint used to rehydrate tweets
+SYNDICATION_URL = "https://cdn.syndication.twimg.com/tweet-result"
+
+_session = None
+_session_pool_size = None
+# Counters of the adapters replaced when the pool grew, so get_http_session_stats() stays cumulative
+_retired_stats = {'requests': 0, 'pool_misses': 0}
+_session_lock = threading.Lock()
+
+def get_http_session(pool_size=None):
     """
-    Rehydrates a tweet by fetching its metadata using the tweet ID.
+    Returns the shared, thread-safe HTTP session. The session is created on first use with a connection pool of 
+    the given size and reused by every later call, so keep-alive connections are not re-established per request.
+
+    Argument(s):
+    - pool_size: Optional integer representing the maximum number of pooled connections per host. The pool only 
+      grows: if pool_size is larger than the current pool, a larger pool replaces it, otherwise (or if pool_size is 
+      None) the session is returned as it is. The first session is created with SESSION_POOL_SIZE connections if no 
+      size is given.
+
+    Output:
+    Returns a requests.Session object.
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session_pool_size = 0
+        if _session_pool_size == 0 or (pool_size is not None and pool_size > _session_pool_size):
+            pool_size = SESSION_POOL_SIZE if pool_size is None else max(pool_size, SESSION_POOL_SIZE)
+            # Requests already running keep the connection of the old pool, which is closed once it is unused. They
+            # were counted when they were sent, so the old pool's counters are final.
+            for key, count in _count_pool_requests(_session).items():
+                _retired_stats[key] += count
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session_pool_size = pool_size
+        return _session
+
+def get_http_session_pool_size():
+    """
+    Returns the size of the shared HTTP session's connection pool, or None if there is no session yet.
+    """
+    with _session_lock:
+        return _session_pool_size
+
+def close_http_session():
+    """
+    Closes the shared HTTP session and its pooled connections. The next call to get_http_session() creates a new one.
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pool_size = None
+        _retired_stats.update(requests=0, pool_misses=0)
+
+def _count_pool_requests(session):
+    counts = {'requests': 0, 'pool_misses': 0}
+    adapters = {id(a): a for a in session.adapters.values()}.values()
+    for adapter in adapters:
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            counts['requests'] += pool.num_requests
+            counts['pool_misses'] += pool.num_connections
+    return counts
+
+def get_http_session_stats():
+    """
+    Counts connection reuse for the shared HTTP session since it was created, including the pools it had before
+    its pool grew. Take the difference of two calls to count the requests in between.
+
+    Output:
+    Returns a dictionary with the number of requests sent, 'pool_hits' (requests served over an already open 
+    connection) and 'pool_misses' (requests that had to open a new connection).
+    """
+    with _session_lock:
+        stats = dict(_retired_stats)
+        if _session is not None:
+            for key, count in _count_pool_requests(_session).items():
+                stats[key] += count
+
+    stats['pool_hits'] = stats['requests'] - stats['pool_misses']
+    return stats
+
+def fetch_tweet_result(twt_id, user_agent='', token='418g769m7fi', timeout=None):
+    """
+    Sends the syndication request for a tweet ID and returns the HTTP status alongside the parsed response.
 
     Argument(s):
     - twt_id: String representing the tweet ID.
     - user_agent: Optional string representing the user agent to use for the request. 
       Defaults to a standard Mozilla/Firefox user agent.
     - token: Optional string representing the token required for the request.
-      Defaults to a sample token.
+    - timeout: Optional number of seconds to wait for the response. Defaults to SESSION_TIMEOUT.
 
     Output:
-    Returns a dictionary containing the tweet's metadata if successful, otherwise returns an empty dictionary.
-    
-    Note:
-    To get the token:
-    1. Visit 'https://platform.twitter.com/embed/Tweet.html?id=1288498682971795463'
-    2. Inspect network traffic in developer tools to find the URI of the GET request which has the token.
+    Returns a tuple (status_code, tweet). status_code is None if no response was received (e.g. timeout or 
+    connection error), and tweet is an empty dictionary if the response could not be parsed.
     """
     # Initialize request URL and parameters for the tweet data
-    url = "https://cdn.syndication.twimg.com/tweet-result"
+    url = SYNDICATION_URL
     querystring = {"id": twt_id, "lang": "en", 'token': token}
     
     # Define headers for the request
@@ -44,50 +139,241 @@ def rehydrate_tweet(twt_id, user_agent='', token='418g769m7fi'):
         "TE": "trailers"
     }
     
+    response = None
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        return json.loads(response.text)
+        response = get_http_session().get(url, headers=headers, params=querystring, 
+                                          timeout=SESSION_TIMEOUT if timeout is None else timeout)
+        return response.status_code, json.loads(response.text)
     except:
-        genericErrorInfo(f"Problem text:\n {response.text}\n")
+        genericErrorInfo(f"Problem text:\n {'' if response is None else response.text}\n")
     
-    return {}
+    return (None if response is None else response.status_code), {}
 
-def paral_rehydrate_tweets(tweet_ids):
+def rehydrate_tweet(twt_id, user_agent='', token='418g769m7fi', timeout=None):
     """
-    Rehydrates a list of tweets in parallel using their tweet IDs.
+    Rehydrates a tweet by fetching its metadata using the tweet ID.
+
+    Argument(s):
+    - twt_id: String representing the tweet ID.
+    - user_agent: Optional string representing the user agent to use for the request. 
+      Defaults to a standard Mozilla/Firefox user agent.
+    - token: Optional string representing the token required for the request.
+      Defaults to a sample token.
+    - timeout: Optional number of seconds to wait for the response. Defaults to SESSION_TIMEOUT.
+
+    Output:
+    Returns a dictionary containing the tweet's metadata if successful, otherwise returns an empty dictionary.
+    
+    Note:
+    To get the token:
+    1. Visit 'https://platform.twitter.com/embed/Tweet.html?id=1288498682971795463'
+    2. Inspect network traffic in developer tools to find the URI of the GET request which has the token.
+    """
+    status_code, tweet = fetch_tweet_result(twt_id, user_agent=user_agent, token=token, timeout=timeout)
+    return tweet
+
+def parallel_thread_task(jobs_lst, thread_count=5):
+    """
+    Runs jobs in a pool of threads. Accepts and returns the same job and result structure as NwalaTextUtils 
+    parallelTask, but keeps every job in this process so they share the pooled HTTP session.
+
+    Argument(s):
+    - jobs_lst: List of dictionaries with 'func', 'args', 'misc' and optional 'print' keys.
+    - thread_count: Integer representing the number of worker threads.
+
+    Output:
+    Returns a list of dictionaries with 'input', 'output' and 'misc' keys, in the same order as jobs_lst.
+    """
+    def run_job(job):
+        output = job['func'](**job['args'])
+        if( job.get('print', '') != '' ):
+            print(job['print'])
+        return {'input': job, 'output': output, 'misc': job['misc']}
+
+    if( len(jobs_lst) == 0 ):
+        return []
+
+    try:
+        with ThreadPool(max(thread_count, 1)) as workers:
+            return workers.map(run_job, jobs_lst)
+    except:
+        genericErrorInfo()
+    
+    return []
+
+def paral_rehydrate_tweets(tweet_ids, thread_count=5, use_cache=True):
+    """
+    Rehydrates a list of tweets in parallel using their tweet IDs. All threads share the pooled HTTP session, so 
+    connections to the syndication endpoint are reused instead of opened per tweet. Tweets found in the on-disk 
+    tweet cache are not requested again.
 
     Argument(s):
     - tweet_ids: List of dictionaries where each dictionary contains:
       - 'tid': Tweet ID.
       - 'notes': Additional information to attach to each tweet's metadata.
+    - thread_count: Integer representing the number of concurrent requests. Defaults to 5.
+    - use_cache: If True, reads from and writes to the tweet cache (see tweet_cache.py). Defaults to True.
 
     Output:
     Returns a list of dictionaries with rehydrated tweet metadata and attached notes.
     """
+    cache = get_tweet_cache() if use_cache else None
+    # The counters are cumulative, so the ones reported are the differences over this call
+    http_stats_before = get_http_session_stats()
+    cache_stats_before = {} if cache is None else dict(cache.stats)
+    cached = {} if cache is None else cache.get_many([t['tid'] for t in tweet_ids])
+
     jobs_lst = []
     len_tweet_ids = len(tweet_ids)
+    pending_tids = set()
     
-    # Prepare jobs for parallel execution
+    # Prepare jobs for parallel execution, one per tweet ID that is not cached
     for i in range(len_tweet_ids):
         t = tweet_ids[i]
+        if( t['tid'] in cached or t['tid'] in pending_tids ):
+            continue
+        pending_tids.add(t['tid'])
         keywords = {'twt_id': t['tid'], 'user_agent': ''}
         jobs_lst.append({
-            'func': rehydrate_tweet,
+            'func': fetch_tweet_result,
             'args': keywords,
             'misc': t['notes'],
             'print': '' if i % 10 else f'\trehydrate_tweet() {i} of {len_tweet_ids}'
         })
 
-    # Execute jobs in parallel
-    res_lst = parallelTask(jobs_lst, threadCount=5)
+    # Execute jobs in parallel over a connection pool large enough for every thread
+    get_http_session(pool_size=max(thread_count, SESSION_POOL_SIZE))
+    res_lst = parallel_thread_task(jobs_lst, thread_count=thread_count)
+
+    fetched = {}
+    for r in res_lst:
+        fetched[r['input']['args']['twt_id']] = r['output']
+    if( cache is not None ):
+        store_rehydration_results(cache, [(tid, status_code, tweet) for tid, (status_code, tweet) in fetched.items()])
     
     tweets = []
-    for r in res_lst:
-        r['output']['notes'] = r['misc']
-        tweets.append(r['output'])
+    for t in tweet_ids:
+        if( t['tid'] in cached ):
+            tweet = dict(cached[t['tid']])
+        elif( t['tid'] in fetched ):
+            tweet = dict(fetched[t['tid']][1])
+        else:
+            continue
+        tweet['notes'] = t['notes']
+        tweets.append(tweet)
 
+    stats = {key: count - http_stats_before[key] for key, count in get_http_session_stats().items()}
+    print(f"\tparal_rehydrate_tweets(): connection pool hits: {stats['pool_hits']}, misses: {stats['pool_misses']}")
+    if( cache is not None ):
+        stats = {key: cache.stats[key] - cache_stats_before[key] for key in ('hits', 'negative_hits', 'misses')}
+        print(f"\tparal_rehydrate_tweets(): tweet cache hits: {stats['hits']}, negative hits: {stats['negative_hits']}, misses: {stats['misses']}")
     return tweets
 
+class RehydrationStream:
+    """
+    Rehydrates tweets while they are still being harvested. Tweet IDs are submitted to a bounded queue as soon as 
+    they are seen, and a pool of worker threads drains it concurrently over the pooled HTTP session. 
+    Submitting blocks when the queue is full, so harvesting cannot run arbitrarily far ahead of rehydration.
+
+    Argument(s):
+    - thread_count: Integer representing the number of worker threads. Defaults to 5.
+    - queue_size: Integer representing the maximum number of tweet IDs waiting to be rehydrated. Defaults to 100.
+    - use_cache: If True, reads from and writes to the tweet cache (see tweet_cache.py). Defaults to True.
+    """
+    def __init__(self, thread_count=5, queue_size=100, use_cache=True):
+        self.cache = get_tweet_cache() if use_cache else None
+        self.results = {}
+        self.submitted = set()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._results_lock = threading.Lock()
+        self._closed = False
+
+        get_http_session(pool_size=max(thread_count, SESSION_POOL_SIZE))
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(thread_count, 1))]
+        for w in self._workers:
+            w.start()
+
+    def _work(self):
+        while( True ):
+            tid = self._queue.get()
+            try:
+                if( tid is None or self._closed ):
+                    return
+                
+                cached = None if self.cache is None else self.cache.get(tid)
+                if( cached is not None ):
+                    result = (200, cached)
+                else:
+                    result = fetch_tweet_result(tid, user_agent='')
+                    if( self.cache is not None ):
+                        store_rehydration_results(self.cache, [(tid, result[0], result[1])])
+
+                with self._results_lock:
+                    self.results[tid] = result
+            except:
+                genericErrorInfo()
+            finally:
+                self._queue.task_done()
+
+    def submit(self, tweet_id):
+        """
+        Queues a tweet for rehydration. Blocks while the queue is full.
+
+        Argument(s):
+        - tweet_id: Dictionary with the 'tid' (and 'notes') of the tweet.
+        """
+        if( tweet_id['tid'] in self.submitted ):
+            return
+        self.submitted.add(tweet_id['tid'])
+        if( len(self.submitted) % 10 == 1 ):
+            print(f"\tRehydrationStream: queued {len(self.submitted)} tweets, {len(self.results)} rehydrated")
+        self._queue.put(tweet_id['tid'])
+
+    def finish(self, tweet_ids):
+        """
+        Waits for every queued tweet to be rehydrated and stops the workers.
+
+        Argument(s):
+        - tweet_ids: List of dictionaries with 'tid' and 'notes' keys, in the order the tweets should be returned. 
+          Tweets in this list that were never submitted are rehydrated now.
+
+        Output:
+        Returns a list of dictionaries with rehydrated tweet metadata and attached notes, the same as 
+        paral_rehydrate_tweets() returns for tweet_ids.
+        """
+        for t in tweet_ids:
+            self.submit(t)
+        for _ in self._workers:
+            self._queue.put(None)
+        for w in self._workers:
+            w.join()
+
+        tweets = []
+        for t in tweet_ids:
+            if( t['tid'] not in self.results ):
+                continue
+            tweet = dict(self.results[t['tid']][1])
+            tweet['notes'] = t['notes']
+            tweets.append(tweet)
+
+        return tweets
+
+    def close(self):
+        """
+        Stops the workers without rehydrating the queued tweets, e.g. when harvesting failed. Tweets already being 
+        fetched are finished in the background.
+        """
+        self._closed = True
+        # Drop the queued tweets, then wake the idle workers
+        while( True ):
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        for _ in self._workers:
+            self._queue.put(None)
+
 def writeTextToFile(outfilename, text, extraParams=None):
     """
     Writes text to a specified file.
@@ -134,21 +420,30 @@ def readTextFromFile(infilename):
     
     return text
 
-def write_tweets_to_jsonl_file(outfilename, tweets):
+def write_tweets_to_jsonl_file(outfilename, tweets, member_lines=None):
     """
     Writes a list of tweets to a compressed JSONL file.
 
     Argument(s):
     - outfilename: String representing the output file path (.json.gz).
     - tweets: List of dictionaries, each containing tweet data.
+    - member_lines: Integer, if set a new gzip member is started every member_lines tweets. Defaults to None (one
+      member).
 
     Output:
     Creates a compressed JSONL file with the tweet data.
     """
     try:
-        with gzip.open(outfilename, 'wt') as outfile:
-            for t in tweets:
-                outfile.write(json.dumps(t, ensure_ascii=False) + '\n')
+        if member_lines is None:
+            with gzip.open(outfilename, 'wt') as outfile:
+                for t in tweets:
+                    outfile.write(json.dumps(t, ensure_ascii=False) + '\n')
+        else:
+            with open(outfilename, 'wb') as outfile:
+                for start in range(0, len(tweets), member_lines):
+                    with gzip.GzipFile(fileobj=outfile, mode='wb') as member:
+                        for t in tweets[start:start + member_lines]:
+                            member.write((json.dumps(t, ensure_ascii=False) + '\n').encode('utf-8'))
     except:
         genericErrorInfo()
 
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import util
+from async_rehydrate import adaptive_rehydrate_tweets, async_rehydrate_tweets
+
+"""
+Runs the adaptive rehydration engine against a local fake syndication server.
+"""
+
+class FakeSyndicationServer:
+    """
+    Local HTTP server answering like the syndication endpoint. Requests are numbered in arrival order, and
+    status_for(tid, request_number) picks each response's status. The server records how many requests it is
+    handling at the arrival of each request.
+    """
+    def __init__(self, status_for, delay=0.05):
+        self.status_for = status_for
+        self.delay = delay
+        self.request_count = 0
+        self.in_flight = 0
+        self.arrivals = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                tid = parse_qs(urlsplit(self.path).query)['id'][0]
+                with fake._lock:
+                    fake.request_count += 1
+                    fake.in_flight += 1
+                    request_number = fake.request_count
+                    fake.arrivals.append((request_number, fake.in_flight))
+                time.sleep(fake.delay)
+                status = fake.status_for(tid, request_number)
+                body = json.dumps({'id_str': tid, 'text': f'tweet {tid}'} if status == 200 else {}).encode()
+                with fake._lock:
+                    fake.in_flight -= 1
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/tweet-result'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def max_in_flight(self, first_request, last_request):
+        return max(in_flight for request_number, in_flight in self.arrivals if first_request <= request_number <= last_request)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    servers = []
+
+    def start(status_for, delay=0.05):
+        server = FakeSyndicationServer(status_for, delay=delay)
+        servers.append(server)
+        monkeypatch.setattr(util, 'SYNDICATION_URL', server.url)
+        return server
+
+    util.close_http_session()
+    yield start
+    util.close_http_session()
+    for server in servers:
+        server.close()
+
+def tweet_ids(n):
+    return [{'tid': str(1000 + i), 'notes': {'position': i}} for i in range(n)]
+
+def run_async_rehydrate(tweets, **kwargs):
+    return asyncio.run(async_rehydrate_tweets(tweets, **kwargs))
+
+def test_results_keep_order_and_notes(fake_server):
+    # Every fifth tweet is throttled on its first attempt and tweet 1003 always fails
+    throttled_once = set()
+    def status_for(tid, request_number):
+        if tid == '1003':
+            return 503
+        if int(tid) % 5 == 0 and tid not in throttled_once:
+            throttled_once.add(tid)
+            return 429
+        return 200
+    fake_server(status_for, delay=0.01)
+
+    tweets = adaptive_rehydrate_tweets(tweet_ids(40), max_retries=2, backoff=0.01, use_cache=False, initial_limit=4)
+
+    assert [tweet['notes'] for tweet in tweets] == [{'position': i} for i in range(40)]
+    for i, tweet in enumerate(tweets):
+        if i == 3:
+            assert tweet == {'notes': {'position': 3}}
+        else:
+            assert tweet['id_str'] == str(1000 + i)
+
+def test_limiter_backs_off_on_throttling(fake_server):
+    statuses = [429, 500, 502, 503]
+    fake_server(lambda tid, request_number: statuses[request_number % 4], delay=0.01)
+
+    tweets, stats = run_async_rehydrate(tweet_ids(20), max_retries=1, backoff=0.01, use_cache=False, initial_limit=16, max_limit=16)
+
+    assert all(tweet == {'notes': {'position': i}} for i, tweet in enumerate(tweets))
+    assert stats['throttled'] == 40
+    assert stats['final_limit'] < 16
+
+def test_server_concurrency_rises_and_falls(fake_server):
+    # Requests 1-250 succeed, 251-350 are throttled, later ones succeed again
+    def status_for(tid, request_number):
+        return 429 if 250 < request_number <= 350 else 200
+    server = fake_server(status_for, delay=0.03)
+
+    tweets, stats = run_async_rehydrate(tweet_ids(400), max_retries=5, backoff=0.05, use_cache=False, initial_limit=2, max_limit=32)
+
+    assert all('id_str' in tweet for tweet in tweets)
+    # The limit grows while requests succeed, and the server sees it: more than the default pool of 10 connections
+    assert server.max_in_flight(1, 10) <= 4
+    peak = server.max_in_flight(200, 250)
+    assert peak > 10
+    # Once throttling has been going on for a while, fewer requests reach the server at once
+    assert server.max_in_flight(320, 350) < peak
+    assert stats['max_in_flight'] >= peak
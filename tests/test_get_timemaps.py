@@ -0,0 +1,112 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import get_timemaps
+from get_timemaps import collect_timemap_http, collect_timemaps_http
+from timemap_manifest import TimemapManifest
+from timemap_store import get_timemap_store
+
+"""
+Collects timemaps from a local stub MemGator server.
+"""
+
+TIMEOUT = 0.5
+
+class StubMemGatorHandler(BaseHTTPRequestHandler):
+    """
+    Answers /timemap/json/<uri> like MemGator: a timemap with one memento per path segment of the URI, or 404 for
+    URIs containing 'unarchived'. URIs containing 'error' get a 503 and URIs containing 'slow' are answered after
+    the client's timeout.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        link = self.path.split('/timemap/json/', 1)[-1]
+        self.server.requested.append(link)
+        if 'slow' in link:
+            time.sleep(TIMEOUT * 2)
+        if 'unarchived' in link:
+            status, body = 404, b'Resource not found'
+        elif 'error' in link:
+            status, body = 503, b'Service unavailable'
+        else:
+            memento_list = [{'datetime': f'2020-01-0{i + 1}T00:00:00Z', 'uri': f'https://web.archive.org/web/{i}/{link}'}
+                            for i in range(len(link.split('/')) - 2)]
+            # MemGator's JSON is pretty-printed
+            status, body = 200, json.dumps({
+                'original_uri': link,
+                'mementos': {'list': memento_list, 'first': memento_list[0], 'last': memento_list[-1]}
+            }, indent=2).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow response
+            pass
+
+@pytest.fixture
+def memgator():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubMemGatorHandler)
+    server.daemon_threads = True
+    server.requested = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def base_url(server):
+    return f'http://127.0.0.1:{server.server_port}'
+
+def test_collect_timemap_http_outcomes(memgator):
+    timemap = json.loads(collect_timemap_http('https://example.com/a/b', base_url(memgator), timeout=TIMEOUT))
+    assert timemap['original_uri'] == 'https://example.com/a/b'
+    assert len(timemap['mementos']['list']) == 3
+    # No mementos: the timemap only holds the original URI
+    assert json.loads(collect_timemap_http('https://unarchived.com/', base_url(memgator), timeout=TIMEOUT)) == {
+        'original_uri': 'https://unarchived.com/'}
+    assert collect_timemap_http('https://error.com/', base_url(memgator), timeout=TIMEOUT) is None
+    assert collect_timemap_http('https://slow.com/', base_url(memgator), timeout=TIMEOUT) is None
+
+def test_collect_timemaps_http_keeps_order(memgator):
+    links = [f'https://example.com/{"slow" if i == 1 else "news"}/{i}' for i in range(12)]
+    timemaps = list(collect_timemaps_http(links, base_url(memgator), max_workers=4, timeout=TIMEOUT))
+    assert timemaps[1] is None
+    assert [json.loads(timemap)['original_uri'] for timemap in timemaps if timemap is not None] == links[:1] + links[2:]
+    assert sorted(memgator.requested) == sorted(links)
+
+def test_save_timemaps_records_outcomes(memgator, tmp_path, monkeypatch):
+    (tmp_path / 'scripts').mkdir()
+    monkeypatch.chdir(tmp_path / 'scripts')
+    monkeypatch.setattr(get_timemaps, 'collect_timemaps_http', functools.partial(collect_timemaps_http, timeout=TIMEOUT))
+    links = ['https://example.com/a/b', 'https://unarchived.com/', 'https://error.com/', 'https://slow.com/']
+    with open('../tweet_links.txt', 'w') as file:
+        file.write('\n'.join(links) + '\n')
+
+    get_timemaps.save_timemaps(memgator_url=base_url(memgator), max_workers=2)
+    manifest = TimemapManifest()
+    assert [manifest.get_status(uri_number) for uri_number in range(1, 5)] == ['done', 'done', 'failed', 'failed']
+    assert [row[3] for row in manifest.get_done()] == [3, 0]
+    manifest.close()
+    store = get_timemap_store('../timemaps')
+    assert store.uri_numbers() == [1, 2]
+    assert store.read_summary(1)['last_memento'] == '2020-01-03T00:00:00Z'
+    assert json.loads(store.read(2)) == {'original_uri': 'https://unarchived.com/'}
+
+    # Failed URIs are retried on the next run
+    memgator.requested.clear()
+    get_timemaps.save_timemaps(memgator_url=base_url(memgator), max_workers=2)
+    assert sorted(memgator.requested) == ['https://error.com/', 'https://slow.com/']
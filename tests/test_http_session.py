@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import util
+
+"""
+Sends requests over the shared HTTP session to a local server.
+"""
+
+class OKHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OKHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    util.close_http_session()
+    yield f'http://127.0.0.1:{server.server_port}'
+    util.close_http_session()
+    server.shutdown()
+    server.server_close()
+
+def test_pool_only_grows(base_url):
+    session = util.get_http_session()
+    assert util.get_http_session_pool_size() == util.SESSION_POOL_SIZE
+    assert util.get_http_session(pool_size=2) is session
+    assert util.get_http_session_pool_size() == util.SESSION_POOL_SIZE
+    assert util.get_http_session(pool_size=util.SESSION_POOL_SIZE + 5) is session
+    assert util.get_http_session_pool_size() == util.SESSION_POOL_SIZE + 5
+    assert util.get_http_session() is session
+    assert util.get_http_session_pool_size() == util.SESSION_POOL_SIZE + 5
+
+def test_stats_survive_pool_growth(base_url):
+    for _ in range(3):
+        util.get_http_session().get(base_url).close()
+    assert util.get_http_session_stats() == {'requests': 3, 'pool_misses': 1, 'pool_hits': 2}
+
+    # The larger pool opens a new connection; the counts of the replaced pool are kept
+    util.get_http_session(pool_size=util.SESSION_POOL_SIZE + 1).get(base_url).close()
+    assert util.get_http_session_stats() == {'requests': 4, 'pool_misses': 2, 'pool_hits': 2}
+
+    util.close_http_session()
+    assert util.get_http_session_stats() == {'requests': 0, 'pool_misses': 0, 'pool_hits': 0}
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from memento_table import REL_FIRST, REL_LAST, build_memento_table
+
+"""
+Builds memento tables from small timemap directories.
+"""
+
+def memento(datetime, host='web.archive.org'):
+    return {'datetime': datetime, 'uri': f'https://{host}/web/{datetime}/https://example.com/'}
+
+def write_timemap(timemaps_folder, uri_number, mementos, first=True, last=True):
+    timemap = {'original_uri': f'https://example.com/{uri_number}', 'mementos': {'list': mementos}}
+    if first:
+        timemap['mementos']['first'] = mementos[0]
+    if last:
+        timemap['mementos']['last'] = mementos[-1]
+    with open(os.path.join(timemaps_folder, f'uri{uri_number}.json'), 'w') as file:
+        json.dump(timemap, file)
+
+def test_rel_flags_follow_first_and_last(tmp_path):
+    timemaps_folder = tmp_path / 'timemaps'
+    timemaps_folder.mkdir()
+    write_timemap(timemaps_folder, 1, [memento('2020-01-01T00:00:00Z'), memento('2020-06-01T00:00:00Z'),
+                                       memento('2021-01-01T00:00:00Z', 'archive.today')])
+
+    table = build_memento_table(str(timemaps_folder), str(tmp_path / 'memento_table'))
+    assert len(table) == 3
+    assert table.rel.tolist() == [REL_FIRST, 0, REL_LAST]
+    assert table.archives == ['web.archive.org', 'archive.today']
+
+def test_timemap_without_first_and_last(tmp_path):
+    timemaps_folder = tmp_path / 'timemaps'
+    timemaps_folder.mkdir()
+    write_timemap(timemaps_folder, 1, [memento('2020-01-01T00:00:00Z')])
+    write_timemap(timemaps_folder, 2, [memento('2019-03-01T00:00:00Z'), memento('2018-01-01T00:00:00Z'),
+                                       memento('2022-01-01T00:00:00Z')], first=False, last=False)
+    write_timemap(timemaps_folder, 3, [memento('2021-01-01T00:00:00Z')])
+
+    table = build_memento_table(str(timemaps_folder), str(tmp_path / 'memento_table'))
+    # The timemap is kept, with its earliest and latest mementos flagged instead
+    assert table.uri_number.tolist() == [1, 2, 3]
+    assert table.memento_counts().tolist() == [1, 3, 1]
+    assert table.rel[1:4].tolist() == [0, REL_FIRST, REL_LAST]
+    assert table.first_datetimes()[1] == np.datetime64('2018-01-01T00:00:00')
@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import get_timemaps
+from timemap_manifest import TimemapManifest
+from timemap_store import get_timemap_store
+
+"""
+Resumes timemap collections from the manifest, with a fake collector in place of MemGator.
+"""
+
+def timemap(link, n_mementos=2):
+    mementos = [{'datetime': f'20{10 + i}-01-01T00:00:00Z', 'uri': f'https://web.archive.org/web/{i}/{link}'}
+                for i in range(n_mementos)]
+    return json.dumps({'original_uri': link, 'mementos': {'list': mementos, 'first': mementos[0], 'last': mementos[-1]}})
+
+class FakeCollector:
+    """
+    Stands in for get_timemaps.collect_timemap() and records the links it was called with.
+    """
+    def __init__(self):
+        self.fetched = []
+        self.failing = set()
+        self.interrupt_at = None
+
+    def __call__(self, link):
+        if link == self.interrupt_at:
+            raise KeyboardInterrupt
+        self.fetched.append(link)
+        return None if link in self.failing else timemap(link)
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    # save_timemaps() runs from tmp_path/scripts, so tweet_links.txt and the timemaps directory are in tmp_path
+    (tmp_path / 'scripts').mkdir()
+    monkeypatch.chdir(tmp_path / 'scripts')
+    collector = FakeCollector()
+    monkeypatch.setattr(get_timemaps, 'collect_timemap', collector)
+    return collector
+
+def write_links(links):
+    with open('../tweet_links.txt', 'w') as file:
+        file.write('\n'.join(links) + '\n')
+
+def stored_uri(uri_number):
+    return json.loads(get_timemap_store('../timemaps').read(uri_number))['original_uri']
+
+def test_register_keeps_status_unless_link_changes(tmp_path):
+    manifest = TimemapManifest(str(tmp_path / 'manifest.sqlite'))
+    manifest.register(['https://a.com', 'https://b.com', 'https://c.com'])
+    manifest.mark_done(1, memento_count=4, first_memento=100.0, fetched_at=200.0)
+    manifest.mark_done(2, memento_count=1, first_memento=50.0)
+    manifest.mark_failed(3)
+    manifest.close()
+
+    # Reopened, as by a resumed collection
+    manifest = TimemapManifest(str(tmp_path / 'manifest.sqlite'))
+    manifest.register(['https://a.com', 'https://b2.com', 'https://c.com'])
+    assert manifest.get_status(1) == 'done'
+    assert manifest.get_status(2) == 'pending'
+    assert manifest.get_status(3) == 'failed'
+    assert manifest.get_done() == [(1, 'https://a.com', 200.0, 4, 100.0)]
+    assert manifest.get_todo() == [(2, 'https://b2.com'), (3, 'https://c.com')]
+    assert manifest.get_todo(first_uri_number=3) == [(3, 'https://c.com')]
+    assert manifest.counts() == {'done': 1, 'pending': 1, 'failed': 1}
+
+def test_failed_uris_retried_up_to_max_retries(tmp_path):
+    manifest = TimemapManifest(str(tmp_path / 'manifest.sqlite'))
+    manifest.register(['https://a.com'])
+    for _ in range(3):
+        assert manifest.get_todo(max_retries=3) == [(1, 'https://a.com')]
+        manifest.mark_failed(1)
+    assert manifest.get_todo(max_retries=3) == []
+    manifest.close()
+
+def test_interrupted_collection_resumes(collector):
+    links = [f'https://example.com/{i}' for i in range(1, 6)]
+    write_links(links)
+    collector.failing.add(links[1])
+    collector.interrupt_at = links[3]
+    with pytest.raises(KeyboardInterrupt):
+        get_timemaps.save_timemaps()
+    assert collector.fetched == links[:3]
+
+    collector.fetched = []
+    collector.failing = set()
+    collector.interrupt_at = None
+    get_timemaps.save_timemaps()
+    # Only the failed URI and the ones never stored are collected again
+    assert collector.fetched == [links[1], links[3], links[4]]
+    manifest = TimemapManifest()
+    assert manifest.counts() == {'done': 5}
+    assert [row[3] for row in manifest.get_done()] == [2] * 5
+    manifest.close()
+
+    collector.fetched = []
+    get_timemaps.save_timemaps()
+    assert collector.fetched == []
+
+def test_stored_timemaps_adopted_only_for_their_link(collector):
+    links = ['https://a.com', 'https://b.com', 'https://c.com']
+    write_links(links)
+    # Timemaps collected before the manifest existed; uri2.json is the timemap of a link since replaced
+    os.makedirs('../timemaps')
+    store = get_timemap_store('../timemaps')
+    store.write(1, timemap('https://a.com', 3))
+    store.write(2, timemap('https://old.com', 3))
+
+    get_timemaps.save_timemaps()
+    assert collector.fetched == ['https://b.com', 'https://c.com']
+    assert stored_uri(2) == 'https://b.com'
+    manifest = TimemapManifest()
+    assert [(row[0], row[3]) for row in manifest.get_done()] == [(1, 3), (2, 2), (3, 2)]
+    manifest.close()
+
+def test_changed_link_collected_again(collector):
+    write_links(['https://a.com', 'https://b.com'])
+    get_timemaps.save_timemaps()
+    assert collector.fetched == ['https://a.com', 'https://b.com']
+
+    collector.fetched = []
+    write_links(['https://a.com', 'https://b2.com'])
+    get_timemaps.save_timemaps()
+    assert collector.fetched == ['https://b2.com']
+    assert stored_uri(2) == 'https://b2.com'
@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from timemap_store import (DirectoryTimemapStore, ShardedTimemapStore, get_timemap_store, migrate_timemaps,
+                           read_store_config)
+
+"""
+Round trips timemaps through the directory and sharded storage backends.
+"""
+
+def timemap(uri_number, n_mementos=3):
+    mementos = [{'datetime': f'20{10 + i}-01-01T00:00:00Z', 'uri': f'https://web.archive.org/web/{i}/x'}
+                for i in range(n_mementos)]
+    content = {'original_uri': f'https://example.com/{uri_number}', 'mementos': {'list': mementos}}
+    if mementos != []:
+        content['mementos']['first'] = mementos[0]
+        content['mementos']['last'] = mementos[-1]
+    return json.dumps(content, indent=2)
+
+@pytest.fixture
+def timemaps_folder(tmp_path):
+    folder = tmp_path / 'timemaps'
+    folder.mkdir()
+    store = DirectoryTimemapStore(str(folder))
+    for uri_number in range(1, 8):
+        store.write(uri_number, timemap(uri_number, n_mementos=uri_number % 4))
+    return str(folder)
+
+def test_migration_round_trip(timemaps_folder):
+    source = DirectoryTimemapStore(timemaps_folder)
+    expected = {uri_number: json.loads(source.read(uri_number)) for uri_number in source.uri_numbers()}
+    # Left empty by an interrupted collection: skipped, so it is collected again
+    open(os.path.join(timemaps_folder, 'uri9.json'), 'w').close()
+
+    # Small shards, so the timemaps span several of them
+    assert migrate_timemaps(timemaps_folder, remove=True, shard_max_bytes=300) == 7
+    assert read_store_config(timemaps_folder)['backend'] == ShardedTimemapStore.backend
+    assert sorted(os.listdir(timemaps_folder))[-1] == 'uri9.json'
+
+    store = get_timemap_store(timemaps_folder)
+    assert isinstance(store, ShardedTimemapStore)
+    assert len(store._shard_numbers()) > 1
+    assert store.uri_numbers() == sorted(expected)
+    assert {uri_number: json.loads(store.read(uri_number)) for uri_number in store.uri_numbers()} == expected
+    assert 9 not in store
+    with pytest.raises(KeyError):
+        store.read(9)
+
+    # Migrating again leaves the directory as it is
+    assert migrate_timemaps(timemaps_folder) == 0
+
+def test_read_summary_matches_directory_store(timemaps_folder):
+    source = DirectoryTimemapStore(timemaps_folder)
+    target = ShardedTimemapStore(timemaps_folder)
+    target.write_many((uri_number, source.read(uri_number)) for uri_number in source.uri_numbers())
+
+    for uri_number in source.uri_numbers():
+        source_mementos = []
+        target_mementos = []
+        assert target.read_summary(uri_number, target_mementos.append) == source.read_summary(uri_number, source_mementos.append)
+        assert target_mementos == source_mementos
+
+def test_last_write_wins_and_reopen(tmp_path):
+    store = ShardedTimemapStore(str(tmp_path))
+    store.write(1, timemap(1, 1))
+    store.write(2, timemap(2, 1))
+    store.write(1, timemap(1, 3))
+    assert store.read_summary(1)['memento_count'] == 3
+
+    other = ShardedTimemapStore(str(tmp_path))
+    assert other.uri_numbers() == [1, 2]
+    assert other.read_summary(1)['memento_count'] == 3
+    # A write by another instance is picked up on refresh
+    other.write(3, timemap(3, 2))
+    store.refresh()
+    assert store.uri_numbers() == [1, 2, 3]
+
+def test_recovers_from_truncated_last_member(tmp_path):
+    store = ShardedTimemapStore(str(tmp_path))
+    store.write_many([(1, timemap(1)), (2, timemap(2)), (3, timemap(3))])
+    shard_filename = store._shard_path(0, 'jsonl.gz')
+    # The shard lost the end of its last record, and the index has a torn row after it
+    os.truncate(shard_filename, os.path.getsize(shard_filename) - 5)
+    with open(store._shard_path(0, 'idx'), 'ab') as index_file:
+        index_file.write(b'\x01\x02\x03')
+
+    store = ShardedTimemapStore(str(tmp_path))
+    assert store.uri_numbers() == [1, 2]
+    assert json.loads(store.read(2)) == json.loads(timemap(2))
+
+    # The cut record does not shadow the records written after it
+    store.write_many([(4, timemap(4)), (5, timemap(5))])
+    store = ShardedTimemapStore(str(tmp_path))
+    assert store.uri_numbers() == [1, 2, 4, 5]
+    assert [json.loads(store.read(uri_number)) for uri_number in (4, 5)] == [json.loads(timemap(4)), json.loads(timemap(5))]
+    store.write(3, timemap(3))
+    assert json.loads(ShardedTimemapStore(str(tmp_path)).read(3)) == json.loads(timemap(3))
+
+def test_recovers_from_missing_index(tmp_path):
+    store = ShardedTimemapStore(str(tmp_path), shard_max_bytes=300)
+    store.write_many((uri_number, timemap(uri_number)) for uri_number in range(1, 5))
+    assert len(store._shard_numbers()) > 1
+    first_shard_uris = [uri_number for uri_number in store.uri_numbers() if store._find(uri_number)[5] == 0]
+    os.remove(store._shard_path(0, 'idx'))
+
+    # The timemaps of the shard without an index count as not collected; the others are still readable
+    store = ShardedTimemapStore(str(tmp_path), shard_max_bytes=300)
+    assert store.uri_numbers() == [uri_number for uri_number in range(1, 5) if uri_number not in first_shard_uris]
+    for uri_number in first_shard_uris:
+        assert uri_number not in store
+    store.write_many((uri_number, timemap(uri_number, 1)) for uri_number in first_shard_uris)
+    store = ShardedTimemapStore(str(tmp_path), shard_max_bytes=300)
+    assert store.uri_numbers() == [1, 2, 3, 4]
+    for uri_number in first_shard_uris:
+        assert store.read_summary(uri_number)['memento_count'] == 1
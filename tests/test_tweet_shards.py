@@ -0,0 +1,166 @@
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tweet_id_set import TweetIDSet, get_tweet_id_set
+from tweet_shard_index import (NO_ID, TweetShardIndex, TweetShardWriter, _iter_lines, get_index_path,
+                               get_tweet_shard_index, read_members)
+
+"""
+Writes, appends to and indexes small scraped_tweets shards.
+"""
+
+def tweet_line(tweet_id, has_urls=False):
+    urls = [{'expanded_url': f'https://example.com/{tweet_id}'}] if has_urls else []
+    return json.dumps({'id_str': str(tweet_id), 'entities': {'urls': urls}}) + '\n'
+
+def write_shard(path, tweet_ids, checkpoint_lines=3, append=False):
+    with TweetShardWriter(str(path), append=append, checkpoint_lines=checkpoint_lines) as writer:
+        for tweet_id in tweet_ids:
+            writer.write(tweet_line(tweet_id, tweet_id % 2 == 1))
+    return writer.index
+
+def read_ids(path):
+    with gzip.open(path, 'rt') as file:
+        return [int(json.loads(line)['id_str']) for line in file]
+
+def test_writer_indexes_lines_and_checkpoints(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    index = write_shard(shard, range(7))
+
+    assert read_ids(shard) == list(range(7))
+    assert not os.path.exists(str(shard) + '.tmp')
+    assert index.ids.tolist() == list(range(7))
+    assert index.url_lines().tolist() == [1, 3, 5]
+    # One gzip member, and so one checkpoint, every 3 lines
+    assert index.checkpoint_lines.tolist() == [0, 3, 6]
+    assert [line_number for line_number, _ in index.read_lines([2, 4, 6])] == [2, 4, 6]
+
+    loaded = TweetShardIndex.load(str(shard))
+    assert loaded.is_current()
+    assert loaded.ids.tolist() == index.ids.tolist()
+    assert loaded.checkpoint_offsets.tolist() == index.checkpoint_offsets.tolist()
+
+def test_aborted_new_shard_leaves_nothing(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    with pytest.raises(RuntimeError):
+        with TweetShardWriter(str(shard)) as writer:
+            writer.write(tweet_line(1))
+            raise RuntimeError
+    assert os.listdir(tmp_path) == []
+
+def test_append_is_in_place_and_abort_restores_shard(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    write_shard(shard, range(5))
+    with open(shard, 'rb') as file:
+        content = file.read()
+
+    index = write_shard(shard, range(5, 8), append=True)
+    assert read_ids(shard) == list(range(8))
+    assert not os.path.exists(str(shard) + '.tmp')
+    # The shard was extended, not rewritten
+    with open(shard, 'rb') as file:
+        assert file.read(len(content)) == content
+    assert index.checkpoint_lines.tolist() == [0, 3, 5]
+
+    size = os.path.getsize(shard)
+    with pytest.raises(RuntimeError):
+        with TweetShardWriter(str(shard), append=True, checkpoint_lines=3) as writer:
+            for tweet_id in range(8, 12):
+                writer.write(tweet_line(tweet_id))
+            raise RuntimeError
+    assert os.path.getsize(shard) == size
+    assert get_tweet_shard_index(str(shard)).ids.tolist() == list(range(8))
+
+def test_append_cuts_torn_tail(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    write_shard(shard, range(4))
+    # A writer killed while appending leaves part of a member after the indexed content
+    member = gzip.compress(tweet_line(100).encode())
+    with open(shard, 'ab') as file:
+        file.write(member[:len(member) // 2])
+    with pytest.raises(EOFError):
+        TweetShardIndex.load(str(shard)).update()
+
+    index = write_shard(shard, [4], append=True)
+    assert read_ids(shard) == list(range(5))
+    assert index.ids.tolist() == list(range(5))
+
+def test_index_update_reads_only_appended_members(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    index = write_shard(shard, range(4))
+    # Members appended by another writer, with zero padding before them as some tools leave
+    with open(shard, 'ab') as file:
+        file.write(b'\x00' * 4 + gzip.compress((tweet_line(4) + tweet_line(5)).encode()))
+    checkpoints = index.checkpoint_offsets.tolist()
+
+    index = TweetShardIndex.load(str(shard))
+    assert not index.is_current()
+    assert index.update()
+    assert index.ids.tolist() == list(range(6))
+    assert index.checkpoint_offsets.tolist()[:len(checkpoints)] == checkpoints
+    assert index.checkpoint_lines.tolist() == [0, 3, 4]
+    assert [line for _, line in index.read_lines([5])] == [tweet_line(5).encode()]
+    assert not index.update()
+
+def test_index_rebuilt_when_shard_rewritten(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    write_shard(shard, range(4))
+    with gzip.open(shard, 'wt') as file:
+        file.write(tweet_line(10) + 'not a tweet\n')
+    index = get_tweet_shard_index(str(shard))
+    assert index.ids.tolist() == [10, NO_ID]
+    assert index.unique_tweet_count() == 1
+    assert os.path.exists(get_index_path(str(shard)))
+
+def test_iter_lines_marks_line_aligned_members(tmp_path):
+    path = tmp_path / 'lines.gz'
+    # The second member starts mid-line, so only the first and third are checkpoints
+    members = [gzip.compress(b'a\nb'), gzip.compress(b'c\n'), b'\x00\x00', gzip.compress(b'd\n')]
+    with open(path, 'wb') as file:
+        file.write(b''.join(members))
+    with open(path, 'rb') as file:
+        lines = list(_iter_lines(file, 0))
+    third = len(members[0]) + len(members[1]) + 2
+    assert lines == [(0, b'a\n'), (None, b'bc\n'), (third, b'd\n')]
+
+def test_read_members(tmp_path):
+    members = [gzip.compress(b'a\n'), gzip.compress(b'b\nc\n')]
+    data = members[0] + b'\x00' + members[1]
+    assert read_members(data) == [(0, len(members[0]), b'a\n'), (len(members[0]) + 1, len(members[1]), b'b\nc\n')]
+    with pytest.raises(EOFError):
+        read_members(data[:-3])
+
+def test_id_set_dedups_across_shards(tmp_path):
+    write_shard(tmp_path / 'scraped_tweets1.json.gz', [5, 3, 1, 3])
+    write_shard(tmp_path / 'scraped_tweets2.json.gz', [2, 5, 8])
+
+    id_set = get_tweet_id_set(str(tmp_path))
+    assert id_set.ids.tolist() == [1, 2, 3, 5, 8]
+    assert id_set.contains_many([8, 4, 1, 100]).tolist() == [True, False, True, False]
+    id_set.add(np.array([4, 8, NO_ID]))
+    assert id_set.ids.tolist() == [1, 2, 3, 4, 5, 8]
+
+    loaded = TweetIDSet.load(str(tmp_path))
+    assert loaded.is_current()
+    assert loaded.ids.tolist() == [1, 2, 3, 5, 8]
+
+def test_id_set_rebuilt_when_shard_sizes_change(tmp_path):
+    shard = tmp_path / 'scraped_tweets1.json.gz'
+    write_shard(shard, [1, 2])
+    get_tweet_id_set(str(tmp_path))
+
+    write_shard(shard, [3], append=True)
+    assert not TweetIDSet.load(str(tmp_path)).is_current()
+    assert get_tweet_id_set(str(tmp_path)).ids.tolist() == [1, 2, 3]
+
+    write_shard(tmp_path / 'scraped_tweets2.json.gz', [9])
+    id_set = get_tweet_id_set(str(tmp_path))
+    assert id_set.ids.tolist() == [1, 2, 3, 9]
+    assert sorted(id_set.shard_sizes) == ['scraped_tweets1.json.gz', 'scraped_tweets2.json.gz']
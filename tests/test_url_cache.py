@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from url_cache import URLResolutionCache
+
+"""
+Resolves URIs through the URL resolution cache from several threads.
+"""
+
+class CountingResolver:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, link):
+        with self._lock:
+            self.calls.append(link)
+        time.sleep(self.delay)
+        return link + '/final', 200
+
+def test_concurrent_resolutions_share_one_fetch(tmp_path):
+    cache = URLResolutionCache(str(tmp_path / 'url_cache.sqlite'))
+    resolver = CountingResolver(delay=0.1)
+    barrier = threading.Barrier(16)
+
+    def resolve(link):
+        barrier.wait()
+        return cache.resolve(link, resolver)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(resolve, ['https://t.co/a'] * 8 + ['https://t.co/b'] * 8))
+    assert results == [('https://t.co/a/final', 200)] * 8 + [('https://t.co/b/final', 200)] * 8
+    assert sorted(resolver.calls) == ['https://t.co/a', 'https://t.co/b']
+    assert cache.stats['stored'] == 2
+    cache.close()
+
+class LateLookupCache(URLResolutionCache):
+    """
+    Holds the first cache lookup of the thread named 'late' until the resolution it missed has finished.
+    """
+    def __init__(self, path, resolved):
+        super().__init__(path)
+        self.resolved = resolved
+        self.held = False
+
+    def get_many(self, links, count_stats=True):
+        found = super().get_many(links, count_stats)
+        if threading.current_thread().name == 'late' and not self.held:
+            self.held = True
+            self.resolved.wait()
+        return found
+
+def test_resolution_finished_after_lookup_is_not_fetched_again(tmp_path):
+    resolved = threading.Event()
+    cache = LateLookupCache(str(tmp_path / 'url_cache.sqlite'), resolved)
+    resolver = CountingResolver()
+    results = []
+
+    # The late thread misses the cache, then the resolution completes before it registers as the owner
+    late = threading.Thread(target=lambda: results.append(cache.resolve('https://t.co/a', resolver)), name='late')
+    late.start()
+    while not cache.held:
+        time.sleep(0.01)
+    assert cache.resolve('https://t.co/a', resolver) == ('https://t.co/a/final', 200)
+    resolved.set()
+    late.join()
+
+    assert results == [('https://t.co/a/final', 200)]
+    assert resolver.calls == ['https://t.co/a']
+    cache.close()
+
+def test_negative_results_expire_sooner(tmp_path):
+    cache = URLResolutionCache(str(tmp_path / 'url_cache.sqlite'), ttl=60, negative_ttl=0)
+    cache.put('https://t.co/ok', 'https://example.com/', 200)
+    cache.put('https://t.co/gone', 'https://t.co/gone', 404)
+    time.sleep(0.01)
+    assert cache.get_many(['https://t.co/ok', 'https://t.co/gone']) == {'https://t.co/ok': ('https://example.com/', 200)}
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+    cache.close()